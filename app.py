@@ -1,11 +1,485 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Query
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.background import BackgroundTask
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing as mp
 import os
+import shutil
 import tempfile
-from bilingual_book_formatter import BilingualBookFormatter
+import threading
+import time
+import uuid
+import zipfile
+from typing import List, Optional
+import bilingual_book_formatter
+from bilingual_book_formatter import (OUTPUT_FORMATS, SUPPORTED_INPUTS, BilingualBookFormatter, DiskCache,
+                                      init_worker_formatter, process_books_in_worker, warm_up_worker)
 
 app = FastAPI(title="Bilingual Book Formatter API", version="2.3")
 
-formatter = BilingualBookFormatter()
+# معالج العملية الرئيسية (لرفع Drive فقط)؛ يُنشأ عند أول استخدام حتى لا يتأخر بدء الخادم
+formatter = None
+formatter_lock = threading.Lock()
+
+# مجمع العمليات الذي ينفذ التحويلات بعيداً عن حلقة الأحداث؛ لكل عملية معالجها الخاص
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "0")) or os.cpu_count() or 1
+# التوازي الداخلي لكل تحويل (1 = التوازي على مستوى المهام فقط)
+WORKER_INNER_PROCESSES = int(os.getenv("WORKER_INNER_PROCESSES", "1"))
+CONFIG_PATH = os.getenv("CONFIG_PATH", "config.json")
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+executor = None
+executor_lock = threading.Lock()
+
+jobs = {}
+jobs_lock = threading.Lock()
+# خيوط إنهاء المهام: تفريغ التقدم وتخزين النتيجة خارج خيط إدارة مجمع العمليات
+finish_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="job-finish")
+
+# مقاييس Prometheus؛ أزمنة مراحل التحويل تُقاس في العمليات العاملة وتُعاد مع النتيجة
+STAGE_SECONDS = Histogram(
+    "bilingual_stage_seconds", "Time spent in each conversion stage", ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+)
+INPUT_BYTES = Histogram(
+    "bilingual_input_bytes", "Size of uploaded input documents",
+    buckets=tuple(1024 * 4 ** power for power in range(11))
+)
+QUEUE_DEPTH = Histogram(
+    "bilingual_queue_depth", "Conversions waiting for a free worker when a new one is submitted",
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+CONVERSIONS = Counter("bilingual_conversions_total", "Finished conversions", ["status"])
+CACHE_REQUESTS = Counter("bilingual_cache_requests_total", "Cache lookups by cache and result", ["cache", "result"])
+WORKERS = Gauge("bilingual_workers", "Worker processes in the conversion pool")
+WORKERS_BUSY = Gauge("bilingual_workers_busy", "Worker processes currently converting")
+WORKER_BUSY_SECONDS = Counter("bilingual_worker_busy_seconds_total", "Time workers spent converting")
+WORKERS.set(JOB_WORKERS)
+in_flight = 0
+in_flight_lock = threading.Lock()
+
+# مدير طوابير التقدم بين العمليات العاملة والخادم، يُنشأ عند أول مهمة
+progress_manager = None
+progress_manager_lock = threading.Lock()
+PROGRESS_POLL_SECONDS = float(os.getenv("PROGRESS_POLL_SECONDS", "0.25"))
+
+ALLOWED_EXTENSIONS = SUPPORTED_INPUTS
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "100"))
+
+# حدود الرفع: تُكتب الملفات على القرص بكتل ثابتة الحجم فتبقى الذاكرة ثابتة مهما كبر الملف
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "500")) * 1024 * 1024
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_MB", "800")) * 1024 * 1024
+
+# ذاكرة مؤقتة للنتائج مفهرسة بمحتوى المدخلات والخيارات وإصدار الكود
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE", "1") != "0"
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "~/.cache/bilingual_book_formatter/results")
+RESULT_CACHE_BYTES = int(os.getenv("RESULT_CACHE_MB", "2048")) * 1024 * 1024
+result_cache = None
+result_cache_lock = threading.Lock()
+
+def compute_code_version() -> str:
+    """بصمة الكود والإعدادات؛ أي تغيير فيهما يبطل النتائج المخزنة"""
+    digest = hashlib.sha256(app.version.encode("utf-8"))
+    for path in (bilingual_book_formatter.__file__, CONFIG_PATH):
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+CODE_VERSION = compute_code_version()
+
+class RequestSizeLimitMiddleware:
+    """فرض حد حجم الطلب أثناء استقبال جسمه
+
+    الطلبات ذات Content-Length الكبير تُرفض قبل قراءة أي بايت، والطلبات المجزأة
+    (chunked) تُعد بايتاتها أثناء وصولها فتُرفض بـ 413 فور تجاوز الحد،
+    قبل أن يكمل Starlette تحليل الجسم وتخزينه على القرص.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length", b"").decode("latin-1")
+        if content_length.isdigit() and int(content_length) > MAX_REQUEST_BYTES:
+            response = JSONResponse(status_code=413, content={"detail": "Request too large"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_REQUEST_BYTES:
+                    # HTTPException تمر عبر تحليل النموذج في FastAPI وتتحول إلى رد 413
+                    raise HTTPException(status_code=413, detail="Request too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(RequestSizeLimitMiddleware)
+
+def verify_api_key(api_key: str):
+    if api_key != os.getenv("API_KEY", "SECRET_API_KEY"):
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
+def validate_request(lang1_file: UploadFile, lang2_file: UploadFile, output_format: str):
+    # تصدير PDF غير مدعوم بعد؛ رفضه مبكراً أفضل من تحويل لا ينتج ملفاً
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid output format")
+
+    if not (lang1_file.filename.lower().endswith(ALLOWED_EXTENSIONS) and
+            lang2_file.filename.lower().endswith(ALLOWED_EXTENSIONS)):
+        raise HTTPException(status_code=400, detail="Invalid file type")
+
+async def save_uploads(uploads: dict, directory: str) -> tuple:
+    """حفظ الملفات المرفوعة على القرص بكتل مع فرض حد لكل ملف وحد للطلب كاملاً
+
+    uploads: {الاسم: UploadFile}، وتُعاد المسارات وبصمات SHA-256 بالأسماء نفسها.
+    """
+    paths = {}
+    digests = {}
+    request_bytes = 0
+    started = time.perf_counter()
+    for name, upload in uploads.items():
+        path = os.path.join(directory, name + os.path.splitext(upload.filename)[1].lower())
+        file_bytes = 0
+        digest = hashlib.sha256()
+        with open(path, "wb") as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                file_bytes += len(chunk)
+                request_bytes += len(chunk)
+                if file_bytes > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"File too large: {upload.filename}")
+                if request_bytes > MAX_REQUEST_BYTES:
+                    raise HTTPException(status_code=413, detail="Request too large")
+                f.write(chunk)
+                digest.update(chunk)
+        paths[name] = path
+        digests[name] = digest.hexdigest()
+        INPUT_BYTES.observe(file_bytes)
+    STAGE_SECONDS.labels("receive").observe(time.perf_counter() - started)
+    return paths, digests
+
+def get_result_cache() -> Optional[DiskCache]:
+    global result_cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    with result_cache_lock:
+        if result_cache is None:
+            result_cache = DiskCache(RESULT_CACHE_DIR, RESULT_CACHE_BYTES)
+        return result_cache
+
+def result_cache_key(paths: dict, digests: dict, output_format: str) -> str:
+    """مفتاح النتيجة: بصمتا المدخلين (مع نوعيهما) والخيارات الموحدة وإصدار الكود"""
+    options = {"output_format": output_format.lower()}
+    key = {
+        "inputs": [[digests[name], os.path.splitext(paths[name])[1]] for name in ("lang1", "lang2")],
+        "options": options,
+        "code_version": CODE_VERSION,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+def fetch_cached_result(key: str, output_format: str, output_path: str) -> bool:
+    """نسخ النتيجة المخزنة إلى مساحة العمل إن وجدت"""
+    cache = get_result_cache()
+    if cache is None:
+        return False
+    cached_path = cache.get(key, f".{output_format}")
+    CACHE_REQUESTS.labels("result", "miss" if cached_path is None else "hit").inc()
+    if cached_path is None:
+        return False
+    try:
+        try:
+            os.link(cached_path, output_path)
+        except OSError:
+            shutil.copyfile(cached_path, output_path)
+    except OSError:
+        # قد تُحذف النتيجة بين البحث والنسخ بسبب الإزالة من عملية أخرى
+        return False
+    return True
+
+def store_result(key: str, output_format: str, output_path: str):
+    cache = get_result_cache()
+    if cache is None:
+        return
+    try:
+        cache.put(key, output_path, f".{output_format}")
+        cache.evict()
+    except OSError as e:
+        logging.error(f"خطأ في تخزين النتيجة مؤقتاً: {e}")
+
+class ZipChunkWriter:
+    """كائن كتابة غير قابل للتنقل يجمع أجزاء الأرشيف حتى تُرسل فوراً
+
+    zipfile يكتب عندها واصفات البيانات بعد كل ملف بدل الرجوع لتعديل الترويسات.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+def parse_batch_items(files: List[UploadFile], manifest: Optional[str], output_format: str) -> list:
+    """تحويل الملفات المرفوعة إلى قائمة أزواج التحويل
+
+    بدون manifest تُقرن الملفات بالترتيب (الأول مع الثاني، الثالث مع الرابع...).
+    manifest قائمة JSON بعناصر {"lang1": اسم ملف, "lang2": اسم ملف, "name"?, "output_format"?}.
+    """
+    if manifest:
+        by_name = {upload.filename: upload for upload in files}
+        if len(by_name) != len(files):
+            raise HTTPException(status_code=400, detail="Duplicate file names in batch")
+        try:
+            entries = json.loads(manifest)
+            items = [{
+                "name": entry.get("name") or os.path.splitext(entry["lang1"])[0],
+                "lang1": by_name[entry["lang1"]],
+                "lang2": by_name[entry["lang2"]],
+                "output_format": entry.get("output_format", output_format),
+            } for entry in entries]
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid manifest: {e}")
+    else:
+        if len(files) % 2:
+            raise HTTPException(status_code=400, detail="Batch files must come in pairs")
+        items = [{
+            "name": os.path.splitext(files[i].filename)[0],
+            "lang1": files[i],
+            "lang2": files[i + 1],
+            "output_format": output_format,
+        } for i in range(0, len(files), 2)]
+
+    if not items or len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch must contain 1-{MAX_BATCH_ITEMS} pairs")
+    names = set()
+    for index, item in enumerate(items):
+        validate_request(item["lang1"], item["lang2"], item["output_format"])
+        # أسماء فريدة وآمنة داخل الأرشيف
+        name = os.path.basename(str(item["name"])) or f"item_{index + 1}"
+        if name in names:
+            name = f"{name}_{index + 1}"
+        names.add(name)
+        item["name"] = name
+    return items
+
+def stream_batch_archive(items: list, workspace: str):
+    """إنتاج أرشيف ZIP تدريجياً: يُضاف كل ناتج فور اكتمال تحويله
+
+    الأخطاء لكل عنصر تُسجل في report.json دون إيقاف بقية الدفعة.
+    """
+    writer = ZipChunkWriter()
+    futures = {}
+    try:
+        for item in items:
+            if fetch_cached_result(item["cache_key"], item["output_format"], item["output_path"]):
+                future = Future()
+                future.set_result(None)
+            else:
+                future = submit_conversion(item["lang1"], item["lang2"], item["output_base"],
+                                           (item["output_format"],))
+            futures[future] = item
+
+        report = []
+        with zipfile.ZipFile(writer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for future in as_completed(futures):
+                item = futures[future]
+                entry = {"name": item["name"], "output_format": item["output_format"]}
+                error = future.exception()
+                if error is None and not os.path.exists(item["output_path"]):
+                    error = "Output file not generated"
+                if error is not None:
+                    entry.update(status="failed", error=str(error))
+                    report.append(entry)
+                    continue
+
+                store_result(item["cache_key"], item["output_format"], item["output_path"])
+                entry.update(status="completed", file=f"{item['name']}.{item['output_format']}")
+                report.append(entry)
+                with archive.open(entry["file"], "w") as target, open(item["output_path"], "rb") as source:
+                    while True:
+                        chunk = source.read(UPLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        yield from writer.drain()
+                yield from writer.drain()
+
+            archive.writestr("report.json", json.dumps(report, ensure_ascii=False, indent=2))
+        yield from writer.drain()
+    finally:
+        for future in futures:
+            future.cancel()
+        shutil.rmtree(workspace, ignore_errors=True)
+
+def get_formatter() -> BilingualBookFormatter:
+    global formatter
+    with formatter_lock:
+        if formatter is None:
+            formatter = BilingualBookFormatter(CONFIG_PATH)
+        return formatter
+
+def get_executor() -> ProcessPoolExecutor:
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ProcessPoolExecutor(
+                max_workers=JOB_WORKERS,
+                mp_context=mp.get_context("spawn"),
+                initializer=init_worker_formatter,
+                initargs=(CONFIG_PATH, WORKER_INNER_PROCESSES)
+            )
+        return executor
+
+def submit_conversion(*args):
+    """إرسال تحويل إلى مجمع العمليات، مع إعادة إنشاء المجمع إذا تعطلت إحدى عملياته"""
+    global executor, in_flight
+    pool = get_executor()
+    try:
+        future = pool.submit(process_books_in_worker, *args)
+    except BrokenProcessPool:
+        # إيقاف المجمع المعطل لتحرير موارده، ما لم يكن طلب آخر قد استبدله بالفعل
+        with executor_lock:
+            if executor is pool:
+                executor = None
+        pool.shutdown(wait=False)
+        future = get_executor().submit(process_books_in_worker, *args)
+
+    with in_flight_lock:
+        QUEUE_DEPTH.observe(max(0, in_flight - JOB_WORKERS))
+        in_flight += 1
+        WORKERS_BUSY.set(min(in_flight, JOB_WORKERS))
+    future.add_done_callback(record_conversion)
+    return future
+
+def record_conversion(future):
+    """تسجيل مقاييس التحويل المنتهي من الإحصائيات التي أعادتها العملية العاملة"""
+    global in_flight
+    with in_flight_lock:
+        in_flight -= 1
+        WORKERS_BUSY.set(min(in_flight, JOB_WORKERS))
+    if future.cancelled() or future.exception() is not None:
+        CONVERSIONS.labels("failed").inc()
+        return
+
+    CONVERSIONS.labels("completed").inc()
+    stats = future.result() or {}
+    WORKER_BUSY_SECONDS.inc(stats.get("busy_seconds", 0))
+    for stage, seconds in stats.get("stages", {}).items():
+        STAGE_SECONDS.labels(stage).observe(seconds)
+    for name, count in stats.get("cache", {}).items():
+        # أسماء العدادات بصيغة image_hits / memory_misses
+        cache, result = name.split("_")
+        if count:
+            CACHE_REQUESTS.labels(cache, "hit" if result == "hits" else "miss").inc(count)
+
+def get_progress_manager():
+    global progress_manager
+    with progress_manager_lock:
+        if progress_manager is None:
+            progress_manager = mp.get_context("spawn").Manager()
+        return progress_manager
+
+def drain_progress(job: dict):
+    """نقل أحداث التقدم المتراكمة من طابور المهمة وحفظ آخرها"""
+    with job["progress_lock"]:
+        progress_queue = job.get("progress_queue")
+        if progress_queue is None:
+            return
+        try:
+            while not progress_queue.empty():
+                job["progress"] = progress_queue.get_nowait()
+        except Exception:
+            # الطابور يُغلق عند إيقاف الخادم
+            job["progress_queue"] = None
+
+def finish_job(job_id: str, future):
+    """تحديث حالة المهمة عند انتهاء تنفيذها في العملية العاملة
+
+    تُستدعى في خيط إدارة مجمع العمليات، لذا تكتفي بتسجيل الحالة. تفريغ التقدم
+    (اتصال مع Manager) وتخزين النتيجة (نسخ الملف ومسح مجلد الذاكرة المؤقتة)
+    يجريان في finish_executor حتى لا يتأخر المجمع في تسليم النتائج الأخرى.
+    """
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return
+    error = future.exception()
+    output_path = os.path.join(job["workspace"], f"bilingual_output.{job['output_format']}")
+    completed = error is None and os.path.exists(output_path)
+    with jobs_lock:
+        job["finished_at"] = time.time()
+        if error is not None:
+            job.update(status="failed", error=str(error))
+        elif not completed:
+            job.update(status="failed", error="Output file not generated")
+        else:
+            job.update(status="completed", output_path=output_path)
+    finish_executor.submit(finalize_job, job, completed)
+
+def finalize_job(job: dict, completed: bool):
+    """تفريغ آخر أحداث التقدم وتخزين نتيجة المهمة المكتملة في الذاكرة المؤقتة"""
+    drain_progress(job)
+    with job["progress_lock"]:
+        job["progress_queue"] = None
+    if completed:
+        store_result(job["cache_key"], job["output_format"], job["output_path"])
+
+def purge_expired_jobs():
+    """حذف المهام المنتهية الأقدم من JOB_TTL_SECONDS مع ملفاتها"""
+    now = time.time()
+    with jobs_lock:
+        expired = [job_id for job_id, job in jobs.items()
+                   if job.get("finished_at") and now - job["finished_at"] > JOB_TTL_SECONDS]
+        for job_id in expired:
+            shutil.rmtree(jobs.pop(job_id)["workspace"], ignore_errors=True)
+
+def job_status(job: dict) -> dict:
+    status = {key: job.get(key) for key in
+              ("id", "status", "output_format", "created_at", "finished_at", "error", "progress")}
+    if status["status"] == "queued" and job["future"] is not None and job["future"].running():
+        status["status"] = "running"
+    return status
+
+@app.on_event("startup")
+async def start_workers():
+    # تشغيل العمليات العاملة وتهيئة معالجاتها في الخلفية دون تأخير جاهزية الخادم
+    pool = get_executor()
+    for _ in range(JOB_WORKERS):
+        pool.submit(warm_up_worker, 0.2)
+
+@app.on_event("shutdown")
+async def stop_workers():
+    if executor is not None:
+        executor.shutdown(wait=False)
+    if progress_manager is not None:
+        progress_manager.shutdown()
 
 @app.post("/process/", summary="Process two documents into a bilingual format")
 async def process_books(
@@ -14,50 +488,194 @@ async def process_books(
     output_format: str = Form("docx"),
     api_key: str = Form(...)
 ):
-    if api_key != os.getenv("API_KEY", "SECRET_API_KEY"):
-        raise HTTPException(status_code=401, detail="Invalid API key")
-    
-    if output_format not in ["docx", "pdf", "epub"]:
-        raise HTTPException(status_code=400, detail="Invalid output format")
-    
-    allowed_extensions = ['.docx', '.pdf', '.md']
-    if not (lang1_file.filename.lower().endswith(tuple(allowed_extensions)) and
-            lang2_file.filename.lower().endswith(tuple(allowed_extensions))):
-        raise HTTPException(status_code=400, detail="Invalid file type")
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(lang1_file.filename)[1]) as tmp1,          tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(lang2_file.filename)[1]) as tmp2:
-        tmp1.write(await lang1_file.read())
-        tmp2.write(await lang2_file.read())
-        lang1_path, lang2_path = tmp1.name, tmp2.name
-    
-    try:
-        output_base = os.path.join(tempfile.gettempdir(), "bilingual_output")
-        formatter.process_books(lang1_path, lang2_path, output_base)
+    verify_api_key(api_key)
+    validate_request(lang1_file, lang2_file, output_format)
+
+    # مساحة عمل مستقلة لكل طلب حتى لا تتداخل ملفات الطلبات المتزامنة
+    workspace = tempfile.mkdtemp(prefix="bilingual_request_")
+    try:
+        paths, digests = await save_uploads({"lang1": lang1_file, "lang2": lang2_file}, workspace)
+        cache_key = result_cache_key(paths, digests, output_format)
+        output_base = os.path.join(workspace, "bilingual_output")
         final_output_path = f"{output_base}.{output_format}"
-        
-        if not os.path.exists(final_output_path):
-            raise HTTPException(status_code=500, detail="Output file not generated")
-        
-        return FileResponse(final_output_path, filename=f"bilingual_output.{output_format}")
-    finally:
-        for path in [lang1_path, lang2_path]:
-            try:
-                if os.path.exists(path):
-                    os.remove(path)
-            except:
-                pass
+        loop = asyncio.get_running_loop()
+
+        if not await loop.run_in_executor(None, fetch_cached_result, cache_key, output_format, final_output_path):
+            # التحويل ثقيل على المعالج، لذا يُنفذ في مجمع العمليات حتى لا تتوقف حلقة الأحداث
+            await asyncio.wrap_future(
+                submit_conversion(paths["lang1"], paths["lang2"], output_base, (output_format,)))
+
+            if not os.path.exists(final_output_path):
+                raise HTTPException(status_code=500, detail="Output file not generated")
+            await loop.run_in_executor(None, store_result, cache_key, output_format, final_output_path)
+    except BaseException:
+        shutil.rmtree(workspace, ignore_errors=True)
+        raise
+
+    # حذف مساحة العمل (المدخلات والمخرجات) بعد إرسال الاستجابة
+    return FileResponse(final_output_path, filename=f"bilingual_output.{output_format}",
+                        background=BackgroundTask(shutil.rmtree, workspace, ignore_errors=True))
+
+@app.post("/jobs/", status_code=202, summary="Queue a conversion job")
+async def submit_job(
+    lang1_file: UploadFile = File(...),
+    lang2_file: UploadFile = File(...),
+    output_format: str = Form("docx"),
+    api_key: str = Form(...)
+):
+    verify_api_key(api_key)
+    validate_request(lang1_file, lang2_file, output_format)
+    purge_expired_jobs()
+
+    job_id = uuid.uuid4().hex
+    workspace = tempfile.mkdtemp(prefix=f"bilingual_job_{job_id}_")
+    try:
+        paths, digests = await save_uploads({"lang1": lang1_file, "lang2": lang2_file}, workspace)
+    except Exception:
+        shutil.rmtree(workspace, ignore_errors=True)
+        raise
+
+    cache_key = result_cache_key(paths, digests, output_format)
+    output_base = os.path.join(workspace, "bilingual_output")
+    output_path = f"{output_base}.{output_format}"
+    job = {
+        "id": job_id,
+        "status": "queued",
+        "output_format": output_format,
+        "created_at": time.time(),
+        "workspace": workspace,
+        "cache_key": cache_key,
+        "future": None,
+        "progress": None,
+        "progress_queue": None,
+        "progress_lock": threading.Lock(),
+    }
+    loop = asyncio.get_running_loop()
+    if await loop.run_in_executor(None, fetch_cached_result, cache_key, output_format, output_path):
+        # النتيجة مخزنة مسبقاً: المهمة مكتملة دون تشغيل التحويل
+        job.update(status="completed", output_path=output_path, finished_at=time.time())
+        with jobs_lock:
+            jobs[job_id] = job
+        return {"job_id": job_id, "status": "completed"}
+
+    job["progress_queue"] = await loop.run_in_executor(None, lambda: get_progress_manager().Queue())
+    with jobs_lock:
+        job["future"] = submit_conversion(paths["lang1"], paths["lang2"], output_base, (output_format,),
+                                          job["progress_queue"])
+        jobs[job_id] = job
+    job["future"].add_done_callback(lambda done: finish_job(job_id, done))
+
+    return {"job_id": job_id, "status": "queued"}
+
+@app.post("/batch/", summary="Convert many document pairs into a streamed ZIP archive")
+async def process_batch(
+    files: List[UploadFile] = File(...),
+    manifest: Optional[str] = Form(None),
+    output_format: str = Form("docx"),
+    api_key: str = Form(...)
+):
+    verify_api_key(api_key)
+    items = parse_batch_items(files, manifest, output_format)
+
+    workspace = tempfile.mkdtemp(prefix="bilingual_batch_")
+    # كل ملف يُحفظ مرة واحدة حتى لو ورد في أكثر من زوج داخل manifest
+    upload_names = {}
+    for item in items:
+        for key in ("lang1", "lang2"):
+            upload_names.setdefault(id(item[key]), (f"file{len(upload_names)}", item[key]))
+    try:
+        paths, digests = await save_uploads(dict(upload_names.values()), workspace)
+    except BaseException:
+        shutil.rmtree(workspace, ignore_errors=True)
+        raise
+
+    for index, item in enumerate(items):
+        names = {key: upload_names[id(item[key])][0] for key in ("lang1", "lang2")}
+        item_paths = {key: paths[name] for key, name in names.items()}
+        item_digests = {key: digests[name] for key, name in names.items()}
+        item.update(
+            lang1=item_paths["lang1"],
+            lang2=item_paths["lang2"],
+            cache_key=result_cache_key(item_paths, item_digests, item["output_format"]),
+            output_base=os.path.join(workspace, f"item{index}_output"),
+        )
+        item["output_path"] = f"{item['output_base']}.{item['output_format']}"
+
+    # المولد متزامن فيُنفذ في مجمع خيوط Starlette دون حجز حلقة الأحداث
+    return StreamingResponse(stream_batch_archive(items, workspace), media_type="application/zip",
+                             headers={"Content-Disposition": 'attachment; filename="bilingual_batch.zip"'})
+
+@app.get("/jobs/{job_id}", summary="Get conversion job status")
+async def get_job(job_id: str, api_key: str = Query(...)):
+    verify_api_key(api_key)
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+    # قراءة طابور التقدم اتصال بين العمليات، فتُنفذ خارج حلقة الأحداث
+    await asyncio.get_running_loop().run_in_executor(None, drain_progress, job)
+    with jobs_lock:
+        return job_status(job)
+
+@app.get("/jobs/{job_id}/events", summary="Stream conversion job progress (Server-Sent Events)")
+async def get_job_events(job_id: str, api_key: str = Query(...)):
+    verify_api_key(api_key)
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        last_status = None
+        while True:
+            await loop.run_in_executor(None, drain_progress, job)
+            with jobs_lock:
+                status = job_status(job)
+            if status != last_status:
+                yield f"data: {json.dumps(status, ensure_ascii=False)}\n\n"
+                last_status = status
+            if status["status"] in ("completed", "failed"):
+                break
+            await asyncio.sleep(PROGRESS_POLL_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/jobs/{job_id}/result", summary="Download conversion job result")
+async def get_job_result(job_id: str, api_key: str = Query(...)):
+    verify_api_key(api_key)
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job["status"] == "failed":
+            raise HTTPException(status_code=500, detail=job.get("error") or "Job failed")
+        if job["status"] != "completed":
+            raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+        output_path = job["output_path"]
+        output_format = job["output_format"]
+
+    return FileResponse(output_path, filename=f"bilingual_output.{output_format}")
 
 @app.post("/upload_to_drive/", summary="Upload file to Google Drive")
 async def upload_to_drive(file_path: str = Form(...), api_key: str = Form(...)):
-    if api_key != os.getenv("API_KEY", "SECRET_API_KEY"):
-        raise HTTPException(status_code=401, detail="Invalid API key")
-    
+    verify_api_key(api_key)
+
+    def upload():
+        with STAGE_SECONDS.labels("drive_upload").time():
+            return get_formatter().upload_to_drive(file_path)
+
     try:
-        drive_id = formatter.upload_to_drive(file_path)
+        # الرفع (MD5 والرفع المجزأ والتراجع وتهيئة Drive الأولى) متزامن، لذا يُنفذ خارج حلقة الأحداث
+        drive_id = await asyncio.get_running_loop().run_in_executor(None, upload)
         return {"message": "Uploaded to Google Drive", "drive_id": drive_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics", summary="Prometheus metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/health/", summary="Check API health")
 async def health_check():
     return {"status": "healthy", "version": "2.3"}
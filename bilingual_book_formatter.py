@@ -5,71 +5,661 @@ Bilingual Book Formatter v2.3
 أداة متطورة لمعالجة الكتب والمستندات ثنائية اللغة
 """
 
+import hashlib
+import html
+import importlib.util
+import io
 import json
 import os
+import queue
+import re
+import shutil
+import sqlite3
 import sys
+import threading
 import tempfile
+import time
 import logging
+import unicodedata
+import urllib.parse
+from contextlib import contextmanager
+from difflib import SequenceMatcher
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from string import Template
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Any
 import multiprocessing as mp
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import argparse
 
-# Document processing imports
-try:
-    from docx import Document
-    from docx.shared import Inches, Pt, RGBColor
-    from docx.enum.text import WD_ALIGN_PARAGRAPH
-    from docx.enum.section import WD_SECTION
-except ImportError:
-    print("تحذير: مكتبة python-docx غير مثبتة")
-
-try:
-    import pdfplumber
-    import pypdfium2 as pdfium
-except ImportError:
-    print("تحذير: مكتبات PDF غير مثبتة")
-
-try:
-    import ebooklib
-    from ebooklib import epub
-except ImportError:
-    print("تحذير: مكتبة ebooklib غير مثبتة")
-
-try:
-    from PIL import Image, ImageOps
-except ImportError:
-    print("تحذير: مكتبة Pillow غير مثبتة")
-
-# Translation imports
-try:
-    import deepl
-except ImportError:
-    print("تحذير: مكتبة DeepL غير مثبتة")
-
-# Google Drive imports
-try:
-    from googleapiclient.discovery import build
-    from google.oauth2.credentials import Credentials
-    from google_auth_oauthlib.flow import InstalledAppFlow
-    from google.auth.transport.requests import Request
-    from googleapiclient.http import MediaFileUpload
-except ImportError:
-    print("تحذير: مكتبات Google API غير مثبتة")
-
-# GUI imports
-try:
-    from PyQt6.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout,
-                                 QWidget, QPushButton, QLabel, QFileDialog, QTextEdit,
-                                 QProgressBar, QComboBox, QCheckBox, QSpinBox, QTabWidget,
-                                 QScrollArea, QSplitter, QGroupBox, QGridLayout, QMessageBox)
-    from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer
-    from PyQt6.QtGui import QFont, QPixmap, QIcon
-    GUI_AVAILABLE = True
-except ImportError:
-    GUI_AVAILABLE = False
-    print("تحذير: مكتبة PyQt6 غير مثبتة - الواجهة الرسومية غير متاحة")
+# المكتبات الثقيلة (python-docx و pdfplumber و ebooklib و Pillow و DeepL و Google API و PyQt6)
+# تُستورد داخل الدوال التي تستخدمها فقط، حتى يبقى بدء سطر الأوامر والعمليات العاملة سريعاً.
+# الواجهة الرسومية في وحدة gui المنفصلة وتُستورد عند طلبها (load_gui) إذا كانت PyQt6 مثبتة.
+GUI_AVAILABLE = importlib.util.find_spec("PyQt6") is not None
+
+
+# تنسيقات الإخراج التي يمكن إنتاجها
+OUTPUT_FORMATS = ("docx", "epub")
+
+# قوالب XHTML مُجمّعة مسبقاً لفصول EPUB
+EPUB_CHAPTER_TEMPLATE = Template('''<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="$lang" xml:lang="$lang">
+<head>
+<meta charset="utf-8" />
+<title>$title</title>
+<style>
+    .bilingual-container { display: flex; }
+    .lang1 { flex: 1; padding: 10px; }
+    .lang2 { flex: 1; padding: 10px; text-align: right; }
+    .bilingual-figure { text-align: center; }
+    .machine-translated { font-style: italic; color: #555555; }
+    img { max-width: 100%; }
+</style>
+</head>
+<body>
+$rows
+</body>
+</html>
+''')
+
+EPUB_ROW_TEMPLATE = (
+    '<div class="bilingual-container">'
+    '<div class="lang1{0}">{1}</div>'
+    '<div class="lang2{2}">{3}</div>'
+    '</div>\n'
+).format
+
+EPUB_IMAGE_TEMPLATE = '<img src="{0}" alt="" />'.format
+
+EPUB_FIGURE_TEMPLATE = '<div class="bilingual-figure">{0}</div>\n'.format
+
+# محارف غير مسموح بها في XML (تظهر أحياناً في نصوص PDF)
+_XML_INVALID_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def escape_xhtml_text(text: str) -> str:
+    """تهريب النص لإدراجه بأمان داخل XHTML"""
+    if not text:
+        return ''
+    return html.escape(_XML_INVALID_CHARS.sub('', text)).replace('\n', '<br />')
+
+
+def _render_epub_cell(cell: Tuple[str, str, bool]) -> Tuple[str, str]:
+    """إرجاع (صنف CSS الإضافي، محتوى الخلية) لخلية (نص، صورة، مترجمة آلياً)"""
+    text, image, machine_translated = cell
+    if image:
+        return '', EPUB_IMAGE_TEMPLATE(html.escape(image))
+    return (' machine-translated' if machine_translated else ''), escape_xhtml_text(text)
+
+
+def render_chapter_xhtml(chapter: Dict[str, Any]) -> bytes:
+    """عرض فصل EPUB واحد إلى بايتات XHTML (تعمل داخل عمليات منفصلة)
+
+    كل صف هو زوج خلايا، وكل خلية هي (نص، صورة، مترجمة آلياً)؛
+    الصورة المشتركة بين العمودين تُعرض مرة واحدة.
+    """
+    parts = []
+    for cell1, cell2 in chapter['rows']:
+        if cell1[1] and cell1[1] == cell2[1]:
+            parts.append(EPUB_FIGURE_TEMPLATE(EPUB_IMAGE_TEMPLATE(html.escape(cell1[1]))))
+            continue
+        parts.append(EPUB_ROW_TEMPLATE(*_render_epub_cell(cell1), *_render_epub_cell(cell2)))
+    
+    return EPUB_CHAPTER_TEMPLATE.substitute(
+        lang=chapter.get('lang', 'en'),
+        title=escape_xhtml_text(chapter['title']),
+        rows=''.join(parts)
+    ).encode('utf-8')
+
+
+def process_image_task(task: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """معالجة صورة واحدة داخل عملية منفصلة، وتعيد (المسار، رسالة الخطأ)"""
+    try:
+        from PIL import Image, ImageOps
+
+        max_width = task['max_width']
+        image = Image.open(io.BytesIO(task['data']))
+        
+        # فك ترميز JPEG بدقة مخفضة مباشرة بدلاً من الدقة الكاملة
+        if image.format == 'JPEG' and image.width > max_width:
+            image.draft(None, (max_width, max_width))
+        
+        # تحسين الصورة
+        image = ImageOps.exif_transpose(image)
+        
+        # تغيير الحجم إذا لزم الأمر، مع تصغير صحيح مسبق (reduce) للصور الكبيرة
+        if image.width > max_width:
+            image.thumbnail((max_width, image.height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        
+        if task['format'].lower() in ('jpeg', 'jpg') and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        
+        # حفظ الصورة
+        image.save(task['output_path'], optimize=True, quality=task['quality'])
+        return task['output_path'], None
+    
+    except Exception as e:
+        return None, str(e)
+
+
+def image_fingerprint(image_data: bytes, hash_size: int = 8) -> Tuple[Optional[int], int]:
+    """بصمة إدراكية (dHash) للصورة مع مساحتها بالبكسل؛ تتحمل إعادة الترميز وتغيير الدقة"""
+    try:
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(image_data))
+        area = image.width * image.height
+        
+        # البصمة تحتاج صورة صغيرة جداً، لذا نفك ترميز JPEG بأقل دقة ممكنة
+        image.draft('L', (hash_size * 4, hash_size * 4))
+        image = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+        
+        pixels = list(image.getdata())
+        value = 0
+        for row in range(hash_size):
+            offset = row * (hash_size + 1)
+            for col in range(hash_size):
+                value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+        return value, area
+    
+    except Exception:
+        return None, 0
+
+
+def hamming_distance(hash1: int, hash2: int) -> int:
+    """عدد البتات المختلفة بين بصمتين"""
+    return bin(hash1 ^ hash2).count('1')
+
+
+class DiskCache:
+    """ذاكرة تخزين مؤقت على القرص محدودة الحجم مع إزالة الأقدم استخداماً (LRU)"""
+    
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+    
+    def _path(self, key: str, suffix: str = '') -> str:
+        return os.path.join(self.directory, f"{key}{suffix}")
+    
+    def get(self, key: str, suffix: str = '') -> Optional[str]:
+        """إرجاع مسار العنصر المخزن أو None، مع تحديث وقت آخر استخدام"""
+        path = self._path(key, suffix)
+        try:
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+    
+    def put(self, key: str, source_path: str, suffix: str = '') -> str:
+        """نسخ ملف إلى الذاكرة المؤقتة بشكل ذري (آمن بين العمليات المتزامنة)"""
+        path = self._path(key, suffix)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        os.close(fd)
+        try:
+            shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return path
+    
+    def evict(self):
+        """حذف أقدم العناصر استخداماً حتى يعود الحجم الكلي ضمن الحد"""
+        entries = []
+        total_size = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_file() or entry.name.endswith('.part'):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+        
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
+
+
+class CharacterRateLimiter:
+    """محدد معدل (token bucket) يحسب الاستهلاك بالأحرف كما تفعل DeepL
+
+    يخفض المعدل تلقائياً عند ردود 429/456 ثم يستعيده تدريجياً مع الطلبات الناجحة.
+    المعدل 0 يعني عدم التقييد.
+    """
+    
+    def __init__(self, chars_per_second: float, burst: Optional[float] = None,
+                 min_rate_fraction: float = 0.1, recovery_factor: float = 1.05):
+        self.base_rate = float(chars_per_second)
+        self.rate = self.base_rate
+        self.capacity = float(burst or chars_per_second)
+        self.min_rate = self.base_rate * min_rate_fraction
+        self.recovery_factor = recovery_factor
+        self.tokens = self.capacity
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.base_rate > 0
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def acquire(self, chars: int) -> float:
+        """الانتظار حتى يسمح الرصيد بإرسال عدد الأحرف المطلوب، ويعيد زمن الانتظار"""
+        if not self.enabled:
+            return 0.0
+        
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                # الطلبات الأكبر من السعة تُسمح عند امتلاء الرصيد ويصبح الرصيد سالباً
+                needed = min(chars, self.capacity)
+                if now >= self.blocked_until and self.tokens >= needed:
+                    self.tokens -= chars
+                    return waited
+                delay = max(self.blocked_until - now, (needed - self.tokens) / self.rate)
+            time.sleep(delay)
+            waited += delay
+    
+    def on_throttled(self, backoff: float):
+        """تخفيض المعدل وإيقاف الإرسال مؤقتاً بعد رد 429/456"""
+        if not self.enabled:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            self.blocked_until = max(self.blocked_until, now + backoff)
+    
+    def on_success(self):
+        """استعادة المعدل تدريجياً حتى القيمة المضبوطة"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.rate = min(self.base_rate, self.rate * self.recovery_factor)
+
+
+class TranslationUsage:
+    """عدادات استهلاك الترجمة (الأحرف والطلبات وحالات التقييد)"""
+    
+    def __init__(self):
+        self.requests = 0
+        self.characters = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+    
+    def record(self, requests: int = 0, characters: int = 0, throttled: int = 0):
+        with self._lock:
+            self.requests += requests
+            self.characters += characters
+            self.throttled += throttled
+    
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {'requests': self.requests, 'characters': self.characters, 'throttled': self.throttled}
+
+
+class ProcessingCancelled(Exception):
+    """تُرفع عند إلغاء المعالجة بطلب من المستخدم"""
+
+
+class ProgressTracker:
+    """تتبع تقدم عملية التحويل وإرسال أحداث التقدم إلى دالة رد النداء
+
+    لكل مرحلة نطاق من النسبة الكلية، وكل حدث يحمل المرحلة والعدد المنجز
+    والكلي والنسبة الكلية والزمن المنقضي والزمن المتبقي المقدر (ETA).
+    عند تمرير cancel_event تكون كل نقطة تقدم نقطة إلغاء أيضاً.
+    
+    يمكن تقسيم وحدة العمل الجارية إلى خطوات (subtask/step)، مثل صفحات الملف أثناء
+    الاستخراج؛ وتُرسل أحداث الخطوات فقط عند تغير النسبة الظاهرة حتى لا تغرق الطابور.
+    """
+    
+    # (بداية، نهاية) نطاق كل مرحلة من النسبة الكلية
+    STAGES = {
+        'extract': (0, 20),
+        'images': (20, 35),
+        'align': (35, 40),
+        'render': (40, 100),
+    }
+    
+    def __init__(self, callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 cancel_event: Optional[threading.Event] = None):
+        self.callback = callback
+        self.cancel_event = cancel_event
+        self.started = time.monotonic()
+        self.stage_name = None
+        self.done = 0
+        self.total = 0
+        self.sub_done = 0
+        self.sub_total = 0
+        self._lock = threading.Lock()
+    
+    def stage(self, name: str, total: int = 1):
+        """بدء مرحلة جديدة بعدد وحدات العمل فيها"""
+        self.check_cancelled()
+        with self._lock:
+            self.stage_name, self.done, self.total = name, 0, max(0, total)
+            self.sub_done = self.sub_total = 0
+        self._emit()
+    
+    def advance(self, count: int = 1):
+        self.check_cancelled()
+        with self._lock:
+            self.done = min(self.total, self.done + count)
+            self.sub_done = self.sub_total = 0
+        self._emit()
+    
+    def subtask(self, total: int):
+        """تقسيم وحدة العمل التالية في المرحلة إلى total خطوة"""
+        with self._lock:
+            self.sub_done, self.sub_total = 0, max(0, total)
+    
+    def step(self, count: int = 1):
+        """تقدم خطوة داخل وحدة العمل الجارية"""
+        self.check_cancelled()
+        with self._lock:
+            if not self.sub_total:
+                return
+            before = round(self.percent(), 1)
+            self.sub_done = min(self.sub_total, self.sub_done + count)
+            changed = round(self.percent(), 1) != before
+        if changed:
+            self._emit()
+    
+    def check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ProcessingCancelled("تم إلغاء المعالجة")
+    
+    def finish(self):
+        with self._lock:
+            self.stage_name, self.done, self.total = 'done', 1, 1
+        self._emit()
+    
+    def percent(self) -> float:
+        if self.stage_name == 'done':
+            return 100.0
+        start, end = self.STAGES.get(self.stage_name, (0, 0))
+        partial = self.sub_done / self.sub_total if self.sub_total else 0.0
+        fraction = min(1.0, (self.done + partial) / self.total) if self.total else 0.0
+        return start + (end - start) * fraction
+    
+    def _emit(self):
+        if not self.callback:
+            return
+        with self._lock:
+            percent = self.percent()
+            elapsed = time.monotonic() - self.started
+            event = {
+                'stage': self.stage_name,
+                'done': self.done,
+                'total': self.total,
+                'percent': round(percent, 1),
+                'elapsed': round(elapsed, 2),
+                'eta': round(elapsed * (100 - percent) / percent, 2) if percent > 0 else None,
+            }
+        try:
+            self.callback(event)
+        except Exception as e:
+            logging.warning(f"خطأ في دالة تقدم المعالجة: {e}")
+
+
+def disable_library_retries(translator) -> None:
+    """تعطيل إعادة المحاولة داخل مكتبة deepl لهذا المترجم فقط
+
+    إعادة المحاولة والتراجع التكيفي تتم في BatchTranslator حتى يرى محدد المعدل ردود 429/456.
+    الإعداد deepl.http_client.max_network_retries عام لكل العملية، لذا يُستبدل قرار
+    إعادة المحاولة على عميل HTTP الخاص بهذا المترجم بدلاً من تغييره.
+    """
+    client = getattr(translator, "_client", None)
+    if client is None or not hasattr(client, "_should_retry"):
+        logging.warning("تعذر تعطيل إعادة المحاولة في مكتبة deepl، ستُعاد الطلبات داخل المكتبة أيضاً")
+        return
+    client._should_retry = lambda response, exception, num_retries: False
+
+
+class BatchTranslator:
+    """مرحلة ترجمة مجمّعة ومتزامنة فوق مترجم DeepL
+
+    تُجمع الفقرات في طلبات ضمن حدود الـ API (عدد النصوص وحجم الطلب)،
+    وتُرسل عدة طلبات بالتوازي مع إعادة المحاولة، وتُعاد النتائج بنفس ترتيب الإدخال.
+    """
+    
+    # حدود DeepL: 50 نصاً و128 كيلوبايت لكل طلب
+    MAX_TEXTS_PER_REQUEST = 50
+    MAX_REQUEST_BYTES = 128 * 1024
+    
+    def __init__(self, translator, max_concurrency: int = 4,
+                 max_texts: int = MAX_TEXTS_PER_REQUEST, max_bytes: int = 120 * 1024,
+                 max_retries: int = 3, retry_backoff: float = 1.0,
+                 rate_limiter: Optional[CharacterRateLimiter] = None,
+                 usage_counters: Tuple[TranslationUsage, ...] = ()):
+        self.translator = translator
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_texts = max(1, min(max_texts, self.MAX_TEXTS_PER_REQUEST))
+        self.max_bytes = max(1, min(max_bytes, self.MAX_REQUEST_BYTES))
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.rate_limiter = rate_limiter
+        self.usage_counters = usage_counters
+    
+    @staticmethod
+    def encoded_size(text: str) -> int:
+        """حجم النص بعد ترميزه في جسم الطلب (application/x-www-form-urlencoded)"""
+        return len(urllib.parse.quote_plus(text)) + len("&text=")
+    
+    def make_batches(self, texts: List[str]) -> List[List[int]]:
+        """تقسيم فهارس النصوص إلى دفعات ضمن حدود الطلب الواحد"""
+        batches = []
+        current: List[int] = []
+        current_bytes = 0
+        
+        for index, text in enumerate(texts):
+            size = self.encoded_size(text)
+            if current and (len(current) >= self.max_texts or current_bytes + size > self.max_bytes):
+                batches.append(current)
+                current, current_bytes = [], 0
+            current.append(index)
+            current_bytes += size
+        
+        if current:
+            batches.append(current)
+        return batches
+    
+    def translate_batch(self, texts: List[str], target_lang: str,
+                        source_lang: Optional[str] = None) -> List[str]:
+        """ترجمة دفعة واحدة مع إعادة المحاولة عند الأخطاء المؤقتة والتقييد"""
+        import deepl
+        
+        characters = sum(len(text) for text in texts)
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire(characters)
+            try:
+                results = self.translator.translate_text(
+                    texts, target_lang=target_lang, source_lang=source_lang
+                )
+            except deepl.QuotaExceededException:
+                # تجاوز الحصة (456) لا يزول بالانتظار، لذا يفشل الطلب فوراً دون إعادة المحاولة
+                for usage in self.usage_counters:
+                    usage.record(throttled=1)
+                raise
+            except deepl.DeepLException as e:
+                attempt += 1
+                throttled = isinstance(e, deepl.TooManyRequestsException)
+                if throttled:
+                    for usage in self.usage_counters:
+                        usage.record(throttled=1)
+                if (not throttled and not getattr(e, 'should_retry', False)) or attempt > self.max_retries:
+                    raise
+                delay = self.retry_backoff * (2 ** (attempt - 1))
+                if throttled and self.rate_limiter:
+                    # تقييد من الخادم (429): إبطاء جميع الطلبات وليس هذا الطلب فقط
+                    self.rate_limiter.on_throttled(delay)
+                logging.warning(f"فشل طلب الترجمة ({e})، إعادة المحاولة {attempt} بعد {delay:.1f} ثانية")
+                # عند التقييد مع محدد مفعّل يتولى المحدد الانتظار قبل الطلب التالي
+                if not (throttled and self.rate_limiter and self.rate_limiter.enabled):
+                    time.sleep(delay)
+                continue
+            
+            if self.rate_limiter:
+                self.rate_limiter.on_success()
+            for usage in self.usage_counters:
+                usage.record(requests=1, characters=characters)
+            return [result.text for result in results]
+    
+    def translate(self, texts: List[str], target_lang: str,
+                  source_lang: Optional[str] = None) -> List[str]:
+        """ترجمة قائمة نصوص مع الحفاظ على ترتيبها"""
+        results = list(texts)
+        
+        # النصوص الفارغة لا تُرسل إلى الـ API
+        pending = [i for i, text in enumerate(texts) if text and text.strip()]
+        if not pending:
+            return results
+        
+        batches = [[pending[i] for i in batch]
+                   for batch in self.make_batches([texts[i] for i in pending])]
+        
+        def run(batch: List[int]) -> List[str]:
+            return self.translate_batch([texts[i] for i in batch], target_lang, source_lang)
+        
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+            for batch, translated in zip(batches, executor.map(run, batches)):
+                for index, text in zip(batch, translated):
+                    results[index] = text
+        
+        logging.info(f"تمت ترجمة {len(pending)} نص في {len(batches)} طلب")
+        return results
+
+
+class TranslationMemory:
+    """ذاكرة ترجمة دائمة (SQLite) تمنع دفع كلفة ترجمة النص نفسه مرتين
+
+    المفتاح هو بصمة النص بعد التطبيع مع زوج اللغتين، مع بحث تقريبي اختياري.
+    """
+    
+    def __init__(self, path: str, fuzzy: bool = False, fuzzy_threshold: float = 0.9):
+        self.path = os.path.expanduser(path)
+        self.fuzzy = fuzzy
+        self.fuzzy_threshold = fuzzy_threshold
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        with self._connection:
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS translations (
+                    key TEXT NOT NULL,
+                    source_lang TEXT NOT NULL,
+                    target_lang TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    translation TEXT NOT NULL,
+                    length INTEGER NOT NULL,
+                    bucket TEXT NOT NULL,
+                    PRIMARY KEY (key, source_lang, target_lang)
+                )
+            ''')
+            self._connection.execute('''
+                CREATE INDEX IF NOT EXISTS translations_fuzzy
+                ON translations (source_lang, target_lang, bucket, length)
+            ''')
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        """توحيد الترميز والمسافات قبل حساب البصمة"""
+        return ' '.join(unicodedata.normalize('NFC', text).split())
+    
+    @staticmethod
+    def make_key(normalized: str) -> str:
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def make_bucket(normalized: str) -> str:
+        """مفتاح تجميع للبحث التقريبي: أول كلمتين بأحرف صغيرة"""
+        return ' '.join(normalized.lower().split()[:2])
+    
+    def lookup(self, text: str, target_lang: str, source_lang: Optional[str] = None) -> Optional[str]:
+        """البحث عن ترجمة محفوظة (مطابقة تامة ثم تقريبية إن كانت مفعلة)"""
+        normalized = self.normalize(text)
+        source_lang = (source_lang or '').upper()
+        target_lang = target_lang.upper()
+        
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT translation FROM translations WHERE key = ? AND source_lang = ? AND target_lang = ?',
+                (self.make_key(normalized), source_lang, target_lang)
+            ).fetchone()
+            if row:
+                self.exact_hits += 1
+                return row[0]
+            
+            if self.fuzzy and normalized:
+                length = len(normalized)
+                margin = max(1, int(length * (1 - self.fuzzy_threshold)))
+                candidates = self._connection.execute(
+                    '''SELECT source, translation FROM translations
+                       WHERE source_lang = ? AND target_lang = ? AND bucket = ?
+                       AND length BETWEEN ? AND ?''',
+                    (source_lang, target_lang, self.make_bucket(normalized), length - margin, length + margin)
+                ).fetchall()
+                for source, translation in candidates:
+                    matcher = SequenceMatcher(None, normalized, source, autojunk=False)
+                    if matcher.quick_ratio() >= self.fuzzy_threshold and matcher.ratio() >= self.fuzzy_threshold:
+                        self.fuzzy_hits += 1
+                        return translation
+            
+            self.misses += 1
+            return None
+    
+    def store(self, pairs: List[Tuple[str, str]], target_lang: str, source_lang: Optional[str] = None):
+        """حفظ أزواج (النص، الترجمة)"""
+        source_lang = (source_lang or '').upper()
+        target_lang = target_lang.upper()
+        rows = []
+        for text, translation in pairs:
+            normalized = self.normalize(text)
+            rows.append((self.make_key(normalized), source_lang, target_lang, normalized,
+                         translation, len(normalized), self.make_bucket(normalized)))
+        
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?, ?)', rows
+            )
+    
+    def stats(self) -> Dict[str, Any]:
+        """إحصائيات الاستخدام ونسبة الإصابة"""
+        lookups = self.exact_hits + self.fuzzy_hits + self.misses
+        return {
+            'exact_hits': self.exact_hits,
+            'fuzzy_hits': self.fuzzy_hits,
+            'misses': self.misses,
+            'hit_rate': (self.exact_hits + self.fuzzy_hits) / lookups if lookups else 0.0
+        }
+    
+    def close(self):
+        self._connection.close()
 
 
 class BilingualBookFormatter:
@@ -81,13 +671,23 @@ class BilingualBookFormatter:
         self.setup_logging()
         self.deepl_translator = None
         self.drive_service = None
-        
-        # تهيئة مترجم DeepL إذا كان متاحاً
-        if self.config.get("translation", {}).get("enable_deepl", False):
-            self.init_deepl()
-        
-        # تهيئة خدمة Google Drive إذا كانت متاحة
-        self.init_google_drive()
+        self.drive_credentials = None
+        # سبب فشل تهيئة Drive؛ يمنع إعادة محاولة تسجيل الدخول مع كل رفع
+        self.drive_init_error = None
+        self.image_cache = None
+        self.translation_memory = None
+        self.rate_limiter = None
+        # يحمي الإنشاء عند أول استخدام لخدمات الترجمة المشتركة، إذ تطلبها عدة نوافذ ترجمة بالتوازي
+        self._translation_services_lock = threading.Lock()
+        # عدادات الاستهلاك: تراكمية لعمر العملية، ولكل مهمة على حدة
+        self.translation_usage = TranslationUsage()
+        self.job_translation_usage = TranslationUsage()
+        self.progress = ProgressTracker()
+        # الزمن المستغرق في كل مرحلة للمهمة الحالية (بالثواني)
+        self.stage_timings: Dict[str, float] = {}
+        self._stage_timings_lock = threading.Lock()
+        # مترجم DeepL وخدمة Google Drive يُهيآن عند أول استخدام فقط
+        # (get_deepl_translator و get_drive_service) حتى يبقى بدء التشغيل سريعاً
     
     def load_config(self, config_path: str) -> Dict[str, Any]:
         """تحميل ملف الإعدادات"""
@@ -119,15 +719,56 @@ class BilingualBookFormatter:
             },
             "export_pdf": True,
             "export_epub": True,
+            "epub": {
+                "rows_per_chapter": 200
+            },
+            "performance": {
+                "max_workers": 0
+            },
+            "pipeline": {
+                "queue_size": 4,
+                "sections_in_flight": 2
+            },
             "translation": {
                 "enable_deepl": False,
-                "deepl_api_key": ""
+                "deepl_api_key": "",
+                "deepl_server_url": "",
+                "max_concurrency": 4,
+                "batch_max_texts": 50,
+                "batch_max_bytes": 122880,
+                "max_retries": 3,
+                "retry_backoff": 1.0,
+                "memory": True,
+                "memory_path": "~/.cache/bilingual_book_formatter/translation_memory.sqlite3",
+                "fuzzy_lookup": False,
+                "fuzzy_threshold": 0.9,
+                "fill_gaps": False,
+                "lang1": "EN",
+                "lang2": "AR",
+                "chars_per_second": 0,
+                "burst_chars": 0
             },
             "image_processing": {
                 "enable": True,
                 "image_position": "center",
                 "max_width": 600,
-                "format": "webp"
+                "format": "webp",
+                "quality": 85,
+                "cache": True,
+                "cache_dir": "~/.cache/bilingual_book_formatter/images",
+                "cache_max_mb": 512
+            },
+            "drive": {
+                "folder_id": "",
+                "api_endpoint": "",
+                "chunk_size_mb": 8,
+                "max_concurrency": 4,
+                "max_retries": 5,
+                "retry_backoff": 1.0,
+                "timeout": 60
+            },
+            "preview": {
+                "max_blocks": 5
             }
         }
     
@@ -142,19 +783,149 @@ class BilingualBookFormatter:
             ]
         )
     
+    def get_max_workers(self) -> int:
+        """عدد العمليات المتوازية المسموح بها (0 = عدد أنوية المعالج)"""
+        max_workers = self.config.get("performance", {}).get("max_workers", 0) or 0
+        if max_workers <= 0:
+            max_workers = os.cpu_count() or 1
+        return max_workers
+    
+    def get_image_cache(self) -> Optional[DiskCache]:
+        """ذاكرة الصور المعالجة المشتركة بين الواجهة الرسومية وسطر الأوامر والـ API"""
+        image_settings = self.config.get("image_processing", {})
+        if not image_settings.get("cache", True):
+            return None
+        
+        if self.image_cache is None:
+            try:
+                self.image_cache = DiskCache(
+                    image_settings.get("cache_dir", "~/.cache/bilingual_book_formatter/images"),
+                    int(image_settings.get("cache_max_mb", 512) * 1024 * 1024)
+                )
+            except OSError as e:
+                logging.warning(f"تعذر إنشاء ذاكرة الصور المؤقتة: {e}")
+                return None
+        return self.image_cache
+    
     def init_deepl(self):
         """تهيئة مترجم DeepL"""
         try:
-            api_key = self.config.get("translation", {}).get("deepl_api_key", "")
+            import deepl
+
+            translation_settings = self.config.get("translation", {})
+            api_key = translation_settings.get("deepl_api_key", "") or os.getenv("DEEPL_API_KEY", "")
             if api_key:
-                self.deepl_translator = deepl.Translator(api_key)
+                # يمكن توجيه المترجم إلى خادم محلي للاختبار
+                server_url = translation_settings.get("deepl_server_url") or None
+                self.deepl_translator = deepl.Translator(api_key, server_url=server_url)
+                disable_library_retries(self.deepl_translator)
                 logging.info("تم تهيئة مترجم DeepL بنجاح")
         except Exception as e:
             logging.error(f"فشل في تهيئة مترجم DeepL: {e}")
     
+    def get_deepl_translator(self):
+        """مترجم DeepL، يُهيأ عند أول طلب ترجمة إذا كان translation.enable_deepl مفعلاً"""
+        if not self.config.get("translation", {}).get("enable_deepl", False):
+            return None
+        with self._translation_services_lock:
+            if self.deepl_translator is None:
+                self.init_deepl()
+        return self.deepl_translator
+    
+    def get_translation_memory(self) -> Optional[TranslationMemory]:
+        """ذاكرة الترجمة المشتركة بين جميع التشغيلات"""
+        translation_settings = self.config.get("translation", {})
+        if not translation_settings.get("memory", True):
+            return None
+        
+        with self._translation_services_lock:
+            if self.translation_memory is None:
+                try:
+                    self.translation_memory = TranslationMemory(
+                        translation_settings.get("memory_path", "~/.cache/bilingual_book_formatter/translation_memory.sqlite3"),
+                        fuzzy=translation_settings.get("fuzzy_lookup", False),
+                        fuzzy_threshold=translation_settings.get("fuzzy_threshold", 0.9)
+                    )
+                except (OSError, sqlite3.Error) as e:
+                    logging.warning(f"تعذر فتح ذاكرة الترجمة: {e}")
+                    return None
+            return self.translation_memory
+    
+    def get_rate_limiter(self) -> CharacterRateLimiter:
+        """محدد المعدل المشترك بين جميع طلبات الترجمة في هذه العملية"""
+        with self._translation_services_lock:
+            if self.rate_limiter is None:
+                translation_settings = self.config.get("translation", {})
+                self.rate_limiter = CharacterRateLimiter(
+                    translation_settings.get("chars_per_second", 0),
+                    translation_settings.get("burst_chars", 0) or None
+                )
+            return self.rate_limiter
+    
+    def get_translation_usage(self) -> Dict[str, Dict[str, int]]:
+        """استهلاك الترجمة للمهمة الحالية والاستهلاك التراكمي"""
+        return {'job': self.job_translation_usage.snapshot(), 'total': self.translation_usage.snapshot()}
+    
+    def translate_texts(self, texts: List[str], target_lang: str,
+                        source_lang: Optional[str] = None) -> List[str]:
+        """ترجمة مجموعة فقرات دفعة واحدة عبر DeepL مع الحفاظ على الترتيب"""
+        translator = self.get_deepl_translator()
+        if not translator:
+            raise ValueError("مترجم DeepL غير مهيأ")
+        
+        translation_settings = self.config.get("translation", {})
+        batch_translator = BatchTranslator(
+            translator,
+            max_concurrency=translation_settings.get("max_concurrency", 4),
+            max_texts=translation_settings.get("batch_max_texts", BatchTranslator.MAX_TEXTS_PER_REQUEST),
+            max_bytes=translation_settings.get("batch_max_bytes", 120 * 1024),
+            max_retries=translation_settings.get("max_retries", 3),
+            retry_backoff=translation_settings.get("retry_backoff", 1.0),
+            rate_limiter=self.get_rate_limiter(),
+            usage_counters=(self.translation_usage, self.job_translation_usage)
+        )
+        
+        # البحث في ذاكرة الترجمة أولاً، وإرسال النصوص الفريدة غير المحفوظة فقط
+        memory = self.get_translation_memory()
+        results = list(texts)
+        missing: Dict[str, List[int]] = {}
+        for index, text in enumerate(texts):
+            if not text or not text.strip():
+                continue
+            if text in missing:
+                missing[text].append(index)
+                continue
+            cached = memory.lookup(text, target_lang, source_lang) if memory else None
+            if cached is not None:
+                results[index] = cached
+            else:
+                missing[text] = [index]
+        
+        if missing:
+            unique_texts = list(missing)
+            translated = batch_translator.translate(unique_texts, target_lang, source_lang)
+            for text, translation in zip(unique_texts, translated):
+                for index in missing[text]:
+                    results[index] = translation
+            if memory:
+                memory.store(list(zip(unique_texts, translated)), target_lang, source_lang)
+        
+        if memory:
+            stats = memory.stats()
+            logging.info(
+                f"ذاكرة الترجمة: {stats['exact_hits']} مطابقة تامة، {stats['fuzzy_hits']} تقريبية، "
+                f"{stats['misses']} غير موجودة (نسبة الإصابة {stats['hit_rate']:.0%})"
+            )
+        
+        return results
+    
     def init_google_drive(self):
         """تهيئة خدمة Google Drive"""
         try:
+            from google.oauth2.credentials import Credentials
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            from google.auth.transport.requests import Request
+            
             # هذا مجرد مثال - يحتاج إلى ملف credentials.json
             SCOPES = ['https://www.googleapis.com/auth/drive.file']
             creds = None
@@ -170,21 +941,65 @@ class BilingualBookFormatter:
                         flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
                         creds = flow.run_local_server(port=0)
                 
+                if not creds:
+                    raise ValueError("لا توجد بيانات اعتماد (token.json أو credentials.json)")
                 with open('token.json', 'w') as token:
                     token.write(creds.to_json())
             
-            self.drive_service = build('drive', 'v3', credentials=creds)
+            self.drive_credentials = creds
+            self.drive_service = self.build_drive_service(creds)
+            self.drive_init_error = None
             logging.info("تم تهيئة خدمة Google Drive بنجاح")
         except Exception as e:
+            self.drive_init_error = str(e)
             logging.warning(f"لم يتم تهيئة Google Drive: {e}")
     
-    def extract_text_from_docx(self, file_path: str) -> List[Dict[str, Any]]:
-        """استخراج النص من ملف DOCX"""
+    def build_drive_service(self, credentials=None):
+        """بناء عميل Drive v3 من وثيقة الاكتشاف المضمنة
+
+        drive.api_endpoint (مثل "http://127.0.0.1:8766/") يستبدل جذر الـ API بالكامل،
+        بما في ذلك مسارات الرفع، لتوجيه الطلبات إلى خادم محلي للاختبار.
+        """
+        from googleapiclient.discovery import build, build_from_document
+        from googleapiclient.discovery_cache import get_static_doc
+        
+        api_endpoint = self.config.get("drive", {}).get("api_endpoint") or None
+        # بدون بيانات اعتماد (خادم محلي) يُستخدم اتصال HTTP عادي
+        http = None if credentials else self._new_drive_http()
+        if not api_endpoint:
+            return build('drive', 'v3', credentials=credentials, http=http)
+        
+        document = json.loads(get_static_doc('drive', 'v3'))
+        document['rootUrl'] = api_endpoint.rstrip('/') + '/'
+        return build_from_document(document, credentials=credentials, http=http)
+    
+    def get_drive_service(self):
+        """خدمة Google Drive، تُهيأ عند أول رفع (قد يتطلب ذلك تسجيل دخول OAuth)
+
+        بعد فشل التهيئة لا تُعاد المحاولة تلقائياً؛ استدعاء init_google_drive صراحةً يعيدها.
+        """
+        if self.drive_service is None and self.drive_init_error is None:
+            self.init_google_drive()
+        return self.drive_service
+    
+    def extract_text_from_docx(self, file_path: str, max_blocks: Optional[int] = None) -> List[Dict[str, Any]]:
+        """استخراج النص من ملف DOCX
+
+        max_blocks: عند تحديده تُقرأ الفقرات الأولى فقط مباشرة من document.xml
+        ويتوقف التحليل بعدها دون تحميل المستند كاملاً أو صوره
+        """
+        if max_blocks is not None:
+            return self._extract_docx_head(file_path, max_blocks)
         try:
+            from docx import Document
+
             doc = Document(file_path)
             content = []
             
-            for paragraph in doc.paragraphs:
+            paragraphs = doc.paragraphs
+            self.progress.subtask(len(paragraphs))
+            for paragraph in paragraphs:
+                self.progress.step()
                 if paragraph.text.strip():
                     content.append({
                         'type': 'paragraph',
@@ -201,18 +1016,87 @@ class BilingualBookFormatter:
                         'filename': rel.target_ref
                     })
             
+            return content
+        except ProcessingCancelled:
+            raise
+        except Exception as e:
+            logging.error(f"خطأ في استخراج النص من DOCX: {e}")
+            return []
+    
+    def _extract_docx_head(self, file_path: str, max_blocks: int) -> List[Dict[str, Any]]:
+        """قراءة أول max_blocks فقرة غير فارغة من DOCX بتحليل تدفقي لـ document.xml"""
+        try:
+            import zipfile
+            from docx.styles import BabelFish
+            from lxml import etree
+
+            namespace = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+            content = []
+            with zipfile.ZipFile(file_path) as archive:
+                # أسماء الأنماط صغيرة الحجم، بينما المستند نفسه قد يكون ضخماً
+                style_names = {}
+                if 'word/styles.xml' in archive.namelist():
+                    styles = etree.fromstring(archive.read('word/styles.xml'))
+                    for style in styles.iter(f'{namespace}style'):
+                        name = style.find(f'{namespace}name')
+                        if name is not None:
+                            # نفس أسماء الأنماط التي يعرضها python-docx (مثل "Heading 1")
+                            style_names[style.get(f'{namespace}styleId')] = BabelFish.internal2ui(name.get(f'{namespace}val'))
+                
+                # نفس ما يعيده doc.paragraphs: فقرات جسم المستند المباشرة فقط (دون الجداول
+                # ومربعات النص)، ونص كل فقرة من تشغيلاتها المباشرة مع \t للجدولة و \n للفواصل
+                body_tag, run_tag = f'{namespace}body', f'{namespace}r'
+                run_text = {f'{namespace}t': None, f'{namespace}tab': '\t',
+                            f'{namespace}br': '\n', f'{namespace}cr': '\n'}
+                with archive.open('word/document.xml') as document:
+                    for _, element in etree.iterparse(document, events=('end',)):
+                        parent = element.getparent()
+                        if parent is None or parent.tag != body_tag:
+                            continue
+                        if element.tag == f'{namespace}p':
+                            text = ''.join(
+                                (node.text or '') if run_text[node.tag] is None else run_text[node.tag]
+                                for run in element.iterchildren(run_tag)
+                                for node in run.iterchildren(*run_text)
+                            )
+                            if text.strip():
+                                style = element.find(f'{namespace}pPr/{namespace}pStyle')
+                                style_id = style.get(f'{namespace}val') if style is not None else None
+                                content.append({
+                                    'type': 'paragraph',
+                                    'text': text,
+                                    'style': style_names.get(style_id, 'Normal')
+                                })
+                        # تحرير العناصر المعالجة حتى تبقى الذاكرة ثابتة مع المستندات الضخمة
+                        element.clear()
+                        while element.getprevious() is not None:
+                            del parent[0]
+                        if len(content) >= max_blocks:
+                            break
+            
             return content
         except Exception as e:
             logging.error(f"خطأ في استخراج النص من DOCX: {e}")
             return []
     
-    def extract_text_from_pdf(self, file_path: str) -> List[Dict[str, Any]]:
-        """استخراج النص من ملف PDF"""
+    def extract_text_from_pdf(self, file_path: str, max_blocks: Optional[int] = None) -> List[Dict[str, Any]]:
+        """استخراج النص من ملف PDF
+
+        max_blocks: عند تحديده يتوقف الاستخراج بعد هذا العدد من الصفحات ذات النص
+        """
         try:
+            import pdfplumber
+
             content = []
             with pdfplumber.open(file_path) as pdf:
+                if max_blocks is None:
+                    self.progress.subtask(len(pdf.pages))
                 for page_num, page in enumerate(pdf.pages):
+                    if max_blocks is not None and len(content) >= max_blocks:
+                        break
                     text = page.extract_text()
+                    if max_blocks is None:
+                        self.progress.step()
                     if text:
                         content.append({
                             'type': 'paragraph',
@@ -221,27 +1105,78 @@ class BilingualBookFormatter:
                         })
             
             return content
+        except ProcessingCancelled:
+            raise
         except Exception as e:
             logging.error(f"خطأ في استخراج النص من PDF: {e}")
             return []
     
-    def extract_text_from_epub(self, file_path: str) -> List[Dict[str, Any]]:
-        """استخراج النص من ملف EPUB"""
+    def extract_text_from_epub(self, file_path: str, max_blocks: Optional[int] = None) -> List[Dict[str, Any]]:
+        """استخراج النص من ملف EPUB
+
+        max_blocks: عند تحديده تُقرأ مستندات الكتاب الأولى فقط مباشرة من الأرشيف
+        بدلاً من تحميل الكتاب كاملاً
+        """
+        if max_blocks is not None:
+            return self._extract_epub_head(file_path, max_blocks)
         try:
+            import ebooklib
+            from ebooklib import epub
+
             book = epub.read_epub(file_path)
             content = []
             
-            for item in book.get_items():
-                if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                    # تحليل HTML وإستخراج النص
-                    from bs4 import BeautifulSoup
-                    soup = BeautifulSoup(item.get_content(), 'html.parser')
+            documents = [item for item in book.get_items() if item.get_type() == ebooklib.ITEM_DOCUMENT]
+            self.progress.subtask(len(documents))
+            for item in documents:
+                self.progress.step()
+                # تحليل HTML وإستخراج النص
+                from bs4 import BeautifulSoup
+                soup = BeautifulSoup(item.get_content(), 'html.parser')
+                text = soup.get_text()
+                if text.strip():
+                    content.append({
+                        'type': 'paragraph',
+                        'text': text,
+                        'chapter': item.get_name()
+                    })
+            
+            return content
+        except ProcessingCancelled:
+            raise
+        except Exception as e:
+            logging.error(f"خطأ في استخراج النص من EPUB: {e}")
+            return []
+    
+    def _extract_epub_head(self, file_path: str, max_blocks: int) -> List[Dict[str, Any]]:
+        """قراءة أول max_blocks مستند نصي من EPUB بترتيب البيان (manifest) نفسه
+        الذي يستخدمه الاستخراج الكامل، مع فك ضغط هذه المستندات فقط"""
+        try:
+            import posixpath
+            import zipfile
+            from lxml import etree
+            from bs4 import BeautifulSoup
+
+            content = []
+            with zipfile.ZipFile(file_path) as archive:
+                container = etree.fromstring(archive.read('META-INF/container.xml'))
+                opf_path = container.find('.//{*}rootfile').get('full-path')
+                opf_dir = posixpath.dirname(opf_path)
+                package = etree.fromstring(archive.read(opf_path))
+                
+                for item in package.iterfind('{*}manifest/{*}item'):
+                    if len(content) >= max_blocks:
+                        break
+                    if item.get('media-type') != 'application/xhtml+xml':
+                        continue
+                    href = urllib.parse.unquote(item.get('href'))
+                    soup = BeautifulSoup(archive.read(posixpath.join(opf_dir, href)), 'html.parser')
                     text = soup.get_text()
                     if text.strip():
                         content.append({
                             'type': 'paragraph',
                             'text': text,
-                            'chapter': item.get_name()
+                            'chapter': href
                         })
             
             return content
@@ -249,409 +1184,1133 @@ class BilingualBookFormatter:
             logging.error(f"خطأ في استخراج النص من EPUB: {e}")
             return []
     
-    def process_images(self, images: List[bytes]) -> List[str]:
-        """معالجة الصور وتحويلها"""
-        processed_images = []
+    def process_images(self, images: List[bytes], output_dir: Optional[str] = None) -> List[str]:
+        """معالجة الصور وتحويلها بالتوازي"""
+        return [path for path in self.process_images_indexed(images, output_dir) if path]
+    
+    def process_images_indexed(self, images: List[bytes], output_dir: Optional[str] = None) -> List[Optional[str]]:
+        """معالجة الصور مع إرجاع مسار لكل صورة بنفس ترتيب الإدخال (None عند الفشل)"""
+        image_settings = self.config.get("image_processing", {})
+        image_format = image_settings.get("format", "webp")
+        max_width = image_settings.get("max_width", 600)
+        quality = image_settings.get("quality", 85)
+        cache = self.get_image_cache()
+        suffix = f".{image_format}"
+        
+        # مجلد مؤقت خاص بكل مهمة بدلاً من مجلد العمل الحالي
+        if output_dir is None:
+            output_dir = tempfile.mkdtemp(prefix="bilingual_images_")
+        else:
+            os.makedirs(output_dir, exist_ok=True)
+        
+        results: List[Tuple[Optional[str], Optional[str]]] = [(None, None)] * len(images)
+        tasks = []
+        cache_keys = {}
         
         for i, image_data in enumerate(images):
-            try:
-                # تحويل إلى PIL Image
-                image = Image.open(io.BytesIO(image_data))
-                
-                # تحسين الصورة
-                image = ImageOps.exif_transpose(image)
-                
-                # تغيير الحجم إذا لزم الأمر
-                max_width = self.config.get("image_processing", {}).get("max_width", 600)
-                if image.width > max_width:
-                    ratio = max_width / image.width
-                    new_height = int(image.height * ratio)
-                    image = image.resize((max_width, new_height), Image.Resampling.LANCZOS)
-                
-                # حفظ الصورة
-                output_path = f"temp_image_{i}.{self.config.get('image_processing', {}).get('format', 'webp')}"
-                image.save(output_path, optimize=True, quality=85)
-                processed_images.append(output_path)
-                
-            except Exception as e:
-                logging.error(f"خطأ في معالجة الصورة {i}: {e}")
+            output_path = os.path.join(output_dir, f"image_{i}{suffix}")
+            
+            # المفتاح: بصمة الصورة الأصلية مع إعدادات المعالجة
+            if cache is not None:
+                digest = hashlib.sha256(image_data)
+                digest.update(f"|{max_width}|{image_format}|{quality}".encode('utf-8'))
+                cache_keys[i] = digest.hexdigest()
+                cached_path = cache.get(cache_keys[i], suffix)
+                if cached_path:
+                    try:
+                        shutil.copyfile(cached_path, output_path)
+                        results[i] = (output_path, None)
+                        continue
+                    except OSError:
+                        pass
+            
+            tasks.append((i, {
+                'data': image_data,
+                'output_path': output_path,
+                'max_width': max_width,
+                'format': image_format,
+                'quality': quality
+            }))
+        
+        max_workers = min(self.get_max_workers(), len(tasks))
+        task_args = [task for _, task in tasks]
+        if max_workers <= 1:
+            task_results = [process_image_task(task) for task in task_args]
+        else:
+            # map تعيد النتائج بترتيب الإدخال؛ spawn لأن الواجهة تستدعي المعالجة من خيط عامل
+            # واستنساخ (fork) عملية متعددة الخيوط قد يورث أقفالاً محجوزة
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context("spawn")) as executor:
+                task_results = list(executor.map(process_image_task, task_args))
+        
+        for (i, _), result in zip(tasks, task_results):
+            results[i] = result
+            if cache is not None and result[0]:
+                try:
+                    cache.put(cache_keys[i], result[0], suffix)
+                except OSError as e:
+                    logging.warning(f"تعذر حفظ الصورة {i} في الذاكرة المؤقتة: {e}")
+        
+        if cache is not None and tasks:
+            cache.evict()
+        
+        for i, (_, error) in enumerate(results):
+            if error:
+                logging.error(f"خطأ في معالجة الصورة {i}: {error}")
         
-        return processed_images
+        return [output_path for output_path, _ in results]
+    
+    def deduplicate_figures(self, content1: List[Dict], content2: List[Dict]) -> List[bytes]:
+        """التعرف على الأشكال المتطابقة بين النسختين عبر البصمة الإدراكية
+
+        يُسند لكل كتلة صورة مفتاح 'figure_id'، وتتشارك الصورتان المتطابقتان نفس المفتاح.
+        تُعاد بيانات الأشكال الفريدة (النسخة الأعلى دقة من كل شكل) مرتبة حسب المفتاح.
+        """
+        blocks1 = [block for block in content1 if block.get('type') == 'image']
+        blocks2 = [block for block in content2 if block.get('type') == 'image']
+        all_blocks = blocks1 + blocks2
+        if not all_blocks:
+            return []
+        
+        image_data = [block['data'] for block in all_blocks]
+        max_workers = min(self.get_max_workers(), len(image_data))
+        if max_workers <= 1:
+            fingerprints = [image_fingerprint(data) for data in image_data]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context("spawn")) as executor:
+                fingerprints = list(executor.map(image_fingerprint, image_data, chunksize=8))
+        
+        threshold = self.config.get("image_processing", {}).get("dedup_threshold", 6)
+        figures = []
+        
+        # أشكال النسخة الأولى
+        for block, (fingerprint, area) in zip(blocks1, fingerprints[:len(blocks1)]):
+            block['figure_id'] = len(figures)
+            figures.append({'hash': fingerprint, 'area': area, 'data': block['data'], 'matched': False})
+        
+        # مطابقة أشكال النسخة الثانية مع أقرب شكل غير مطابق في الأولى
+        for block, (fingerprint, area) in zip(blocks2, fingerprints[len(blocks1):]):
+            best_id = None
+            best_distance = threshold + 1
+            if fingerprint is not None:
+                for figure_id, figure in enumerate(figures):
+                    if figure['matched'] or figure['hash'] is None:
+                        continue
+                    distance = hamming_distance(fingerprint, figure['hash'])
+                    if distance < best_distance:
+                        best_id, best_distance = figure_id, distance
+            
+            if best_id is None:
+                block['figure_id'] = len(figures)
+                figures.append({'hash': fingerprint, 'area': area, 'data': block['data'], 'matched': True})
+            else:
+                figure = figures[best_id]
+                figure['matched'] = True
+                block['figure_id'] = best_id
+                if area > figure['area']:
+                    figure['data'], figure['area'] = block['data'], area
+        
+        duplicates = len(all_blocks) - len(figures)
+        if duplicates:
+            logging.info(f"تم التعرف على {duplicates} شكل مكرر بين النسختين")
+        
+        return [figure['data'] for figure in figures]
+    
+    def prepare_figures(self, content1: List[Dict], content2: List[Dict], output_dir: str):
+        """إزالة تكرار الأشكال بين النسختين ومعالجة كل شكل مرة واحدة فقط"""
+        figures = self.deduplicate_figures(content1, content2)
+        if not figures:
+            return
+        
+        processed = self.process_images_indexed(figures, output_dir)
+        for block in content1 + content2:
+            if block.get('type') == 'image' and 'figure_id' in block:
+                block['image_path'] = processed[block['figure_id']]
     
     def align_content(self, content1: List[Dict], content2: List[Dict]) -> List[Tuple[Dict, Dict]]:
         """محاذاة المحتوى بين اللغتين"""
+        return list(self.iter_aligned(content1, content2))
+    
+    @staticmethod
+    def iter_aligned(content1: List[Dict], content2: List[Dict]) -> Iterable[Tuple[Dict, Dict]]:
+        """محاذاة المحتوى بين اللغتين صفاً بعد صف (للعرض التدريجي أثناء المحاذاة)"""
         # خوارزمية بسيطة للمحاذاة - يمكن تحسينها
-        aligned = []
         min_len = min(len(content1), len(content2))
         
         for i in range(min_len):
-            aligned.append((content1[i], content2[i]))
+            yield content1[i], content2[i]
         
         # إضافة العناصر المتبقية
         if len(content1) > min_len:
             for i in range(min_len, len(content1)):
-                aligned.append((content1[i], None))
+                yield content1[i], None
         elif len(content2) > min_len:
             for i in range(min_len, len(content2)):
-                aligned.append((None, content2[i]))
+                yield None, content2[i]
+    
+    @staticmethod
+    def _is_shared_figure(content1: Optional[Dict], content2: Optional[Dict]) -> bool:
+        """هل يحتوي الصف على نفس الشكل في العمودين"""
+        return bool(
+            content1 and content2
+            and content1['type'] == 'image' and content2['type'] == 'image'
+            and content1.get('image_path')
+            and content1.get('figure_id') is not None
+            and content1.get('figure_id') == content2.get('figure_id')
+        )
+    
+    # صيغ الصور التي يستطيع python-docx تضمينها مباشرة
+    DOCX_IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff')
+    
+    @classmethod
+    def _docx_picture_path(cls, image_path: str) -> str:
+        """مسار نسخة من الشكل يقرؤها python-docx (مثلاً PNG بدلاً من WebP)
+
+        تُنشأ النسخة مرة واحدة بجانب الشكل المعالج وتُعاد في الصفوف التالية.
+        """
+        if Path(image_path).suffix.lower() in cls.DOCX_IMAGE_SUFFIXES:
+            return image_path
+        png_path = str(Path(image_path).with_suffix('.png'))
+        if not os.path.exists(png_path):
+            from PIL import Image
+            
+            with Image.open(image_path) as image:
+                image.save(png_path, optimize=True)
+        return png_path
+    
+    def _add_docx_picture(self, cell, image_path: str, width: int):
+        """إدراج صورة داخل خلية جدول DOCX"""
+        try:
+            picture_path = self._docx_picture_path(image_path)
+            cell.paragraphs[0].add_run().add_picture(picture_path, width=width)
+        except Exception as e:
+            logging.warning(f"تعذر إدراج الصورة {os.path.basename(image_path)} في DOCX: {type(e).__name__} {e}")
+    
+    @staticmethod
+    def _mark_machine_translated(cell):
+        """تمييز النص المترجم آلياً (مائل ورمادي)"""
+        from docx.shared import RGBColor
+        
+        for paragraph in cell.paragraphs:
+            for run in paragraph.runs:
+                run.italic = True
+                run.font.color.rgb = RGBColor(0x55, 0x55, 0x55)
+    
+    def fill_alignment_gaps(self, aligned_content: List[Tuple]) -> List[Tuple]:
+        """ملء الخلايا الفارغة في الصفوف أحادية الجانب بترجمة آلية مجمّعة
+
+        تُترجم فقط الصفوف (محتوى، None) و(None، محتوى)، وتُميز النتيجة بـ machine_translated.
+        """
+        translation_settings = self.config.get("translation", {})
+        lang1 = translation_settings.get("lang1", "EN").upper()
+        lang2 = translation_settings.get("lang2", "AR").upper()
+        
+        # الفهارس حسب اتجاه الترجمة: (لغة المصدر، لغة الهدف، رقم العمود الفارغ)
+        directions = {
+            (lang1, lang2, 1): [i for i, (c1, c2) in enumerate(aligned_content)
+                                if c2 is None and c1 and c1['type'] == 'paragraph'],
+            (lang2, lang1, 0): [i for i, (c1, c2) in enumerate(aligned_content)
+                                if c1 is None and c2 and c2['type'] == 'paragraph'],
+        }
+        if not any(directions.values()):
+            return aligned_content
+        
+        if not self.get_deepl_translator():
+            logging.warning("ملء الفجوات بالترجمة الآلية يتطلب مترجم DeepL مهيأ")
+            return aligned_content
+        
+        filled = list(aligned_content)
+        for (source_lang, target_lang, empty_column), indices in directions.items():
+            if not indices:
+                continue
+            source_column = 1 - empty_column
+            texts = [aligned_content[i][source_column]['text'] for i in indices]
+            try:
+                translated = self.translate_texts(
+                    texts, self._deepl_target_lang(target_lang), source_lang.split('-')[0]
+                )
+            except Exception as e:
+                logging.error(f"فشل في ترجمة الفجوات ({source_lang} → {target_lang}): {e}")
+                continue
+            
+            for i, text in zip(indices, translated):
+                block = {'type': 'paragraph', 'text': text, 'machine_translated': True}
+                row = list(filled[i])
+                row[empty_column] = block
+                filled[i] = tuple(row)
+            logging.info(f"تمت ترجمة {len(indices)} صف غير مطابق آلياً ({source_lang} → {target_lang})")
+        
+        return filled
+    
+    @staticmethod
+    def _deepl_target_lang(lang: str) -> str:
+        """DeepL يتطلب متغيراً إقليمياً لبعض لغات الهدف"""
+        return {'EN': 'EN-US', 'PT': 'PT-PT'}.get(lang, lang)
+    
+    def _new_docx_document(self):
+        """إنشاء مستند DOCX بجدول ثنائي العمود، ويعيد (المستند، الجدول، عرض الصور المتاح)"""
+        from docx import Document
+        from docx.shared import Inches
+        
+        doc = Document()
+        
+        # إعداد الهوامش
+        sections = doc.sections
+        for section in sections:
+            section.top_margin = Inches(self.config["page_margins"]["top"])
+            section.bottom_margin = Inches(self.config["page_margins"]["bottom"])
+            section.left_margin = Inches(self.config["page_margins"]["left"])
+            section.right_margin = Inches(self.config["page_margins"]["right"])
         
-        return aligned
+        # عرض الصفحة المتاح للصور
+        section = sections[-1]
+        usable_width = section.page_width - section.left_margin - section.right_margin
+        
+        # إنشاء جدول بعمودين
+        table = doc.add_table(rows=0, cols=2)
+        table.style = 'Table Grid'
+        
+        return doc, table, usable_width
+    
+    def _add_docx_rows(self, table, aligned_content: List[Tuple], usable_width: int):
+        """إضافة صفوف محاذاة إلى جدول DOCX (يمكن استدعاؤها تدريجياً لكل قسم)"""
+        from docx.enum.text import WD_ALIGN_PARAGRAPH
+        
+        for content1, content2 in aligned_content:
+            row = table.add_row()
+            
+            # الشكل المشترك بين النسختين يوضع مرة واحدة على عرض الصف
+            if self._is_shared_figure(content1, content2):
+                cell = row.cells[0].merge(row.cells[1])
+                self._add_docx_picture(cell, content1['image_path'], usable_width)
+                cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+                continue
+            
+            # العمود الأول (اللغة الأولى)
+            if content1:
+                if content1['type'] == 'paragraph':
+                    row.cells[0].text = content1['text']
+                    if content1.get('machine_translated'):
+                        self._mark_machine_translated(row.cells[0])
+                elif content1['type'] == 'image' and content1.get('image_path'):
+                    self._add_docx_picture(row.cells[0], content1['image_path'], usable_width // 2)
+            
+            # العمود الثاني (اللغة الثانية)
+            if content2:
+                if content2['type'] == 'paragraph':
+                    row.cells[1].text = content2['text']
+                    if content2.get('machine_translated'):
+                        self._mark_machine_translated(row.cells[1])
+                    # تطبيق محاذاة RTL إذا لزم الأمر
+                    for paragraph in row.cells[1].paragraphs:
+                        paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+                elif content2['type'] == 'image' and content2.get('image_path'):
+                    self._add_docx_picture(row.cells[1], content2['image_path'], usable_width // 2)
     
     def create_docx_output(self, aligned_content: List[Tuple], output_path: str):
         """إنشاء مخرجات DOCX"""
         try:
-            doc = Document()
-            
-            # إعداد الهوامش
-            sections = doc.sections
-            for section in sections:
-                section.top_margin = Inches(self.config["page_margins"]["top"])
-                section.bottom_margin = Inches(self.config["page_margins"]["bottom"])
-                section.left_margin = Inches(self.config["page_margins"]["left"])
-                section.right_margin = Inches(self.config["page_margins"]["right"])
-            
-            # إنشاء جدول بعمودين
-            table = doc.add_table(rows=0, cols=2)
-            table.style = 'Table Grid'
-            
-            for content1, content2 in aligned_content:
-                row = table.add_row()
-                
-                # العمود الأول (اللغة الأولى)
-                if content1:
-                    if content1['type'] == 'paragraph':
-                        row.cells[0].text = content1['text']
-                
-                # العمود الثاني (اللغة الثانية)
-                if content2:
-                    if content2['type'] == 'paragraph':
-                        row.cells[1].text = content2['text']
-                        # تطبيق محاذاة RTL إذا لزم الأمر
-                        for paragraph in row.cells[1].paragraphs:
-                            paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-            
+            doc, table, usable_width = self._new_docx_document()
+            self._add_docx_rows(table, aligned_content, usable_width)
             doc.save(output_path)
             logging.info(f"تم حفظ ملف DOCX: {output_path}")
             
         except Exception as e:
             logging.error(f"خطأ في إنشاء ملف DOCX: {e}")
     
+    def split_into_chapters(self, aligned_content: List[Tuple]) -> List[Dict[str, Any]]:
+        """تقسيم المحتوى المحاذى إلى فصول مستقلة لكتاب EPUB"""
+        return list(self.iter_chapters(aligned_content))
+    
+    def iter_chapters(self, aligned_content: Iterable[Tuple]) -> Iterable[Dict[str, Any]]:
+        """تقسيم المحتوى المحاذى إلى فصول، ويُعاد كل فصل فور اكتماله"""
+        rows_per_chapter = max(1, self.config.get("epub", {}).get("rows_per_chapter", 200))
+        count = 0
+        current = None
+        
+        for content1, content2 in aligned_content:
+            style = (content1 or content2 or {}).get('style', '')
+            starts_heading = style.startswith(('Heading', 'Title'))
+            
+            # بدء فصل جديد عند العناوين أو عند امتلاء الفصل الحالي
+            if current is None or len(current['rows']) >= rows_per_chapter or (starts_heading and current['rows']):
+                if current is not None:
+                    yield current
+                count += 1
+                current = {'title': f"Chapter {count}", 'rows': []}
+                if starts_heading:
+                    current['title'] = (content1 or content2).get('text', current['title']).strip()
+            
+            current['rows'].append((content1, content2))
+        
+        if current is not None:
+            yield current
+    
+    @staticmethod
+    def _epub_image_href(block: Optional[Dict]) -> str:
+        """مسار الشكل داخل كتاب EPUB (شكل واحد لكل figure_id)"""
+        if not block or block['type'] != 'image' or not block.get('image_path'):
+            return ''
+        return f"images/figure_{block['figure_id']}{Path(block['image_path']).suffix}"
+    
+    def _epub_cell(self, block: Optional[Dict]) -> Tuple[str, str, bool]:
+        """تحويل كتلة محتوى إلى خلية (نص، صورة، مترجمة آلياً) لعارض الفصول"""
+        if not block:
+            return '', '', False
+        text = block['text'] if block['type'] == 'paragraph' else ''
+        return text, self._epub_image_href(block), bool(block.get('machine_translated'))
+    
+    def _chapter_payload(self, chapter: Dict[str, Any]) -> Dict[str, Any]:
+        """تمرير النصوص ومسارات الصور فقط إلى العمليات لتقليل كلفة النقل"""
+        return {
+            'title': chapter['title'],
+            'lang': 'en',
+            'rows': [
+                (self._epub_cell(content1), self._epub_cell(content2))
+                for content1, content2 in chapter['rows']
+            ]
+        }
+    
+    def render_epub_chapters(self, chapters: List[Dict[str, Any]]) -> List[bytes]:
+        """عرض فصول EPUB بالتوازي مع الحفاظ على ترتيب العمود الفقري"""
+        payloads = [self._chapter_payload(chapter) for chapter in chapters]
+        
+        max_workers = min(self.get_max_workers(), len(payloads))
+        if max_workers <= 1:
+            return [render_chapter_xhtml(payload) for payload in payloads]
+        
+        # map تعيد النتائج بترتيب الإدخال
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context("spawn")) as executor:
+            return list(executor.map(render_chapter_xhtml, payloads))
+    
     def create_epub_output(self, aligned_content: List[Tuple], output_path: str):
         """إنشاء مخرجات EPUB"""
         try:
-            book = epub.EpubBook()
-            book.set_identifier('bilingual_book')
-            book.set_title('Bilingual Book')
-            book.set_language('en')
-            book.add_author('Bilingual Book Formatter')
-            
-            # إنشاء فصل
-            chapter = epub.EpubHtml(title='Chapter 1', file_name='chap_01.xhtml', lang='en')
-            
-            html_content = '''
-            <html>
-            <head>
-                <title>Bilingual Book</title>
-                <style>
-                    .bilingual-container { display: flex; }
-                    .lang1 { flex: 1; padding: 10px; }
-                    .lang2 { flex: 1; padding: 10px; text-align: right; }
-                </style>
-            </head>
-            <body>
-            '''
-            
-            for content1, content2 in aligned_content:
-                html_content += '<div class="bilingual-container">'
-                
-                if content1 and content1['type'] == 'paragraph':
-                    html_content += f'<div class="lang1">{content1["text"]}</div>'
-                else:
-                    html_content += '<div class="lang1"></div>'
-                
-                if content2 and content2['type'] == 'paragraph':
-                    html_content += f'<div class="lang2">{content2["text"]}</div>'
-                else:
-                    html_content += '<div class="lang2"></div>'
-                
-                html_content += '</div>'
-            
-            html_content += '</body></html>'
+            # تقسيم المحتوى إلى فصول وعرضها بالتوازي
+            chapters = self.split_into_chapters(aligned_content)
+            rendered = self.render_epub_chapters(chapters)
+            self._write_epub(chapters, rendered, output_path)
             
-            chapter.content = html_content
-            book.add_item(chapter)
+        except Exception as e:
+            logging.error(f"خطأ في إنشاء ملف EPUB: {e}")
+    
+    def _write_epub(self, chapters: List[Dict[str, Any]], rendered: List[bytes], output_path: str):
+        """تجميع الفصول المعروضة والأشكال في ملف EPUB"""
+        from ebooklib import epub
+        
+        book = epub.EpubBook()
+        book.set_identifier('bilingual_book')
+        book.set_title('Bilingual Book')
+        book.set_language('en')
+        book.add_author('Bilingual Book Formatter')
+        
+        # إضافة الفصول الجاهزة بترتيب العمود الفقري حتى تُكتب بنفس الترتيب في الأرشيف
+        spine_items = []
+        toc = []
+        for index, (chapter, xhtml) in enumerate(zip(chapters, rendered), start=1):
+            file_name = f'chap_{index:02d}.xhtml'
+            item = epub.EpubItem(
+                uid=f'chapter_{index}',
+                file_name=file_name,
+                media_type='application/xhtml+xml',
+                content=xhtml
+            )
+            book.add_item(item)
+            spine_items.append(item)
+            toc.append(epub.Link(file_name, chapter['title'], f'chapter_{index}'))
+        
+        # إضافة كل شكل مرة واحدة فقط مهما تكرر في العمودين
+        added_images = set()
+        for chapter in chapters:
+            for content1, content2 in chapter['rows']:
+                for block in (content1, content2):
+                    href = self._epub_image_href(block)
+                    if href and href not in added_images:
+                        added_images.add(href)
+                        suffix = Path(href).suffix.lower()
+                        with open(block['image_path'], 'rb') as f:
+                            book.add_item(epub.EpubImage(
+                                uid=f"figure_{block['figure_id']}",
+                                file_name=href,
+                                media_type='image/jpeg' if suffix in ('.jpg', '.jpeg') else f'image/{suffix[1:]}',
+                                content=f.read()
+                            ))
+        
+        # إضافة فهرس
+        book.toc = tuple(toc)
+        book.add_item(epub.EpubNcx())
+        book.add_item(epub.EpubNav())
+        book.spine = ['nav'] + spine_items
+        
+        # كتابة الكتاب
+        epub.write_epub(output_path, book)
+        logging.info(f"تم حفظ ملف EPUB: {output_path} ({len(chapters)} فصل)")
+    
+    def _translate_sections(self, sections: List[Dict[str, Any]], ready: "queue.Queue",
+                            stop: threading.Event):
+        """مرحلة الترجمة: تملأ فجوات الأقسام وتمررها إلى العرض بالترتيب
+
+        الأقسام المتتالية تُجمع في نوافذ (انظر _translation_windows) وتُترجم فجوات كل
+        نافذة بطلب مجمّع واحد لكل اتجاه، ثم تُعاد الصفوف إلى أقسامها.
+        """
+        
+        def put(item) -> bool:
+            # انتظار مساحة في الطابور المحدود مع الاستجابة لتوقف المستهلك
+            while not stop.is_set():
+                try:
+                    ready.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        in_flight = max(1, self.config.get("pipeline", {}).get("sections_in_flight", 2))
+        executor = ThreadPoolExecutor(max_workers=in_flight)
+        futures = [executor.submit(self._fill_window_gaps, window) for window in self._translation_windows(sections)]
+        try:
+            for future in futures:
+                for section in future.result():
+                    if not put(section):
+                        return
+            put(None)
+        except Exception as e:
+            put(e)
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+    
+    def _translation_windows(self, sections: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """تجميع الأقسام المتتالية في نوافذ ترجمة
+
+        تُغلق النافذة عندما تبلغ فجواتها ما يكفي لملء طلبات BatchTranslator المتزامنة
+        (batch_max_texts × max_concurrency)، فيبقى عدد طلبات DeepL أقل ما يمكن
+        مع بدء عرض النوافذ الأولى قبل ترجمة الكتاب كاملاً.
+        """
+        translation_settings = self.config.get("translation", {})
+        window_texts = max(1, translation_settings.get("batch_max_texts", BatchTranslator.MAX_TEXTS_PER_REQUEST) *
+                           translation_settings.get("max_concurrency", 4))
+        windows = []
+        current = []
+        gaps = 0
+        for section in sections:
+            current.append(section)
+            gaps += sum(1 for content1, content2 in section['rows'] if (content1 is None) != (content2 is None))
+            if gaps >= window_texts:
+                windows.append(current)
+                current, gaps = [], 0
+        if current:
+            windows.append(current)
+        return windows
+    
+    def _fill_window_gaps(self, window: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """ترجمة فجوات جميع أقسام النافذة معاً ثم توزيع الصفوف على أقسامها"""
+        filled = self.fill_alignment_gaps([row for section in window for row in section['rows']])
+        start = 0
+        for section in window:
+            end = start + len(section['rows'])
+            section['rows'] = filled[start:end]
+            start = end
+        return window
+    
+    @contextmanager
+    def stage_timer(self, stage: str):
+        """قياس زمن مرحلة وإضافته إلى stage_timings (يتراكم إذا تكررت المرحلة)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._stage_timings_lock:
+                self.stage_timings[stage] = self.stage_timings.get(stage, 0.0) + elapsed
+            logging.debug(f"المرحلة {stage}: {elapsed:.3f} ثانية")
+    
+    def get_output_formats(self, formats: Optional[Iterable[str]] = None) -> set:
+        """التنسيقات المطلوب إنتاجها؛ عند عدم تحديدها تُقرأ من الإعدادات"""
+        if formats is None:
+            formats = [name for name, key in (("docx", "export_pdf"), ("epub", "export_epub"))
+                       if self.config.get(key, True)]
+        formats = {name.lower() for name in formats}
+        unsupported = formats - set(OUTPUT_FORMATS)
+        if unsupported:
+            raise ValueError(f"تنسيق إخراج غير مدعوم: {', '.join(sorted(unsupported))}")
+        return formats
+    
+    def render_pipeline(self, aligned_content: List[Tuple], output_base: str,
+                        formats: Optional[Iterable[str]] = None):
+        """خط معالجة متداخل: الترجمة تعمل في الخلفية بينما تُعرض الأقسام المكتملة
+
+        الأقسام تنتقل من مرحلة الترجمة إلى مرحلة العرض عبر طابور محدود،
+        فيتحدد الزمن الكلي بأبطأ مرحلة وليس بمجموع المراحل.
+        لا يُشغّل إلا عارض التنسيقات المطلوبة في formats.
+        """
+        formats = self.get_output_formats(formats)
+        export_docx = "docx" in formats
+        export_epub = "epub" in formats
+        sections = self.split_into_chapters(aligned_content)
+        self.progress.stage('render', len(aligned_content))
+        
+        docx_document = docx_table = None
+        usable_width = 0
+        if export_docx:
+            try:
+                docx_document, docx_table, usable_width = self._new_docx_document()
+            except Exception as e:
+                logging.error(f"خطأ في إنشاء ملف DOCX: {e}")
+        # مجمع "spawn" لأن خيوط الترجمة قد تعمل أثناء إنشاء العمليات، ونسخ عملية
+        # متعددة الخيوط بـ fork قد يورث أقفالاً محجوزة
+        max_workers = min(self.get_max_workers(), len(sections))
+        executor = None
+        if export_epub and max_workers > 1:
+            executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context("spawn"))
+        rendered_chapters = []
+        completed_sections = []
+        
+        # بدون ترجمة تنتقل الأقسام مباشرة إلى العرض
+        ready: "queue.Queue" = queue.Queue(maxsize=max(1, self.config.get("pipeline", {}).get("queue_size", 4)))
+        stop = threading.Event()
+        producer = None
+        
+        try:
+            if self.config.get("translation", {}).get("fill_gaps", False):
+                # الخدمات المشتركة تُنشأ قبل أن تطلبها نوافذ الترجمة المتوازية
+                self.get_deepl_translator()
+                self.get_translation_memory()
+                self.get_rate_limiter()
+                producer = threading.Thread(target=self._translate_sections, args=(sections, ready, stop), daemon=True)
+                producer.start()
             
-            # إضافة فهرس
-            book.toc = (epub.Link("chap_01.xhtml", "Chapter 1", "intro"),)
-            book.add_item(epub.EpubNcx())
-            book.add_item(epub.EpubNav())
+            pending_sections = iter(sections)
+            while True:
+                section = ready.get() if producer else next(pending_sections, None)
+                if section is None:
+                    break
+                if isinstance(section, Exception):
+                    raise section
+                completed_sections.append(section)
+                
+                # عرض القسم فور اكتماله؛ فشل أحد التنسيقين يُسجل ولا يوقف الآخر
+                if docx_document:
+                    try:
+                        with self.stage_timer('render_docx'):
+                            self._add_docx_rows(docx_table, section['rows'], usable_width)
+                    except Exception as e:
+                        logging.error(f"خطأ في إنشاء ملف DOCX: {e}")
+                        docx_document = None
+                if export_epub:
+                    try:
+                        with self.stage_timer('render_epub'):
+                            payload = self._chapter_payload(section)
+                            if executor:
+                                rendered_chapters.append(executor.submit(render_chapter_xhtml, payload))
+                            else:
+                                rendered_chapters.append(render_chapter_xhtml(payload))
+                    except Exception as e:
+                        logging.error(f"خطأ في إنشاء ملف EPUB: {e}")
+                        export_epub = False
+                self.progress.advance(len(section['rows']))
             
-            # كتابة الكتاب
-            epub.write_epub(output_path, book)
-            logging.info(f"تم حفظ ملف EPUB: {output_path}")
+            if docx_document:
+                try:
+                    with self.stage_timer('render_docx'):
+                        docx_document.save(f"{output_base}.docx")
+                    logging.info(f"تم حفظ ملف DOCX: {output_base}.docx")
+                except Exception as e:
+                    logging.error(f"خطأ في إنشاء ملف DOCX: {e}")
             
-        except Exception as e:
-            logging.error(f"خطأ في إنشاء ملف EPUB: {e}")
+            if export_epub:
+                try:
+                    with self.stage_timer('render_epub'):
+                        rendered = [chapter.result() if executor else chapter for chapter in rendered_chapters]
+                        self._write_epub(completed_sections, rendered, f"{output_base}.epub")
+                except Exception as e:
+                    logging.error(f"خطأ في إنشاء ملف EPUB: {e}")
+        finally:
+            stop.set()
+            if executor:
+                for chapter in rendered_chapters:
+                    chapter.cancel()
+                executor.shutdown()
+            if producer:
+                producer.join()
     
-    def process_books(self, lang1_path: str, lang2_path: str, output_base: str):
-        """معالجة الكتب الرئيسية"""
+    def process_books(self, lang1_path: str, lang2_path: str, output_base: str,
+                      formats: Optional[Iterable[str]] = None,
+                      progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                      cancel_event: Optional[threading.Event] = None):
+        """معالجة الكتب الرئيسية
+
+        formats: التنسيقات المطلوبة مثل ("docx",)؛ None يعني حسب الإعدادات
+        progress_callback: تُستدعى بأحداث التقدم (انظر ProgressTracker)
+        cancel_event: عند ضبطه من خيط آخر تتوقف المعالجة عند أقرب نقطة تقدم
+        برفع ProcessingCancelled دون حفظ المخرجات
+        """
+        images_dir = None
+        self.job_translation_usage = TranslationUsage()
+        self.progress = ProgressTracker(progress_callback, cancel_event)
+        self.stage_timings = {}
         try:
+            formats = self.get_output_formats(formats)
             logging.info(f"بدء معالجة {lang1_path} و {lang2_path}")
             
             # استخراج المحتوى
-            content1 = self.extract_content(lang1_path)
-            content2 = self.extract_content(lang2_path)
+            self.progress.stage('extract', 2)
+            with self.stage_timer('extract'):
+                content1 = self.extract_content(lang1_path)
+                self.progress.advance()
+                content2 = self.extract_content(lang2_path)
+                self.progress.advance()
             
             if not content1 or not content2:
                 raise ValueError("فشل في استخراج المحتوى من أحد الملفات")
             
+            # معالجة الصور مرة واحدة لكل شكل مشترك بين النسختين
+            if self.config.get("image_processing", {}).get("enable", True):
+                self.progress.stage('images', 1)
+                images_dir = tempfile.mkdtemp(prefix="bilingual_images_")
+                with self.stage_timer('images'):
+                    self.prepare_figures(content1, content2, images_dir)
+                self.progress.advance()
+            
             # محاذاة المحتوى
-            aligned_content = self.align_content(content1, content2)
+            self.progress.stage('align', 1)
+            with self.stage_timer('align'):
+                aligned_content = self.align_content(content1, content2)
+            self.progress.advance()
             
-            # إنشاء المخرجات
-            if self.config.get("export_pdf", True):
-                self.create_docx_output(aligned_content, f"{output_base}.docx")
+            # إنشاء المخرجات مع ترجمة الفجوات (عند الطلب) بالتوازي مع العرض
+            self.render_pipeline(aligned_content, output_base, formats)
             
-            if self.config.get("export_epub", True):
-                self.create_epub_output(aligned_content, f"{output_base}.epub")
+            usage = self.job_translation_usage.snapshot()
+            if usage['requests']:
+                logging.info(
+                    f"استهلاك الترجمة: {usage['characters']} حرف في {usage['requests']} طلب "
+                    f"({usage['throttled']} مرة تقييد)"
+                )
             
+            self.progress.finish()
             logging.info("تمت المعالجة بنجاح")
             
+        except ProcessingCancelled:
+            logging.info(f"تم إلغاء معالجة {lang1_path} و {lang2_path}")
+            raise
         except Exception as e:
             logging.error(f"خطأ في معالجة الكتب: {e}")
             raise
+        finally:
+            if images_dir:
+                shutil.rmtree(images_dir, ignore_errors=True)
     
-    def extract_content(self, file_path: str) -> List[Dict[str, Any]]:
-        """استخراج المحتوى حسب نوع الملف"""
+    def extract_content(self, file_path: str, max_blocks: Optional[int] = None) -> List[Dict[str, Any]]:
+        """استخراج المحتوى حسب نوع الملف
+
+        max_blocks: حد أعلى لعدد الكتل المستخرجة (للمعاينة)؛ يتوقف التحليل
+        مبكراً بدلاً من استخراج الكتاب كاملاً ثم اقتطاعه
+        """
         file_ext = Path(file_path).suffix.lower()
         
         if file_ext == '.docx':
-            return self.extract_text_from_docx(file_path)
+            return self.extract_text_from_docx(file_path, max_blocks)
         elif file_ext == '.pdf':
-            return self.extract_text_from_pdf(file_path)
+            return self.extract_text_from_pdf(file_path, max_blocks)
         elif file_ext == '.epub':
-            return self.extract_text_from_epub(file_path)
+            return self.extract_text_from_epub(file_path, max_blocks)
         else:
             raise ValueError(f"نوع ملف غير مدعوم: {file_ext}")
     
-    def upload_to_drive(self, file_path: str) -> str:
-        """رفع ملف إلى Google Drive"""
-        if not self.drive_service:
-            raise ValueError("خدمة Google Drive غير مهيأة")
-        
-        try:
-            file_metadata = {'name': os.path.basename(file_path)}
-            media = MediaFileUpload(file_path)
-            
-            file = self.drive_service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id'
-            ).execute()
-            
-            logging.info(f"تم رفع الملف إلى Google Drive: {file.get('id')}")
-            return file.get('id')
-            
-        except Exception as e:
-            logging.error(f"خطأ في رفع الملف إلى Google Drive: {e}")
-            raise
+    def _new_drive_http(self):
+        """اتصال HTTP مستقل لكل خيط رفع (httplib2 غير آمن بين الخيوط)
 
-
-class BilingualBookFormatterGUI(QMainWindow):
-    """واجهة رسومية لمعالج الكتب ثنائية اللغة"""
+        المهلة تضمن اكتشاف الاتصالات المعلقة على الروابط المتقطعة ثم استئناف الرفع.
+        """
+        import httplib2
+        
+        http = httplib2.Http(timeout=self.config.get("drive", {}).get("timeout", 60))
+        # رد 308 في الرفع القابل للاستئناف ليس إعادة توجيه (كما في build_http)
+        http.redirect_codes = http.redirect_codes - {308}
+        if self.drive_credentials is None:
+            return http
+        import google_auth_httplib2
+        return google_auth_httplib2.AuthorizedHttp(self.drive_credentials, http=http)
     
-    def __init__(self):
-        super().__init__()
-        self.formatter = BilingualBookFormatter()
-        self.init_ui()
+    @staticmethod
+    def file_md5(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+        """بصمة MD5 للملف (نفس md5Checksum الذي يحسبه Drive)"""
+        digest = hashlib.md5()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
     
-    def init_ui(self):
-        """تهيئة الواجهة الرسومية"""
-        self.setWindowTitle("Bilingual Book Formatter v2.3")
-        self.setGeometry(100, 100, 1000, 700)
-        
-        # الأدوات الرئيسية
-        central_widget = QWidget()
-        self.setCentralWidget(central_widget)
-        
-        # التخطيط الرئيسي
-        main_layout = QVBoxLayout(central_widget)
-        
-        # شريط علوي للملفات
-        file_layout = QHBoxLayout()
-        
-        # اختيار الملف الأول
-        self.lang1_label = QLabel("الملف الأول:")
-        self.lang1_path = QLabel("لم يتم اختيار ملف")
-        self.lang1_button = QPushButton("اختيار ملف")
-        self.lang1_button.clicked.connect(self.select_lang1_file)
-        
-        file_layout.addWidget(self.lang1_label)
-        file_layout.addWidget(self.lang1_path)
-        file_layout.addWidget(self.lang1_button)
-        
-        # اختيار الملف الثاني
-        self.lang2_label = QLabel("الملف الثاني:")
-        self.lang2_path = QLabel("لم يتم اختيار ملف")
-        self.lang2_button = QPushButton("اختيار ملف")
-        self.lang2_button.clicked.connect(self.select_lang2_file)
-        
-        file_layout.addWidget(self.lang2_label)
-        file_layout.addWidget(self.lang2_path)
-        file_layout.addWidget(self.lang2_button)
-        
-        main_layout.addLayout(file_layout)
-        
-        # إعدادات المعالجة
-        settings_group = QGroupBox("إعدادات المعالجة")
-        settings_layout = QGridLayout(settings_group)
-        
-        # تنسيق الإخراج
-        settings_layout.addWidget(QLabel("تنسيق الإخراج:"), 0, 0)
-        self.output_format = QComboBox()
-        self.output_format.addItems(["DOCX", "EPUB", "كلاهما"])
-        settings_layout.addWidget(self.output_format, 0, 1)
-        
-        # معالجة الصور
-        self.process_images_cb = QCheckBox("معالجة الصور")
-        self.process_images_cb.setChecked(True)
-        settings_layout.addWidget(self.process_images_cb, 1, 0)
-        
-        # رفع إلى Google Drive
-        self.upload_drive_cb = QCheckBox("رفع إلى Google Drive")
-        settings_layout.addWidget(self.upload_drive_cb, 1, 1)
-        
-        main_layout.addWidget(settings_group)
-        
-        # منطقة المعاينة
-        preview_group = QGroupBox("معاينة المحتوى")
-        preview_layout = QVBoxLayout(preview_group)
-        
-        self.preview_text = QTextEdit()
-        self.preview_text.setReadOnly(True)
-        preview_layout.addWidget(self.preview_text)
-        
-        main_layout.addWidget(preview_group)
-        
-        # شريط التقدم
-        self.progress_bar = QProgressBar()
-        self.progress_bar.setVisible(False)
-        main_layout.addWidget(self.progress_bar)
-        
-        # أزرار التحكم
-        button_layout = QHBoxLayout()
-        
-        self.preview_button = QPushButton("معاينة")
-        self.preview_button.clicked.connect(self.preview_content)
-        button_layout.addWidget(self.preview_button)
-        
-        self.process_button = QPushButton("معالجة")
-        self.process_button.clicked.connect(self.process_files)
-        button_layout.addWidget(self.process_button)
+    def list_drive_checksums(self, folder_id: Optional[str] = None, http=None) -> Dict[str, str]:
+        """بصمات MD5 للملفات الموجودة في مجلد Drive الهدف: {md5: معرف الملف}"""
+        drive_service = self.get_drive_service()
+        query = f"'{folder_id or 'root'}' in parents and trashed = false"
+        checksums = {}
+        page_token = None
+        while True:
+            response = drive_service.files().list(
+                q=query,
+                fields='nextPageToken, files(id, md5Checksum)',
+                pageSize=1000,
+                pageToken=page_token
+            ).execute(http=http or self._new_drive_http())
+            for file in response.get('files', []):
+                if file.get('md5Checksum'):
+                    checksums.setdefault(file['md5Checksum'], file['id'])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return checksums
+    
+    def _upload_resumable(self, file_path: str, folder_id: Optional[str], http) -> str:
+        """رفع ملف بكتل عبر جلسة رفع قابلة للاستئناف
+
+        عند انقطاع الاتصال أو خطأ مؤقت (5xx/429) يُسأل الخادم عن آخر بايت استلمه
+        ويُستأنف الرفع منه بدلاً من إعادة الملف كاملاً.
+        """
+        from googleapiclient.errors import HttpError
+        from googleapiclient.http import MediaFileUpload
         
-        self.clear_button = QPushButton("مسح")
-        self.clear_button.clicked.connect(self.clear_all)
-        button_layout.addWidget(self.clear_button)
+        drive_settings = self.config.get("drive", {})
+        # حجم الكتلة يجب أن يكون من مضاعفات 256 كيلوبايت
+        chunk_size = max(1, int(drive_settings.get("chunk_size_mb", 8) * 4)) * 256 * 1024
+        max_retries = drive_settings.get("max_retries", 5)
+        retry_backoff = drive_settings.get("retry_backoff", 1.0)
         
-        main_layout.addLayout(button_layout)
+        metadata = {'name': os.path.basename(file_path)}
+        if folder_id:
+            metadata['parents'] = [folder_id]
+        request = self.get_drive_service().files().create(
+            body=metadata,
+            media_body=MediaFileUpload(file_path, chunksize=chunk_size, resumable=True),
+            fields='id, md5Checksum'
+        )
         
-        # متغيرات الملفات
-        self.lang1_file_path = None
-        self.lang2_file_path = None
+        response = None
+        attempt = 0
+        while response is None:
+            try:
+                _, response = request.next_chunk(http=http)
+                attempt = 0
+            except (HttpError, OSError, ConnectionError) as e:
+                status = getattr(getattr(e, 'resp', None), 'status', None)
+                if isinstance(e, HttpError) and status not in (429, 500, 502, 503, 504):
+                    raise
+                attempt += 1
+                if attempt > max_retries:
+                    raise
+                logging.warning(f"انقطع رفع {metadata['name']} ({e})، استئناف المحاولة {attempt}")
+                time.sleep(retry_backoff * 2 ** (attempt - 1))
+        return response['id']
     
-    def select_lang1_file(self):
-        """اختيار الملف الأول"""
-        file_path, _ = QFileDialog.getOpenFileName(
-            self, "اختيار الملف الأول", "",
-            "المستندات المدعومة (*.docx *.pdf *.epub);;جميع الملفات (*)"
-        )
-        if file_path:
-            self.lang1_file_path = file_path
-            self.lang1_path.setText(os.path.basename(file_path))
-    
-    def select_lang2_file(self):
-        """اختيار الملف الثاني"""
-        file_path, _ = QFileDialog.getOpenFileName(
-            self, "اختيار الملف الثاني", "",
-            "المستندات المدعومة (*.docx *.pdf *.epub);;جميع الملفات (*)"
-        )
-        if file_path:
-            self.lang2_file_path = file_path
-            self.lang2_path.setText(os.path.basename(file_path))
-    
-    def preview_content(self):
-        """معاينة المحتوى"""
-        if not self.lang1_file_path or not self.lang2_file_path:
-            QMessageBox.warning(self, "تحذير", "يرجى اختيار كلا الملفين أولاً")
-            return
+    def upload_to_drive(self, file_path: str, folder_id: Optional[str] = None,
+                        existing_checksums: Optional[Dict[str, str]] = None) -> str:
+        """رفع ملف إلى Google Drive
+
+        يُتخطى الرفع إذا وُجد في المجلد الهدف ملف بنفس بصمة MD5، ويُعاد معرفه.
+        """
+        drive_service = self.get_drive_service()
+        if not drive_service:
+            raise ValueError(f"خدمة Google Drive غير مهيأة: {self.drive_init_error or 'سبب غير معروف'}")
         
+        folder_id = folder_id or self.config.get("drive", {}).get("folder_id") or None
         try:
-            # استخراج عينة من المحتوى
-            content1 = self.formatter.extract_content(self.lang1_file_path)[:5]  # أول 5 فقرات
-            content2 = self.formatter.extract_content(self.lang2_file_path)[:5]
-            
-            preview_text = "معاينة المحتوى:\n\n"
-            
-            for i, (c1, c2) in enumerate(zip(content1, content2)):
-                preview_text += f"--- الفقرة {i+1} ---\n"
-                if c1 and c1['type'] == 'paragraph':
-                    preview_text += f"الملف الأول: {c1['text'][:100]}...\n"
-                if c2 and c2['type'] == 'paragraph':
-                    preview_text += f"الملف الثاني: {c2['text'][:100]}...\n"
-                preview_text += "\n"
+            http = self._new_drive_http()
+            with self.stage_timer('upload'):
+                if existing_checksums is None:
+                    existing_checksums = self.list_drive_checksums(folder_id, http)
+                existing_id = existing_checksums.get(self.file_md5(file_path))
+                if existing_id:
+                    logging.info(f"الملف موجود مسبقاً في Google Drive (نفس MD5): {existing_id}")
+                    return existing_id
+                
+                file_id = self._upload_resumable(file_path, folder_id, http)
             
-            self.preview_text.setText(preview_text)
+            logging.info(f"تم رفع الملف إلى Google Drive: {file_id}")
+            return file_id
             
         except Exception as e:
-            QMessageBox.critical(self, "خطأ", f"خطأ في معاينة المحتوى: {str(e)}")
+            logging.error(f"خطأ في رفع الملف إلى Google Drive: {e}")
+            raise
     
-    def process_files(self):
-        """معالجة الملفات"""
-        if not self.lang1_file_path or not self.lang2_file_path:
-            QMessageBox.warning(self, "تحذير", "يرجى اختيار كلا الملفين أولاً")
-            return
-        
-        # اختيار مجلد الحفظ
-        output_dir = QFileDialog.getExistingDirectory(self, "اختيار مجلد الحفظ")
-        if not output_dir:
-            return
+    def upload_files_to_drive(self, file_paths: List[str], folder_id: Optional[str] = None) -> Dict[str, str]:
+        """رفع عدة ملفات بالتوازي، ويعيد {المسار: معرف الملف في Drive}"""
+        if not self.get_drive_service():
+            raise ValueError(f"خدمة Google Drive غير مهيأة: {self.drive_init_error or 'سبب غير معروف'}")
         
-        try:
-            self.progress_bar.setVisible(True)
-            self.progress_bar.setValue(0)
-            
-            # تحديد اسم الملف الناتج
-            output_base = os.path.join(output_dir, "bilingual_output")
-            
-            # معالجة الملفات
-            self.formatter.process_books(self.lang1_file_path, self.lang2_file_path, output_base)
-            
-            self.progress_bar.setValue(100)
-            
-            # رفع إلى Google Drive إذا طُلب
-            if self.upload_drive_cb.isChecked():
+        folder_id = folder_id or self.config.get("drive", {}).get("folder_id") or None
+        # قائمة الملفات الموجودة تُجلب مرة واحدة لكل الملفات
+        existing_checksums = self.list_drive_checksums(folder_id)
+        max_workers = max(1, min(self.config.get("drive", {}).get("max_concurrency", 4), len(file_paths)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                path: executor.submit(self.upload_to_drive, path, folder_id, existing_checksums)
+                for path in file_paths
+            }
+            return {path: future.result() for path, future in futures.items()}
+
+
+# معالج خاص بكل عملية عاملة، يُنشأ مرة واحدة عند بدء العملية ويُعاد استخدامه لكل المهام
+_worker_formatter = None
+# عدد مرات بناء المعالج في هذه العملية؛ العملية الدافئة تبنيه مرة واحدة فقط
+_worker_formatter_builds = 0
+
+
+def init_worker_formatter(config_path: str = "config.json", max_workers: Optional[int] = 1):
+    """مُهيئ العمليات العاملة في مجمعات العمليات (الـ API ووضع الدفعات)
+
+    max_workers يحدد التوازي الداخلي لكل مهمة؛ القيمة 1 تمنع تضاعف العمليات
+    عندما يكون التوازي على مستوى المهام نفسها.
+    """
+    global _worker_formatter, _worker_formatter_builds
+    _worker_formatter = BilingualBookFormatter(config_path)
+    _worker_formatter_builds += 1
+    if max_workers is not None:
+        _worker_formatter.config.setdefault("performance", {})["max_workers"] = max_workers
+
+
+def get_worker_formatter() -> BilingualBookFormatter:
+    if _worker_formatter is None:
+        init_worker_formatter()
+    return _worker_formatter
+
+
+def _cache_counters(formatter: BilingualBookFormatter) -> Dict[str, int]:
+    """عدادات الإصابة التراكمية لذاكرة الصور وذاكرة الترجمة في هذه العملية"""
+    image_cache = formatter.image_cache
+    memory = formatter.translation_memory.stats() if formatter.translation_memory else {}
+    return {
+        'image_hits': image_cache.hits if image_cache else 0,
+        'image_misses': image_cache.misses if image_cache else 0,
+        'memory_hits': memory.get('exact_hits', 0) + memory.get('fuzzy_hits', 0),
+        'memory_misses': memory.get('misses', 0),
+    }
+
+
+def process_books_in_worker(lang1_path: str, lang2_path: str, output_base: str,
+                            formats: Optional[Iterable[str]] = None, progress_queue=None):
+    """تنفيذ process_books داخل عملية عاملة باستخدام معالجها الدائم
+
+    progress_queue: طابور بين العمليات (مثل Manager().Queue()) تُرسل إليه أحداث التقدم
+    """
+    formatter = get_worker_formatter()
+    callback = progress_queue.put if progress_queue is not None else None
+    counters_before = _cache_counters(formatter)
+    started = time.perf_counter()
+    formatter.process_books(lang1_path, lang2_path, output_base, formats, callback)
+    counters_after = _cache_counters(formatter)
+    # إحصائيات المهمة تُعاد إلى العملية الرئيسية لتسجيلها في المقاييس
+    return {
+        'busy_seconds': time.perf_counter() - started,
+        'stages': dict(formatter.stage_timings),
+        'cache': {name: counters_after[name] - counters_before[name] for name in counters_after},
+    }
+
+
+def warm_up_worker(delay: float = 0.0) -> Tuple[int, int]:
+    """تهيئة العملية العاملة مسبقاً؛ التأخير يضمن توزيع المهام على جميع العمليات
+
+    تُعاد (رقم العملية، عدد مرات بناء معالجها).
+    """
+    get_worker_formatter()
+    time.sleep(delay)
+    return os.getpid(), _worker_formatter_builds
+
+
+SUPPORTED_INPUTS = ('.docx', '.pdf', '.epub')
+
+
+def _batch_formats(output_format: str) -> Tuple[str, ...]:
+    return OUTPUT_FORMATS if output_format == "both" else (output_format,)
+
+
+def find_book_pairs(directory: str, suffixes: Tuple[str, str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """إقران الكتب في مجلد حسب اصطلاح التسمية <الاسم>_<لاحقة اللغة>.<الامتداد>
+
+    مثال: novel_en.docx مع novel_ar.pdf عند اللاحقتين ("en", "ar").
+    تُعاد الأزواج مرتبة بالاسم مع قائمة الملفات التي لا مقابل لها.
+    يُرفع ValueError إذا تكرر الاسم نفسه للغة واحدة (مثل novel_en.docx و novel_en.pdf).
+    """
+    sides = ({}, {})
+    unpaired = []
+    duplicates = []
+    for entry in sorted(os.listdir(directory)):
+        path = os.path.join(directory, entry)
+        stem, extension = os.path.splitext(entry)
+        if not os.path.isfile(path) or extension.lower() not in SUPPORTED_INPUTS:
+            continue
+        for side, suffix in zip(sides, suffixes):
+            if stem.lower().endswith(f"_{suffix.lower()}"):
+                name = stem[:-len(suffix) - 1]
+                if name in side:
+                    duplicates.append(f"{os.path.basename(side[name])} و {entry}")
+                else:
+                    side[name] = path
+                break
+        else:
+            unpaired.append(path)
+    
+    if duplicates:
+        raise ValueError(f"ملفات بالاسم نفسه للغة واحدة في {directory}: {'؛ '.join(duplicates)}")
+    
+    items = [{'name': name, 'lang1': sides[0][name], 'lang2': sides[1][name]}
+             for name in sorted(sides[0].keys() & sides[1].keys())]
+    unpaired.extend(sides[0][name] for name in sides[0].keys() - sides[1].keys())
+    unpaired.extend(sides[1][name] for name in sides[1].keys() - sides[0].keys())
+    return items, sorted(unpaired)
+
+
+def load_batch_manifest(manifest_path: str) -> List[Dict[str, Any]]:
+    """قراءة قائمة أزواج من ملف CSV أو JSON
+
+    كل عنصر يحوي lang1 و lang2، واختيارياً name و output_format
+    (docx أو epub أو both)، وهي نفس حقول manifest في نقطة /batch/ للـ API.
+    المسارات النسبية تُحسب من مجلد ملف القائمة.
+    """
+    import csv
+
+    with open(manifest_path, 'r', encoding='utf-8-sig', newline='') as f:
+        if manifest_path.lower().endswith('.json'):
+            entries = json.load(f)
+        else:
+            entries = list(csv.DictReader(f))
+    
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    items = []
+    for index, entry in enumerate(entries, 1):
+        if not entry.get('lang1') or not entry.get('lang2'):
+            raise ValueError(f"العنصر {index} في {manifest_path} يفتقد lang1 أو lang2")
+        output_format = entry.get('output_format')
+        if output_format and output_format not in (*OUTPUT_FORMATS, "both"):
+            raise ValueError(f"العنصر {index} في {manifest_path} يحدد تنسيقاً غير مدعوم: {output_format}")
+        item = {key: value for key, value in entry.items() if value}
+        for key in ('lang1', 'lang2'):
+            item[key] = os.path.join(base_dir, os.path.expanduser(entry[key]))
+        item.setdefault('name', Path(entry['lang1']).stem)
+        items.append(item)
+    return items
+
+
+def run_batch_job(item: Dict[str, Any]) -> Dict[str, Any]:
+    """تنفيذ عنصر دفعة داخل عملية عاملة مع سجل مستقل له
+
+    لا ترفع استثناءات: الفشل يُعاد في النتيجة حتى تكتمل بقية الدفعة.
+    """
+    handler = logging.FileHandler(item['log'], mode='w', encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    root_logger = logging.getLogger()
+    root_logger.addHandler(handler)
+    started = time.perf_counter()
+    result = {'name': item['name'], 'lang1': item['lang1'], 'lang2': item['lang2'], 'log': item['log']}
+    try:
+        stats = process_books_in_worker(item['lang1'], item['lang2'], item['output_base'], item['formats'])
+        outputs = [f"{item['output_base']}.{extension}" for extension in item['formats']
+                   if os.path.exists(f"{item['output_base']}.{extension}")]
+        if not outputs:
+            raise RuntimeError("لم يتم إنشاء أي ملف ناتج")
+        result.update(status='completed', outputs=outputs, stages=stats['stages'])
+    except Exception as e:
+        logging.error(f"فشل عنصر الدفعة {item['name']}: {e}")
+        result.update(status='failed', error=str(e))
+    finally:
+        result['seconds'] = round(time.perf_counter() - started, 3)
+        root_logger.removeHandler(handler)
+        handler.close()
+    return result
+
+
+def run_batch(items: List[Dict[str, Any]], output_dir: str, jobs: Optional[int] = None,
+              output_format: str = "both", config_path: str = "config.json",
+              unpaired: Iterable[str] = ()) -> Dict[str, Any]:
+    """تحويل قائمة أزواج بالتوازي في مجمع عمليات ثم كتابة تقرير ملخص
+
+    كل عنصر يعمل في عملية مستقلة بتوازٍ داخلي واحد حتى لا تتضاعف العمليات،
+    ويُكتب سجله إلى logs/<الاسم>.log والتقرير إلى batch_report.json في output_dir.
+    """
+    # لا فائدة من عمليات أكثر من العناصر؛ التقرير يسجل العدد الفعلي
+    jobs = min(max(1, jobs or os.cpu_count() or 1), len(items))
+    logs_dir = os.path.join(output_dir, "logs")
+    os.makedirs(logs_dir, exist_ok=True)
+    
+    names = set()
+    for index, item in enumerate(items, 1):
+        # أسماء فريدة وآمنة للمخرجات والسجلات
+        name = os.path.basename(str(item['name'])) or f"item_{index}"
+        if name in names:
+            name = f"{name}_{index}"
+        names.add(name)
+        item.update(
+            name=name,
+            formats=_batch_formats(item.get('output_format', output_format)),
+            output_base=os.path.join(output_dir, name),
+            log=os.path.join(logs_dir, f"{name}.log"),
+        )
+    
+    started = time.perf_counter()
+    results = []
+    if items:
+        executor = ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=mp.get_context("spawn"),
+            initializer=init_worker_formatter,
+            initargs=(config_path, 1)
+        )
+        with executor:
+            futures = [executor.submit(run_batch_job, item) for item in items]
+            for item, future in zip(items, futures):
                 try:
-                    if os.path.exists(f"{output_base}.docx"):
-                        self.formatter.upload_to_drive(f"{output_base}.docx")
-                    if os.path.exists(f"{output_base}.epub"):
-                        self.formatter.upload_to_drive(f"{output_base}.epub")
+                    results.append(future.result())
                 except Exception as e:
-                    QMessageBox.warning(self, "تحذير", f"فشل في الرفع إلى Google Drive: {str(e)}")
-            
-            QMessageBox.information(self, "نجح", f"تمت المعالجة بنجاح!\nالملفات محفوظة في: {output_dir}")
-            
-        except Exception as e:
-            QMessageBox.critical(self, "خطأ", f"خطأ في المعالجة: {str(e)}")
-        finally:
-            self.progress_bar.setVisible(False)
+                    # انهيار العملية العاملة نفسها وليس خطأ تحويل عادياً
+                    results.append({'name': item['name'], 'lang1': item['lang1'], 'lang2': item['lang2'],
+                                    'log': item['log'], 'status': 'failed', 'error': str(e) or type(e).__name__})
     
-    def clear_all(self):
-        """مسح جميع البيانات"""
-        self.lang1_file_path = None
-        self.lang2_file_path = None
-        self.lang1_path.setText("لم يتم اختيار ملف")
-        self.lang2_path.setText("لم يتم اختيار ملف")
-        self.preview_text.clear()
+    completed = [result for result in results if result['status'] == 'completed']
+    report = {
+        'jobs': jobs,
+        'total': len(results),
+        'completed': len(completed),
+        'failed': len(results) - len(completed),
+        'wall_seconds': round(time.perf_counter() - started, 3),
+        'busy_seconds': round(sum(result.get('seconds', 0) for result in results), 3),
+        'unpaired': list(unpaired),
+        'items': results,
+    }
+    report_path = os.path.join(output_dir, "batch_report.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    report['report_path'] = report_path
+    return report
+
+
+_gui_classes: Optional[Dict[str, type]] = None
+GUI_CLASS_NAMES = ('BilingualBookFormatterGUI', 'ConversionWorker', 'PreviewWorker', 'AlignedTableModel')
+
+
+def load_gui() -> Optional[Dict[str, type]]:
+    """أصناف الواجهة الرسومية من وحدة gui (تُستورد مرة واحدة عند أول طلب)
+
+    تُعاد None إذا تعذر تحميل Qt، مثلاً عند غياب مكتبات النظام مثل libGL
+    رغم تثبيت PyQt6، وعندها تُعامل الواجهة كغير متاحة.
+    """
+    global _gui_classes, GUI_AVAILABLE
+    if _gui_classes is None and GUI_AVAILABLE:
+        try:
+            import gui
+        except ImportError as e:
+            logging.error(f"تعذر تحميل الواجهة الرسومية: {e}")
+            GUI_AVAILABLE = False
+            return None
+        _gui_classes = {name: getattr(gui, name) for name in GUI_CLASS_NAMES}
+    return _gui_classes
+
+
+def __getattr__(name: str):
+    # الوصول إلى أصناف الواجهة من الوحدة يحمّل الواجهة عند الحاجة فقط
+    if name in GUI_CLASS_NAMES:
+        gui_classes = load_gui()
+        if gui_classes is not None:
+            return gui_classes[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def main():
@@ -662,23 +2321,62 @@ def main():
     parser.add_argument("--lang2", help="مسار الملف الثاني")
     parser.add_argument("--output", help="مسار الملف الناتج (بدون امتداد)")
     parser.add_argument("--format", choices=["docx", "epub", "both"], default="both", help="تنسيق الإخراج")
+    batch_source = parser.add_mutually_exclusive_group()
+    batch_source.add_argument("--batch", metavar="DIR",
+                              help="وضع الدفعات: إقران كتب المجلد حسب الاسم (name_en.docx مع name_ar.docx)")
+    batch_source.add_argument("--manifest", metavar="FILE",
+                              help="وضع الدفعات: قائمة أزواج CSV أو JSON بالأعمدة lang1,lang2[,name,output_format]")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="عدد الكتب المعالجة بالتوازي في وضع الدفعات (الافتراضي عدد المعالجات)")
+    parser.add_argument("--suffixes", nargs=2, metavar=("LANG1", "LANG2"),
+                        help="لاحقتا اللغتين في أسماء ملفات --batch (الافتراضي lang1 و lang2 من الإعدادات)")
     
     args = parser.parse_args()
     
     if args.gui:
-        if not GUI_AVAILABLE:
-            print("خطأ: مكتبة PyQt6 غير مثبتة. لا يمكن تشغيل الواجهة الرسومية.")
+        gui_classes = load_gui()
+        if gui_classes is None:
+            print("خطأ: مكتبة PyQt6 غير مثبتة أو تعذر تحميلها. لا يمكن تشغيل الواجهة الرسومية.")
             sys.exit(1)
         
+        from PyQt6.QtWidgets import QApplication
+        
         app = QApplication(sys.argv)
-        window = BilingualBookFormatterGUI()
+        window = gui_classes['BilingualBookFormatterGUI']()
         window.show()
         sys.exit(app.exec())
     
+    elif (args.batch or args.manifest) and args.output:
+        unpaired = []
+        try:
+            if args.batch:
+                suffixes = args.suffixes
+                if not suffixes:
+                    translation = BilingualBookFormatter().config.get("translation", {})
+                    suffixes = (translation.get("lang1", "EN"), translation.get("lang2", "AR"))
+                items, unpaired = find_book_pairs(args.batch, tuple(suffixes))
+                for path in unpaired:
+                    print(f"تحذير: لا يوجد ملف مقابل لـ {path}")
+            else:
+                items = load_batch_manifest(args.manifest)
+            report = run_batch(items, args.output, args.jobs, args.format, unpaired=unpaired)
+        except Exception as e:
+            print(f"خطأ في معالجة الدفعة: {e}")
+            sys.exit(1)
+        
+        for result in report['items']:
+            detail = result.get('error', ', '.join(result.get('outputs', [])))
+            print(f"[{result['status']}] {result['name']} ({result['seconds']:.1f} ث): {detail}")
+        print(f"اكتمل {report['completed']} من {report['total']} في {report['wall_seconds']:.1f} ثانية "
+              f"بـ {report['jobs']} عملية. التقرير: {report['report_path']}")
+        if report['failed'] or not report['total']:
+            sys.exit(1)
+    
     elif args.lang1 and args.lang2 and args.output:
         formatter = BilingualBookFormatter()
+        formats = OUTPUT_FORMATS if args.format == "both" else (args.format,)
         try:
-            formatter.process_books(args.lang1, args.lang2, args.output)
+            formatter.process_books(args.lang1, args.lang2, args.output, formats)
             print(f"تمت المعالجة بنجاح! الملفات محفوظة في: {args.output}")
         except Exception as e:
             print(f"خطأ في المعالجة: {e}")
@@ -689,5 +2387,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # ضروري لعمليات المعالجة المتوازية في النسخ المجمّدة (PyInstaller)
+    mp.freeze_support()
     main()
 
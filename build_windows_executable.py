@@ -75,6 +75,7 @@ a = Analysis(
         'deepl',
         'googleapiclient',
         'PyQt6',
+        'gui',
         'beautifulsoup4',
     ],
     hookspath=[],
@@ -0,0 +1,675 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+الواجهة الرسومية لـ Bilingual Book Formatter (PyQt6)
+
+تُستورد هذه الوحدة عند تشغيل الواجهة فقط (load_gui في bilingual_book_formatter)،
+حتى لا يحتاج سطر الأوامر والخادم والعمليات العاملة إلى تحميل Qt.
+"""
+
+import logging
+import os
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, QObject, QThread, Qt, pyqtSignal, pyqtSlot
+from PyQt6.QtWidgets import (QMainWindow, QVBoxLayout, QHBoxLayout,
+                             QWidget, QPushButton, QLabel, QFileDialog, QTextEdit,
+                             QProgressBar, QComboBox, QCheckBox, QGroupBox, QGridLayout,
+                             QMessageBox, QListWidget, QListWidgetItem, QTabWidget,
+                             QTableView, QHeaderView, QAbstractItemView)
+
+from bilingual_book_formatter import OUTPUT_FORMATS, BilingualBookFormatter, ProcessingCancelled, ProgressTracker
+
+
+class AlignedTableModel(QAbstractTableModel):
+    """نموذج جدول فوق نتيجة المحاذاة لعرض الكتاب كاملاً عموداً بجانب عمود
+
+    يحتفظ النموذج بالأزواج الخام فقط، ونص كل خلية يُبنى عند طلب العرض له،
+    فلا يُجهّز إلا ما يظهر من صفوف مهما بلغ طول الكتاب. الصفوف تُضاف
+    فصلاً بعد فصل أثناء وصولها من خيط المعاينة.
+    """
+    
+    HEADERS = ("الملف الأول", "الملف الثاني")
+    # حد نص التلميح حتى لا تُنسخ صفحات PDF كاملة عند المرور فوق الخلية
+    TOOLTIP_CHARS = 1000
+    
+    chapter_added = pyqtSignal(str, int)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows: List[Tuple[Optional[Dict], Optional[Dict]]] = []
+        self.chapters: List[Tuple[str, int]] = []
+    
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else 2
+    
+    @staticmethod
+    def block_text(block: Optional[Dict]) -> str:
+        if not block:
+            return ""
+        if block.get('type') == 'image':
+            return "[صورة]"
+        return block.get('text', '')
+    
+    @staticmethod
+    def is_rtl(text: str) -> bool:
+        """اتجاه النص حسب أول حرف ذي اتجاه قوي"""
+        for char in text:
+            direction = unicodedata.bidirectional(char)
+            if direction in ('R', 'AL'):
+                return True
+            if direction == 'L':
+                return False
+        return False
+    
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        text = self.block_text(self.rows[index.row()][index.column()])
+        if role == Qt.ItemDataRole.DisplayRole:
+            # صف واحد لكل زوج؛ الأسطر الداخلية تُدمج حتى يبقى ارتفاع الصفوف ثابتاً
+            return " ".join(text.split())
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return text[:self.TOOLTIP_CHARS] or None
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            horizontal = Qt.AlignmentFlag.AlignRight if self.is_rtl(text) else Qt.AlignmentFlag.AlignLeft
+            return horizontal | Qt.AlignmentFlag.AlignVCenter
+        return None
+    
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+    
+    def append_chapter(self, title: str, rows: List[Tuple]):
+        """إضافة فصل مكتمل إلى نهاية الجدول مع تسجيل صف بدايته"""
+        if not rows:
+            return
+        start = len(self.rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self.rows.extend(rows)
+        self.chapters.append((title, start))
+        self.endInsertRows()
+        self.chapter_added.emit(title, start)
+    
+    def clear(self):
+        self.beginResetModel()
+        self.rows = []
+        self.chapters = []
+        self.endResetModel()
+
+
+class ConversionWorker(QObject):
+    """ينفذ طلبات التحويل في خيط خلفي واحداً تلو الآخر
+
+    الطلبات تصل عبر إشارة من خيط الواجهة فتصطف في حلقة أحداث خيط العامل،
+    والنتائج والتقدم تعود إلى الواجهة عبر الإشارات فقط.
+    """
+    
+    job_started = pyqtSignal(int)
+    job_progress = pyqtSignal(int, object)
+    job_finished = pyqtSignal(int, list)
+    job_failed = pyqtSignal(int, str)
+    job_cancelled = pyqtSignal(int)
+    upload_failed = pyqtSignal(int, str)
+    
+    def __init__(self):
+        super().__init__()
+        # لكل عامل معالجه الخاص؛ المعالج يحمل حالة الطلب الجاري (التقدم واستهلاك الترجمة)
+        self.formatter = BilingualBookFormatter()
+        self._lock = threading.Lock()
+        self._cancelled_jobs = set()
+        self._current_job = None
+        self._cancel_event = threading.Event()
+    
+    def cancel(self, job_id: int):
+        """إلغاء طلب جارٍ أو منتظر؛ آمنة للاستدعاء من خيط الواجهة"""
+        with self._lock:
+            self._cancelled_jobs.add(job_id)
+            if job_id == self._current_job:
+                self._cancel_event.set()
+    
+    @pyqtSlot(object)
+    def run_job(self, job: Dict[str, Any]):
+        """تنفيذ طلب تحويل واحد ثم رفع مخرجاته إلى Google Drive عند الطلب"""
+        job_id = job['id']
+        with self._lock:
+            cancelled = job_id in self._cancelled_jobs
+            if not cancelled:
+                self._current_job = job_id
+                self._cancel_event = threading.Event()
+        if cancelled:
+            self.job_cancelled.emit(job_id)
+            return
+        
+        self.job_started.emit(job_id)
+        try:
+            self.formatter.process_books(
+                job['lang1'], job['lang2'], job['output_base'], job['formats'],
+                progress_callback=lambda event: self.job_progress.emit(job_id, event),
+                cancel_event=self._cancel_event,
+            )
+            outputs = [f"{job['output_base']}.{extension}" for extension in OUTPUT_FORMATS
+                       if os.path.exists(f"{job['output_base']}.{extension}")]
+            if job.get('upload') and outputs:
+                try:
+                    # رفع المخرجات معاً بالتوازي
+                    self.formatter.upload_files_to_drive(outputs)
+                except Exception as e:
+                    self.upload_failed.emit(job_id, str(e))
+            self.job_finished.emit(job_id, outputs)
+        except ProcessingCancelled:
+            self.job_cancelled.emit(job_id)
+        except Exception as e:
+            self.job_failed.emit(job_id, str(e))
+        finally:
+            with self._lock:
+                self._current_job = None
+                self._cancelled_jobs.discard(job_id)
+
+
+class PreviewWorker(QObject):
+    """يستخرج بداية الملفين للمعاينة في خيط مستقل عن خيط الواجهة وعن طابور التحويل"""
+    
+    preview_ready = pyqtSignal(int, list, list)
+    preview_failed = pyqtSignal(int, str)
+    chapter_ready = pyqtSignal(int, str, list)
+    aligned_done = pyqtSignal(int, int)
+    
+    def __init__(self):
+        super().__init__()
+        self.formatter = BilingualBookFormatter()
+        # آخر طلب أرسلته الواجهة؛ التحميل الأقدم يتوقف عند تغيره
+        self.latest_request = 0
+        self._lock = threading.Lock()
+        self._superseded = threading.Event()
+    
+    def supersede(self, request_id: int):
+        """تسجيل طلب أحدث وإيقاف التحميل الجاري؛ آمنة للاستدعاء من خيط الواجهة"""
+        with self._lock:
+            self.latest_request = request_id
+            self._superseded.set()
+    
+    def _begin(self, request_id: int) -> Optional[threading.Event]:
+        """حدث الإيقاف الخاص بالطلب، أو None إذا سبقه طلب أحدث"""
+        with self._lock:
+            if request_id != self.latest_request:
+                return None
+            self._superseded = threading.Event()
+            return self._superseded
+    
+    @pyqtSlot(object)
+    def load(self, request: Dict[str, Any]):
+        max_blocks = request['max_blocks']
+        superseded = self._begin(request['id'])
+        if superseded is None:
+            return
+        self.formatter.progress = ProgressTracker(cancel_event=superseded)
+        try:
+            content1 = self.formatter.extract_content(request['lang1'], max_blocks)
+            content2 = self.formatter.extract_content(request['lang2'], max_blocks)
+            self.preview_ready.emit(request['id'], content1, content2)
+        except ProcessingCancelled:
+            return
+        except Exception as e:
+            self.preview_failed.emit(request['id'], str(e))
+    
+    @pyqtSlot(object)
+    def load_aligned(self, request: Dict[str, Any]):
+        """استخراج الكتابين كاملين ومحاذاتهما مع إرسال كل فصل فور اكتمال محاذاته
+
+        الطلب الأحدث يوقف التحميل عند أقرب نقطة تقدم، أثناء الاستخراج (لكل فقرة أو صفحة)
+        أو المحاذاة (لكل فصل).
+        """
+        request_id = request['id']
+        superseded = self._begin(request_id)
+        if superseded is None:
+            return
+        self.formatter.progress = ProgressTracker(cancel_event=superseded)
+        try:
+            content1 = self.formatter.extract_content(request['lang1'])
+            content2 = self.formatter.extract_content(request['lang2'])
+            total = 0
+            aligned = self.formatter.iter_aligned(content1, content2)
+            for chapter in self.formatter.iter_chapters(aligned):
+                self.formatter.progress.check_cancelled()
+                self.chapter_ready.emit(request_id, chapter['title'], chapter['rows'])
+                total += len(chapter['rows'])
+            self.aligned_done.emit(request_id, total)
+        except ProcessingCancelled:
+            return
+        except Exception as e:
+            self.preview_failed.emit(request_id, str(e))
+
+
+class BilingualBookFormatterGUI(QMainWindow):
+    """واجهة رسومية لمعالج الكتب ثنائية اللغة"""
+    
+    # تنسيقات الإخراج حسب ترتيب عناصر قائمة التنسيق
+    FORMAT_CHOICES = (("docx",), ("epub",), OUTPUT_FORMATS)
+    
+    job_submitted = pyqtSignal(object)
+    preview_requested = pyqtSignal(object)
+    aligned_requested = pyqtSignal(object)
+    
+    # أقصى انتظار لتوقف خيطي العاملين عند الإغلاق (بالمللي ثانية)
+    CLOSE_WAIT_MS = 5000
+    
+    def __init__(self):
+        super().__init__()
+        self.jobs = {}
+        self.next_job_id = 1
+        self.current_job = None
+        self.preview_request = 0
+        self.closing = False
+        self.init_ui()
+        self.init_worker()
+    
+    def init_worker(self):
+        """تشغيل عاملي التحويل والمعاينة في خيطين مستقلين حتى تبقى الواجهة مستجيبة"""
+        self.preview_thread = QThread(self)
+        self.preview_worker = PreviewWorker()
+        self.preview_worker.moveToThread(self.preview_thread)
+        self.preview_requested.connect(self.preview_worker.load)
+        self.aligned_requested.connect(self.preview_worker.load_aligned)
+        self.preview_worker.preview_ready.connect(self.show_preview)
+        self.preview_worker.preview_failed.connect(self.on_preview_failed)
+        self.preview_worker.chapter_ready.connect(self.on_chapter_ready)
+        self.preview_worker.aligned_done.connect(self.on_aligned_done)
+        self.preview_thread.start()
+        
+        self.worker_thread = QThread(self)
+        self.worker = ConversionWorker()
+        self.worker.moveToThread(self.worker_thread)
+        self.job_submitted.connect(self.worker.run_job)
+        self.worker.job_started.connect(self.on_job_started)
+        self.worker.job_progress.connect(self.on_job_progress)
+        self.worker.job_finished.connect(self.on_job_finished)
+        self.worker.job_failed.connect(self.on_job_failed)
+        self.worker.job_cancelled.connect(self.on_job_cancelled)
+        self.worker.upload_failed.connect(self.on_upload_failed)
+        self.worker_thread.start()
+    
+    def init_ui(self):
+        """تهيئة الواجهة الرسومية"""
+        self.setWindowTitle("Bilingual Book Formatter v2.3")
+        self.setGeometry(100, 100, 1000, 700)
+        
+        # الأدوات الرئيسية
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        
+        # التخطيط الرئيسي
+        main_layout = QVBoxLayout(central_widget)
+        
+        # شريط علوي للملفات
+        file_layout = QHBoxLayout()
+        
+        # اختيار الملف الأول
+        self.lang1_label = QLabel("الملف الأول:")
+        self.lang1_path = QLabel("لم يتم اختيار ملف")
+        self.lang1_button = QPushButton("اختيار ملف")
+        self.lang1_button.clicked.connect(self.select_lang1_file)
+        
+        file_layout.addWidget(self.lang1_label)
+        file_layout.addWidget(self.lang1_path)
+        file_layout.addWidget(self.lang1_button)
+        
+        # اختيار الملف الثاني
+        self.lang2_label = QLabel("الملف الثاني:")
+        self.lang2_path = QLabel("لم يتم اختيار ملف")
+        self.lang2_button = QPushButton("اختيار ملف")
+        self.lang2_button.clicked.connect(self.select_lang2_file)
+        
+        file_layout.addWidget(self.lang2_label)
+        file_layout.addWidget(self.lang2_path)
+        file_layout.addWidget(self.lang2_button)
+        
+        main_layout.addLayout(file_layout)
+        
+        # إعدادات المعالجة
+        settings_group = QGroupBox("إعدادات المعالجة")
+        settings_layout = QGridLayout(settings_group)
+        
+        # تنسيق الإخراج
+        settings_layout.addWidget(QLabel("تنسيق الإخراج:"), 0, 0)
+        self.output_format = QComboBox()
+        self.output_format.addItems(["DOCX", "EPUB", "كلاهما"])
+        settings_layout.addWidget(self.output_format, 0, 1)
+        
+        # معالجة الصور
+        self.process_images_cb = QCheckBox("معالجة الصور")
+        self.process_images_cb.setChecked(True)
+        settings_layout.addWidget(self.process_images_cb, 1, 0)
+        
+        # رفع إلى Google Drive
+        self.upload_drive_cb = QCheckBox("رفع إلى Google Drive")
+        settings_layout.addWidget(self.upload_drive_cb, 1, 1)
+        
+        main_layout.addWidget(settings_group)
+        
+        # منطقة المعاينة
+        preview_group = QGroupBox("معاينة المحتوى")
+        preview_layout = QVBoxLayout(preview_group)
+        
+        self.preview_tabs = QTabWidget()
+        preview_layout.addWidget(self.preview_tabs)
+        
+        self.preview_text = QTextEdit()
+        self.preview_text.setReadOnly(True)
+        self.preview_tabs.addTab(self.preview_text, "معاينة سريعة")
+        
+        # عرض الكتاب المحاذى كاملاً مع الانتقال إلى الفصول
+        aligned_widget = QWidget()
+        aligned_layout = QVBoxLayout(aligned_widget)
+        chapter_layout = QHBoxLayout()
+        chapter_layout.addWidget(QLabel("الفصل:"))
+        self.chapter_combo = QComboBox()
+        self.chapter_combo.activated.connect(self.jump_to_chapter)
+        chapter_layout.addWidget(self.chapter_combo, 1)
+        self.aligned_status = QLabel()
+        chapter_layout.addWidget(self.aligned_status)
+        aligned_layout.addLayout(chapter_layout)
+        
+        self.aligned_model = AlignedTableModel(self)
+        self.aligned_model.chapter_added.connect(lambda title, row: self.chapter_combo.addItem(title, row))
+        self.aligned_view = QTableView()
+        self.aligned_view.setModel(self.aligned_model)
+        self.aligned_view.setWordWrap(False)
+        self.aligned_view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        # ارتفاع ثابت للصفوف حتى لا يقيس العرض محتوى كل صف عند التمرير
+        vertical_header = self.aligned_view.verticalHeader()
+        vertical_header.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        vertical_header.setDefaultSectionSize(self.fontMetrics().height() + 8)
+        self.aligned_view.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        aligned_layout.addWidget(self.aligned_view)
+        self.preview_tabs.addTab(aligned_widget, "الكتاب كاملاً")
+        
+        main_layout.addWidget(preview_group)
+        
+        # قائمة طلبات التحويل
+        queue_group = QGroupBox("طابور المعالجة")
+        queue_layout = QVBoxLayout(queue_group)
+        self.queue_list = QListWidget()
+        queue_layout.addWidget(self.queue_list)
+        main_layout.addWidget(queue_group)
+        
+        # شريط التقدم
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        main_layout.addWidget(self.progress_bar)
+        
+        # أزرار التحكم
+        button_layout = QHBoxLayout()
+        
+        self.preview_button = QPushButton("معاينة")
+        self.preview_button.clicked.connect(self.preview_content)
+        button_layout.addWidget(self.preview_button)
+        
+        self.aligned_button = QPushButton("عرض الكتاب كاملاً")
+        self.aligned_button.clicked.connect(self.preview_aligned_book)
+        button_layout.addWidget(self.aligned_button)
+        
+        self.process_button = QPushButton("معالجة")
+        self.process_button.clicked.connect(self.process_files)
+        button_layout.addWidget(self.process_button)
+        
+        self.cancel_button = QPushButton("إلغاء")
+        self.cancel_button.clicked.connect(self.cancel_job)
+        button_layout.addWidget(self.cancel_button)
+        
+        self.clear_button = QPushButton("مسح")
+        self.clear_button.clicked.connect(self.clear_all)
+        button_layout.addWidget(self.clear_button)
+        
+        main_layout.addLayout(button_layout)
+        
+        # متغيرات الملفات
+        self.lang1_file_path = None
+        self.lang2_file_path = None
+    
+    def select_lang1_file(self):
+        """اختيار الملف الأول"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "اختيار الملف الأول", "",
+            "المستندات المدعومة (*.docx *.pdf *.epub);;جميع الملفات (*)"
+        )
+        if file_path:
+            self.lang1_file_path = file_path
+            self.lang1_path.setText(os.path.basename(file_path))
+    
+    def select_lang2_file(self):
+        """اختيار الملف الثاني"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "اختيار الملف الثاني", "",
+            "المستندات المدعومة (*.docx *.pdf *.epub);;جميع الملفات (*)"
+        )
+        if file_path:
+            self.lang2_file_path = file_path
+            self.lang2_path.setText(os.path.basename(file_path))
+    
+    def preview_content(self):
+        """معاينة بداية الملفين؛ الاستخراج المحدود يجري في خيط المعاينة"""
+        if not self.lang1_file_path or not self.lang2_file_path:
+            QMessageBox.warning(self, "تحذير", "يرجى اختيار كلا الملفين أولاً")
+            return
+        
+        # رقم الطلب يسمح بتجاهل نتائج معاينة أقدم تصل متأخرة
+        self.preview_request += 1
+        self.preview_worker.supersede(self.preview_request)
+        self.preview_tabs.setCurrentWidget(self.preview_text)
+        self.preview_text.setText("جارٍ تحميل المعاينة...")
+        self.preview_requested.emit({
+            'id': self.preview_request,
+            'lang1': self.lang1_file_path,
+            'lang2': self.lang2_file_path,
+            'max_blocks': self.preview_worker.formatter.config.get("preview", {}).get("max_blocks", 5),
+        })
+    
+    def show_preview(self, request_id: int, content1: List[Dict], content2: List[Dict]):
+        """عرض نتيجة المعاينة إذا كانت لآخر طلب"""
+        if request_id != self.preview_request:
+            return
+        
+        preview_text = "معاينة المحتوى:\n\n"
+        
+        for i, (c1, c2) in enumerate(zip(content1, content2)):
+            preview_text += f"--- الفقرة {i+1} ---\n"
+            if c1 and c1['type'] == 'paragraph':
+                preview_text += f"الملف الأول: {c1['text'][:100]}...\n"
+            if c2 and c2['type'] == 'paragraph':
+                preview_text += f"الملف الثاني: {c2['text'][:100]}...\n"
+            preview_text += "\n"
+        
+        self.preview_text.setText(preview_text)
+    
+    def preview_aligned_book(self):
+        """تحميل الكتاب المحاذى كاملاً في الجدول؛ الفصول تظهر تباعاً أثناء وصولها"""
+        if not self.lang1_file_path or not self.lang2_file_path:
+            QMessageBox.warning(self, "تحذير", "يرجى اختيار كلا الملفين أولاً")
+            return
+        
+        self.preview_request += 1
+        self.preview_worker.supersede(self.preview_request)
+        self.aligned_model.clear()
+        self.chapter_combo.clear()
+        self.aligned_status.setText("جارٍ المحاذاة...")
+        self.preview_tabs.setCurrentIndex(1)
+        self.aligned_requested.emit({
+            'id': self.preview_request,
+            'lang1': self.lang1_file_path,
+            'lang2': self.lang2_file_path,
+        })
+    
+    def on_chapter_ready(self, request_id: int, title: str, rows: List[Tuple]):
+        if request_id == self.preview_request:
+            self.aligned_model.append_chapter(title, rows)
+            self.aligned_status.setText(f"{self.aligned_model.rowCount()} صف")
+    
+    def on_aligned_done(self, request_id: int, total: int):
+        if request_id == self.preview_request:
+            self.aligned_status.setText(f"{total} صف، {len(self.aligned_model.chapters)} فصل")
+    
+    def jump_to_chapter(self, position: int):
+        """التمرير إلى أول صف في الفصل المختار"""
+        row = self.chapter_combo.itemData(position)
+        if row is None:
+            return
+        index = self.aligned_model.index(row, 0)
+        self.aligned_view.scrollTo(index, QAbstractItemView.ScrollHint.PositionAtTop)
+        self.aligned_view.selectRow(row)
+    
+    def on_preview_failed(self, request_id: int, message: str):
+        if request_id == self.preview_request:
+            self.preview_text.clear()
+            self.aligned_status.clear()
+            QMessageBox.critical(self, "خطأ", f"خطأ في معاينة المحتوى: {message}")
+    
+    def process_files(self):
+        """إضافة طلب تحويل إلى الطابور؛ المعالجة تجري في خيط العامل"""
+        if not self.lang1_file_path or not self.lang2_file_path:
+            QMessageBox.warning(self, "تحذير", "يرجى اختيار كلا الملفين أولاً")
+            return
+        
+        # اختيار مجلد الحفظ
+        output_dir = QFileDialog.getExistingDirectory(self, "اختيار مجلد الحفظ")
+        if not output_dir:
+            return
+        
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        job = {
+            'id': job_id,
+            'lang1': self.lang1_file_path,
+            'lang2': self.lang2_file_path,
+            'output_base': self.unique_output_base(output_dir),
+            'output_dir': output_dir,
+            'formats': self.FORMAT_CHOICES[self.output_format.currentIndex()],
+            'upload': self.upload_drive_cb.isChecked(),
+            'status': 'queued',
+        }
+        self.jobs[job_id] = job
+        job['item'] = QListWidgetItem(self.job_label(job))
+        job['item'].setData(Qt.ItemDataRole.UserRole, job_id)
+        self.queue_list.addItem(job['item'])
+        self.job_submitted.emit({key: value for key, value in job.items() if key != 'item'})
+    
+    def unique_output_base(self, output_dir: str) -> str:
+        """اسم ناتج لا يطابق ملفاً موجوداً ولا طلباً آخر في الطابور"""
+        taken = {job['output_base'] for job in self.jobs.values()}
+        output_base = os.path.join(output_dir, "bilingual_output")
+        counter = 1
+        while output_base in taken or any(os.path.exists(f"{output_base}.{extension}")
+                                          for extension in OUTPUT_FORMATS):
+            counter += 1
+            output_base = os.path.join(output_dir, f"bilingual_output_{counter}")
+        return output_base
+    
+    @staticmethod
+    def job_label(job: Dict[str, Any]) -> str:
+        statuses = {'queued': "في الانتظار", 'running': "قيد المعالجة", 'completed': "مكتمل",
+                    'failed': "فشل", 'cancelled': "ملغى", 'cancelling': "جارٍ الإلغاء"}
+        return (f"#{job['id']} {os.path.basename(job['lang1'])} + {os.path.basename(job['lang2'])}"
+                f" — {statuses[job['status']]}")
+    
+    def set_job_status(self, job_id: int, status: str):
+        job = self.jobs[job_id]
+        job['status'] = status
+        job['item'].setText(self.job_label(job))
+    
+    def cancel_job(self):
+        """إلغاء الطلب المحدد في الطابور، أو الطلب الجاري إن لم يُحدد شيء"""
+        item = self.queue_list.currentItem()
+        job_id = item.data(Qt.ItemDataRole.UserRole) if item else self.current_job
+        if job_id is None or self.jobs[job_id]['status'] not in ('queued', 'running'):
+            return
+        self.worker.cancel(job_id)
+        self.set_job_status(job_id, 'cancelling')
+    
+    def on_job_started(self, job_id: int):
+        self.current_job = job_id
+        self.set_job_status(job_id, 'running')
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setValue(0)
+    
+    def on_job_progress(self, job_id: int, event: Dict[str, Any]):
+        if job_id == self.current_job:
+            self.update_progress(event)
+    
+    def end_job(self, job_id: int, status: str):
+        self.set_job_status(job_id, status)
+        if job_id == self.current_job:
+            self.current_job = None
+            self.progress_bar.setVisible(False)
+        # إكمال الإغلاق المؤجل بعد انتهاء آخر طلب
+        if self.closing and not self.pending_jobs():
+            self.close()
+    
+    def pending_jobs(self) -> List[int]:
+        """الطلبات التي لم يؤكد العامل انتهاءها بعد"""
+        return [job_id for job_id, job in self.jobs.items()
+                if job['status'] in ('queued', 'running', 'cancelling')]
+    
+    def on_job_finished(self, job_id: int, outputs: List[str]):
+        self.end_job(job_id, 'completed')
+        self.statusBar().showMessage(
+            f"تمت المعالجة بنجاح! الملفات محفوظة في: {self.jobs[job_id]['output_dir']}")
+    
+    def on_job_failed(self, job_id: int, message: str):
+        self.end_job(job_id, 'failed')
+        QMessageBox.critical(self, "خطأ", f"خطأ في المعالجة: {message}")
+    
+    def on_job_cancelled(self, job_id: int):
+        self.end_job(job_id, 'cancelled')
+    
+    def on_upload_failed(self, job_id: int, message: str):
+        QMessageBox.warning(self, "تحذير", f"فشل في الرفع إلى Google Drive: {message}")
+    
+    def update_progress(self, event: Dict[str, Any]):
+        """تحديث شريط التقدم من أحداث process_books"""
+        self.progress_bar.setValue(int(event['percent']))
+        self.progress_bar.setFormat(f"{event['stage']} %p%")
+    
+    def closeEvent(self, event):
+        """إلغاء الطلبات المتبقية؛ تُغلق النافذة بعد أن يؤكد العامل انتهاءها
+
+        الإلغاء يتم عند أقرب نقطة تقدم، لذا يؤجل الإغلاق حتى تصل إشارة الإلغاء
+        بدلاً من حجب خيط الواجهة في انتظار خيط العامل.
+        """
+        for job_id, job in self.jobs.items():
+            if job['status'] in ('queued', 'running'):
+                self.worker.cancel(job_id)
+                self.set_job_status(job_id, 'cancelling')
+        if self.pending_jobs():
+            self.closing = True
+            self.statusBar().showMessage("جارٍ إيقاف المعالجة قبل الإغلاق...")
+            event.ignore()
+            return
+        
+        # إيقاف أي تحميل جارٍ للمعاينة
+        self.preview_request += 1
+        self.preview_worker.supersede(self.preview_request)
+        for thread in (self.worker_thread, self.preview_thread):
+            thread.quit()
+            if not thread.wait(self.CLOSE_WAIT_MS):
+                logging.warning("لم يتوقف خيط العامل خلال مهلة الإغلاق")
+        super().closeEvent(event)
+    
+    def clear_all(self):
+        """مسح جميع البيانات"""
+        self.lang1_file_path = None
+        self.lang2_file_path = None
+        self.lang1_path.setText("لم يتم اختيار ملف")
+        self.lang2_path.setText("لم يتم اختيار ملف")
+        self.preview_text.clear()
+        # إيقاف أي تحميل جارٍ للكتاب المحاذى ومسح الجدول
+        self.preview_request += 1
+        self.preview_worker.supersede(self.preview_request)
+        self.aligned_model.clear()
+        self.chapter_combo.clear()
+        self.aligned_status.clear()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+خادم DeepL وهمي محلي لاختبار مرحلة الترجمة دون اتصال بالإنترنت
+Local fake DeepL API server for offline translation tests and benchmarks
+
+الاستخدام المستقل:
+    python tests/fake_deepl_server.py --port 8765 --latency 0.05
+ثم ضبط "deepl_server_url": "http://127.0.0.1:8765" في config.json
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+class FakeDeepLHandler(BaseHTTPRequestHandler):
+    """معالج طلبات يحاكي نقاط /v2/translate و /v2/usage"""
+
+    server: "FakeDeepLServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith('/v2/usage'):
+            self._send_json(200, {
+                'character_count': self.server.character_count,
+                'character_limit': self.server.character_limit
+            })
+        else:
+            self._send_json(404, {'message': 'Not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+
+        if not self.path.startswith('/v2/translate'):
+            self._send_json(404, {'message': 'Not found'})
+            return
+
+        if len(body) > self.server.max_request_bytes:
+            self._send_json(413, {'message': 'Request Entity Too Large'})
+            return
+
+        fields = parse_qsl(body.decode('utf-8'), keep_blank_values=True)
+        texts = [value for key, value in fields if key == 'text']
+        target_lang = dict(fields).get('target_lang', '')
+
+        characters = sum(len(text) for text in texts)
+        with self.server.lock:
+            self.server.request_count += 1
+            self.server.active_requests += 1
+            self.server.max_active_requests = max(self.server.max_active_requests,
+                                                  self.server.active_requests)
+            failure = self.server.failures.pop(0) if self.server.failures else None
+            if failure is None:
+                failure = self.server.check_limits(characters)
+            if failure:
+                self.server.rejected[failure] = self.server.rejected.get(failure, 0) + 1
+
+        try:
+            if self.server.latency:
+                time.sleep(self.server.latency)
+
+            if failure:
+                self._send_json(failure, {'message': 'Injected failure'})
+                return
+
+            with self.server.lock:
+                self.server.text_count += len(texts)
+                self.server.batch_sizes.append(len(texts))
+                self.server.character_count += characters
+
+            self._send_json(200, {'translations': [
+                {'detected_source_language': 'EN', 'text': f'[{target_lang}] {text}'}
+                for text in texts
+            ]})
+        finally:
+            with self.server.lock:
+                self.server.active_requests -= 1
+
+
+class FakeDeepLServer(ThreadingHTTPServer):
+    """خادم DeepL وهمي يعمل في خيط خلفي ويسجل إحصائيات الطلبات"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 max_request_bytes: int = 128 * 1024, character_limit: int = 500000,
+                 chars_per_second: float = 0.0, burst_chars: float = 0.0):
+        super().__init__((host, port), FakeDeepLHandler)
+        self.latency = latency
+        self.max_request_bytes = max_request_bytes
+        self.character_limit = character_limit
+        # تقييد من جهة الخادم بالأحرف في الثانية (يرد 429 عند التجاوز)
+        self.chars_per_second = chars_per_second
+        self.burst_chars = burst_chars or chars_per_second
+        self._tokens = self.burst_chars
+        self._updated = time.monotonic()
+        self.rejected = {}
+        self.lock = threading.Lock()
+        # رموز حالة HTTP تُعاد للطلبات التالية بالترتيب (مثل 429 أو 503)
+        self.failures = []
+        self.request_count = 0
+        self.text_count = 0
+        self.character_count = 0
+        self.batch_sizes = []
+        self.active_requests = 0
+        self.max_active_requests = 0
+        self._thread = None
+
+    def check_limits(self, characters: int):
+        """رمز الخطأ إذا تجاوز الطلب الحصة (456) أو معدل الأحرف (429)، وإلا None"""
+        if self.character_count + characters > self.character_limit:
+            return 456
+        if self.chars_per_second:
+            now = time.monotonic()
+            self._tokens = min(self.burst_chars, self._tokens + (now - self._updated) * self.chars_per_second)
+            self._updated = now
+            if characters > self._tokens:
+                return 429
+            self._tokens -= characters
+        return None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeDeepLServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake DeepL API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="زمن الاستجابة المحاكى بالثواني")
+    parser.add_argument("--chars-per-second", type=float, default=0.0, help="حد معدل الأحرف (0 = بدون حد)")
+    parser.add_argument("--character-limit", type=int, default=500000, help="حصة الأحرف الكلية")
+    args = parser.parse_args()
+
+    server = FakeDeepLServer(args.host, args.port, latency=args.latency,
+                             character_limit=args.character_limit,
+                             chars_per_second=args.chars_per_second)
+    print(f"Fake DeepL server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+خادم Google Drive وهمي محلي لاختبار الرفع القابل للاستئناف دون اتصال بالإنترنت
+Local fake Google Drive v3 server for offline upload tests and benchmarks
+
+الاستخدام المستقل:
+    python tests/fake_drive_server.py --port 8766
+ثم ضبط "api_endpoint": "http://127.0.0.1:8766" في قسم drive من config.json
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    """معالج طلبات يحاكي files.list وجلسات الرفع القابلة للاستئناف"""
+
+    server: "FakeDriveServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_incomplete(self, received: int):
+        # 308 Resume Incomplete مع آخر بايت مستلم
+        self.send_response(308)
+        if received:
+            self.send_header('Range', f'bytes=0-{received - 1}')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/drive/v3/files':
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        params = parse_qs(url.query)
+        match = re.search(r"'([^']+)' in parents", params.get('q', [''])[0])
+        folder = match.group(1) if match else None
+        with self.server.lock:
+            self.server.list_requests += 1
+            files = [file for file in self.server.files.values()
+                     if folder is None or folder in file['parents']]
+        page_size = int(params.get('pageSize', ['100'])[0])
+        offset = int(params.get('pageToken', ['0'])[0])
+        page = files[offset:offset + page_size]
+        payload = {'files': [{'id': f['id'], 'md5Checksum': f['md5Checksum']} for f in page]}
+        if offset + page_size < len(files):
+            payload['nextPageToken'] = str(offset + page_size)
+        self._send_json(200, payload)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._read_body()
+        if url.path != '/upload/drive/v3/files' or 'resumable' not in url.query:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        metadata = json.loads(body or b'{}')
+        upload_id = uuid.uuid4().hex
+        with self.server.lock:
+            self.server.sessions[upload_id] = {'metadata': metadata, 'data': bytearray()}
+        host, port = self.server.server_address[:2]
+        location = f"http://{host}:{port}/upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}"
+        self._send_json(200, {}, {'Location': location})
+
+    def do_PUT(self):
+        params = parse_qs(urlparse(self.path).query)
+        upload_id = params.get('upload_id', [''])[0]
+        body = self._read_body()
+        with self.server.lock:
+            session = self.server.sessions.get(upload_id)
+        if session is None:
+            self._send_json(404, {'error': {'message': 'Upload session not found'}})
+            return
+
+        content_range = self.headers.get('Content-Range', '')
+        # استعلام الحالة: "bytes */total"
+        status_query = re.match(r'bytes \*/(\d+|\*)', content_range)
+        chunk = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', content_range)
+        with self.server.lock:
+            if status_query:
+                self.server.status_queries += 1
+                file = session.get('file')
+                received = len(session['data'])
+            else:
+                self.server.chunk_requests += 1
+                failure = self.server.failures.pop(0) if self.server.failures else None
+                start = int(chunk.group(1)) if chunk else 0
+                if failure == 'disconnect':
+                    # تخزين نصف الكتلة ثم قطع الاتصال دون رد، كما في شبكة متقطعة
+                    del session['data'][start:]
+                    session['data'] += body[:len(body) // 2]
+                    self.server.bytes_received += len(body) // 2
+                elif failure is None:
+                    del session['data'][start:]
+                    session['data'] += body
+                    self.server.bytes_received += len(body)
+                received = len(session['data'])
+                total = chunk.group(3) if chunk else str(len(body))
+                file = None
+                if failure is None and total != '*' and received == int(total):
+                    file = self.server._finish(upload_id, session)
+
+        if status_query:
+            if file:
+                self._send_json(200, file)
+            else:
+                self._send_incomplete(received)
+        elif failure == 'disconnect':
+            self.close_connection = True
+            self.connection.shutdown(2)
+        elif failure:
+            self._send_json(failure, {'error': {'message': 'Injected failure'}})
+        elif file:
+            self._send_json(200, file)
+        else:
+            self._send_incomplete(received)
+
+
+class FakeDriveServer(ThreadingHTTPServer):
+    """خادم Drive وهمي يعمل في خيط خلفي ويسجل إحصائيات الرفع"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), FakeDriveHandler)
+        self.lock = threading.Lock()
+        self.files = {}
+        self.contents = {}
+        self.sessions = {}
+        # أعطال تُطبق على طلبات الكتل التالية بالترتيب: رمز HTTP (مثل 503) أو 'disconnect'
+        self.failures = []
+        self.list_requests = 0
+        self.chunk_requests = 0
+        self.status_queries = 0
+        self.bytes_received = 0
+        self._thread = None
+
+    def handle_error(self, request, client_address):
+        # الاتصالات المقطوعة عمداً أثناء الاختبار ليست أخطاء
+        pass
+
+    def _finish(self, upload_id: str, session: dict) -> dict:
+        data = bytes(session['data'])
+        file = {
+            'id': upload_id,
+            'name': session['metadata'].get('name', ''),
+            'parents': session['metadata'].get('parents', ['root']),
+            'md5Checksum': hashlib.md5(data).hexdigest(),
+        }
+        session['file'] = file
+        self.files[upload_id] = file
+        self.contents[upload_id] = data
+        return file
+
+    def add_file(self, name: str, data: bytes, parents=('root',)) -> str:
+        """إضافة ملف موجود مسبقاً إلى المجلد"""
+        file_id = uuid.uuid4().hex
+        with self.lock:
+            self.files[file_id] = {'id': file_id, 'name': name, 'parents': list(parents),
+                                   'md5Checksum': hashlib.md5(data).hexdigest()}
+            self.contents[file_id] = data
+        return file_id
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeDriveServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Google Drive API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    server = FakeDriveServer(args.host, args.port)
+    print(f"Fake Drive server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+API tests for the FastAPI server
+"""
+import io
+import json
+import os
+import threading
+import types
+import zipfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+from docx import Document
+from fastapi.testclient import TestClient
+import app as api
+
+API_KEY = "SECRET_API_KEY"
+
+
+def make_docx(*paragraphs) -> bytes:
+    document = Document()
+    for text in paragraphs:
+        document.add_paragraph(text)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+class TestJobsAPI:
+    @pytest.fixture(autouse=True)
+    def result_cache(self, monkeypatch, tmp_path_factory):
+        cache = api.DiskCache(str(tmp_path_factory.mktemp("results")), 10 * 1024 * 1024)
+        monkeypatch.setattr(api, "result_cache", cache)
+        return cache
+
+    @pytest.fixture
+    def client(self):
+        return TestClient(api.app)
+
+    @pytest.fixture
+    def files(self):
+        return {
+            "lang1_file": ("english.docx", make_docx("Hello", "World")),
+            "lang2_file": ("arabic.docx", make_docx("مرحبا", "بالعالم")),
+        }
+
+    def wait_for(self, client, job_id, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            status = client.get(f"/jobs/{job_id}", params={"api_key": API_KEY}).json()
+            if status["status"] in ("completed", "failed"):
+                return status
+            time.sleep(0.05)
+        raise AssertionError(f"job {job_id} did not finish")
+
+    def test_job_lifecycle(self, client, files):
+        response = client.post("/jobs/", files=files, data={"output_format": "docx", "api_key": API_KEY})
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        status = self.wait_for(client, job_id)
+        assert status["status"] == "completed"
+
+        result = client.get(f"/jobs/{job_id}/result", params={"api_key": API_KEY})
+        assert result.status_code == 200
+        table = Document(io.BytesIO(result.content)).tables[0]
+        assert table.rows[1].cells[1].text == "بالعالم"
+
+    def test_concurrent_submissions(self, client, files):
+        job_ids = [
+            client.post("/jobs/", files=files, data={"output_format": "epub", "api_key": API_KEY}).json()["job_id"]
+            for _ in range(4)
+        ]
+        assert len(set(job_ids)) == 4
+        assert all(self.wait_for(client, job_id)["status"] == "completed" for job_id in job_ids)
+
+    def test_oversize_upload_is_rejected(self, client, files, monkeypatch, tmp_path):
+        monkeypatch.setattr(api.tempfile, "tempdir", str(tmp_path))
+        monkeypatch.setattr(api, "UPLOAD_CHUNK_SIZE", 1024)
+        monkeypatch.setattr(api, "MAX_UPLOAD_BYTES", 4096)
+
+        response = client.post("/process/", files=files, data={"output_format": "docx", "api_key": API_KEY})
+
+        assert response.status_code == 413
+        assert os.listdir(tmp_path) == []
+
+    def test_oversize_request_is_rejected_before_reading(self, client, files, monkeypatch):
+        monkeypatch.setattr(api, "MAX_REQUEST_BYTES", 1024)
+
+        response = client.post("/jobs/", files=files, data={"output_format": "docx", "api_key": API_KEY})
+
+        assert response.status_code == 413
+        assert response.json()["detail"] == "Request too large"
+
+    def test_oversize_chunked_request_is_rejected_while_streaming(self, client, monkeypatch):
+        monkeypatch.setattr(api, "MAX_REQUEST_BYTES", 64 * 1024)
+        def fail(*args):
+            raise AssertionError("the handler must not run for an oversize body")
+        monkeypatch.setattr(api, "save_uploads", fail)
+        boundary = "limit-test"
+
+        # جسم بلا Content-Length يُرسل مجزأً (chunked)
+        def body():
+            yield (f'--{boundary}\r\nContent-Disposition: form-data; name="lang1_file"; '
+                   f'filename="english.docx"\r\n\r\n').encode()
+            for _ in range(64):
+                yield b"x" * 16 * 1024
+
+        response = client.post("/jobs/", content=body(),
+                               headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+        assert "content-length" not in response.request.headers
+        assert response.status_code == 413
+        assert response.json()["detail"] == "Request too large"
+
+    def test_identical_requests_reuse_cached_result(self, client, files, monkeypatch, result_cache):
+        data = {"output_format": "docx", "api_key": API_KEY}
+        first = client.post("/process/", files=files, data=data)
+        assert first.status_code == 200
+
+        def fail(*args):
+            raise AssertionError("conversion should not run on a cache hit")
+        monkeypatch.setattr(api, "submit_conversion", fail)
+        second = client.post("/process/", files=files, data=data)
+        job = client.post("/jobs/", files=files, data=data).json()
+
+        assert second.status_code == 200
+        assert second.content == first.content
+        assert job["status"] == "completed"
+        assert result_cache.hits == 2
+
+    def test_cache_key_depends_on_options_and_code_version(self, monkeypatch):
+        paths = {"lang1": "lang1.docx", "lang2": "lang2.pdf"}
+        digests = {"lang1": "a" * 64, "lang2": "b" * 64}
+        key = api.result_cache_key(paths, digests, "docx")
+
+        assert api.result_cache_key(paths, digests, "DOCX") == key
+        assert api.result_cache_key(paths, digests, "epub") != key
+        assert api.result_cache_key(paths, {"lang1": "b" * 64, "lang2": "a" * 64}, "docx") != key
+        monkeypatch.setattr(api, "CODE_VERSION", "changed")
+        assert api.result_cache_key(paths, digests, "docx") != key
+
+    def test_finished_job_is_cached_outside_jobs_lock(self, client, files, monkeypatch):
+        class OwnedLock:
+            def __init__(self):
+                self.lock = threading.Lock()
+                self.owner = None
+            def __enter__(self):
+                self.lock.acquire()
+                self.owner = threading.get_ident()
+            def __exit__(self, *exc_info):
+                self.owner = None
+                self.lock.release()
+
+        jobs_lock = OwnedLock()
+        monkeypatch.setattr(api, "jobs_lock", jobs_lock)
+        held, threads = [], []
+        store_result = api.store_result
+        def record(*args):
+            held.append(jobs_lock.owner == threading.get_ident())
+            threads.append(threading.current_thread().name)
+            store_result(*args)
+        monkeypatch.setattr(api, "store_result", record)
+
+        job_id = client.post("/jobs/", files=files, data={"output_format": "docx", "api_key": API_KEY}).json()["job_id"]
+
+        assert self.wait_for(client, job_id)["status"] == "completed"
+        deadline = time.time() + 5
+        while not held and time.time() < deadline:
+            time.sleep(0.01)
+        assert held == [False]
+        # ليس في خيط إدارة مجمع العمليات الذي يسلم نتائج المهام الأخرى
+        assert threads[0].startswith("job-finish")
+
+    def test_batch_streams_archive_with_per_item_report(self, client):
+        upload = [
+            ("files", ("one_en.docx", make_docx("One"))),
+            ("files", ("one_ar.docx", make_docx("واحد"))),
+            ("files", ("two_en.docx", make_docx("Two"))),
+            ("files", ("broken_ar.docx", b"not a docx")),
+        ]
+        manifest = json.dumps([
+            {"name": "one", "lang1": "one_en.docx", "lang2": "one_ar.docx"},
+            {"name": "two", "lang1": "two_en.docx", "lang2": "broken_ar.docx"},
+            {"name": "one_epub", "lang1": "one_en.docx", "lang2": "one_ar.docx", "output_format": "epub"},
+        ])
+
+        response = client.post("/batch/", files=upload, data={"manifest": manifest, "api_key": API_KEY})
+
+        assert response.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            report = {entry["name"]: entry for entry in json.loads(archive.read("report.json"))}
+            assert sorted(archive.namelist()) == ["one.docx", "one_epub.epub", "report.json"]
+            table = Document(io.BytesIO(archive.read("one.docx"))).tables[0]
+        assert table.rows[0].cells[1].text == "واحد"
+        assert report["two"]["status"] == "failed"
+        assert report["one_epub"]["status"] == "completed"
+
+    def test_batch_rejects_unpaired_files(self, client, files):
+        upload = [("files", files["lang1_file"]), ("files", files["lang2_file"]), ("files", files["lang1_file"])]
+        response = client.post("/batch/", files=upload, data={"api_key": API_KEY})
+        assert response.status_code == 400
+
+    def test_job_progress_is_streamed_as_server_sent_events(self, client, files):
+        job_id = client.post("/jobs/", files=files, data={"output_format": "epub", "api_key": API_KEY}).json()["job_id"]
+
+        with client.stream("GET", f"/jobs/{job_id}/events", params={"api_key": API_KEY}) as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            events = [json.loads(line[len("data: "):]) for line in response.iter_lines() if line.startswith("data: ")]
+
+        assert events[-1]["status"] == "completed"
+        assert events[-1]["progress"]["stage"] == "done"
+        assert events[-1]["progress"]["percent"] == 100
+
+    def test_metrics_report_stage_latency_and_cache_use(self, client, files):
+        data = {"output_format": "docx", "api_key": API_KEY}
+        for _ in range(2):
+            assert client.post("/process/", files=files, data=data).status_code == 200
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        metrics = response.text
+        for stage in ("receive", "extract", "align", "render_docx"):
+            assert f'bilingual_stage_seconds_count{{stage="{stage}"}}' in metrics
+        assert 'bilingual_cache_requests_total{cache="result",result="hit"} ' in metrics
+        assert "bilingual_input_bytes_bucket" in metrics
+        assert "bilingual_queue_depth_bucket" in metrics
+        assert "bilingual_worker_busy_seconds_total" in metrics
+
+    def test_unsupported_format_is_rejected(self, client, files):
+        response = client.post("/process/", files=files, data={"output_format": "pdf", "api_key": API_KEY})
+        assert response.status_code == 400
+
+    def test_unknown_job_and_bad_key(self, client):
+        assert client.get("/jobs/missing", params={"api_key": API_KEY}).status_code == 404
+        assert client.get("/jobs/missing", params={"api_key": "wrong"}).status_code == 401
+
+    def test_uploads_limited_to_supported_inputs(self, client, files):
+        api.validate_request(*(types.SimpleNamespace(filename=f"book{ext}") for ext in (".epub", ".pdf")), "docx")
+
+        files["lang2_file"] = ("arabic.md", b"# title")
+        response = client.post("/jobs/", files=files, data={"output_format": "docx", "api_key": API_KEY})
+        assert response.status_code == 400
+
+    def test_health_while_processing(self, client, files, monkeypatch):
+        started, release = threading.Event(), threading.Event()
+
+        def blocked_conversion(*args):
+            started.set()
+            release.wait(10)
+            raise RuntimeError("conversion released")
+        pool = ThreadPoolExecutor(max_workers=1)
+        monkeypatch.setattr(api, "submit_conversion", lambda *args: pool.submit(blocked_conversion, *args))
+
+        job_id = client.post("/jobs/", files=files, data={"output_format": "docx", "api_key": API_KEY}).json()["job_id"]
+        try:
+            assert started.wait(10)
+            # الخادم يجيب بينما التحويل ما زال معلقاً
+            assert client.get("/health/").json()["status"] == "healthy"
+            status = client.get(f"/jobs/{job_id}", params={"api_key": API_KEY}).json()
+            assert status["status"] == "running"
+        finally:
+            release.set()
+            pool.shutdown()
+        assert self.wait_for(client, job_id)["status"] == "failed"
+
+    def test_drive_upload_runs_off_event_loop(self, monkeypatch):
+        started, release = threading.Event(), threading.Event()
+
+        class SlowDrive:
+            def upload_to_drive(self, file_path):
+                started.set()
+                release.wait(10)
+                return "drive-id"
+        monkeypatch.setattr(api, "get_formatter", lambda: SlowDrive())
+        # عميل واحد بحلقة أحداث واحدة؛ مجمع خيوط بدل العمليات العاملة لأحداث البدء والإيقاف
+        monkeypatch.setattr(api, "executor", ThreadPoolExecutor(max_workers=1))
+        monkeypatch.setattr(api, "progress_manager", None)
+
+        with TestClient(api.app) as client, ThreadPoolExecutor(max_workers=2) as pool:
+            upload = pool.submit(client.post, "/upload_to_drive/", data={"file_path": "book.docx", "api_key": API_KEY})
+            try:
+                assert started.wait(10)
+                # الرفع ما زال معلقاً، والخادم يجيب رغم ذلك
+                assert pool.submit(client.get, "/health/").result(timeout=5).json()["status"] == "healthy"
+            finally:
+                release.set()
+            assert upload.result().json()["drive_id"] == "drive-id"
+
+    def test_conversions_run_in_warm_worker_processes(self, client):
+        pool = api.get_executor()
+        workers = [pool.submit(api.warm_up_worker, 0.1).result() for _ in range(api.JOB_WORKERS * 2)]
+        pids = {pid for pid, _ in workers}
+        assert os.getpid() not in pids
+        assert len(pids) <= api.JOB_WORKERS
+        # كل عملية بنت معالجها مرة واحدة عند بدئها وأعادت استخدامه
+        assert all(builds == 1 for _, builds in workers)
+
+    def test_broken_pool_is_shut_down_and_replaced(self, monkeypatch):
+        shutdowns = []
+
+        class BrokenPool:
+            def submit(self, *args):
+                raise BrokenProcessPool("worker died")
+
+            def shutdown(self, wait=True):
+                shutdowns.append(wait)
+        replacement = ThreadPoolExecutor(max_workers=1)
+        monkeypatch.setattr(api, "executor", BrokenPool())
+        monkeypatch.setattr(api, "ProcessPoolExecutor", lambda **kwargs: replacement)
+        monkeypatch.setattr(api, "process_books_in_worker", lambda *args: {})
+
+        try:
+            assert api.submit_conversion("lang1.docx", "lang2.docx", "output").result() == {}
+            assert shutdowns == [False]
+            assert api.executor is replacement
+        finally:
+            replacement.shutdown()
+
+    def test_concurrent_process_requests_are_isolated(self, client, monkeypatch, tmp_path):
+        monkeypatch.setattr(api.tempfile, "tempdir", str(tmp_path))
+        pairs = [(f"English {i}", f"عربي {i}") for i in range(3)]
+
+        def convert(pair):
+            files = {
+                "lang1_file": ("english.docx", make_docx(pair[0])),
+                "lang2_file": ("arabic.docx", make_docx(pair[1])),
+            }
+            return client.post("/process/", files=files, data={"output_format": "docx", "api_key": API_KEY})
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            responses = list(pool.map(convert, pairs))
+
+        for pair, response in zip(pairs, responses):
+            assert response.status_code == 200
+            table = Document(io.BytesIO(response.content)).tables[0]
+            assert table.rows[0].cells[1].text == pair[1]
+        assert os.listdir(tmp_path) == []
@@ -7,13 +7,28 @@ import os
 import tempfile
 import json
 from pathlib import Path
-from bilingual_book_formatter import BilingualBookFormatter
+import io
+import zipfile
+import subprocess
+import sys
+from bilingual_book_formatter import (BilingualBookFormatter, DiskCache, render_chapter_xhtml,
+                                      find_book_pairs, load_batch_manifest, run_batch)
 
 class TestBilingualBookFormatter:
     @pytest.fixture
     def formatter(self):
         return BilingualBookFormatter()
     
+    @pytest.fixture
+    def sample_images(self):
+        from PIL import Image
+        images = []
+        for image_format, size in [('JPEG', (2400, 1600)), ('PNG', (1800, 900)), ('PNG', (120, 60))]:
+            buffer = io.BytesIO()
+            Image.new('RGB', size, 'red').save(buffer, image_format)
+            images.append(buffer.getvalue())
+        return images
+    
     @pytest.fixture
     def sample_docx_path(self):
         return "test_samples/sample.docx"
@@ -39,4 +54,275 @@ class TestBilingualBookFormatter:
             content = formatter.parse_document(sample_docx_path, "english")
             assert isinstance(content, list)
     
+    def test_chapter_xhtml_escapes_text(self):
+        xhtml = render_chapter_xhtml({
+            'title': 'A & B',
+            'rows': [(('<b>bold</b>', '', False), ('نص\x0c عربي', '', True))]
+        }).decode('utf-8')
+        assert '&lt;b&gt;bold&lt;/b&gt;' in xhtml
+        assert '<title>A &amp; B</title>' in xhtml
+        assert '\x0c' not in xhtml
+        assert '<div class="lang2 machine-translated">' in xhtml
+    
+    def test_epub_chapters_written_in_spine_order(self, formatter, tmp_path):
+        formatter.config.setdefault("epub", {})["rows_per_chapter"] = 2
+        content1 = [{'type': 'paragraph', 'text': f'English {i}'} for i in range(5)]
+        content2 = [{'type': 'paragraph', 'text': f'عربي {i}'} for i in range(5)]
+        output_path = str(tmp_path / "book.epub")
+        
+        formatter.create_epub_output(formatter.align_content(content1, content2), output_path)
+        
+        with zipfile.ZipFile(output_path) as archive:
+            chapters = [name for name in archive.namelist() if name.endswith('.xhtml') and 'chap_' in name]
+            assert chapters == ['EPUB/chap_01.xhtml', 'EPUB/chap_02.xhtml', 'EPUB/chap_03.xhtml']
+            assert 'English 4' in archive.read('EPUB/chap_03.xhtml').decode('utf-8')
+    
+    def test_process_images_keeps_order_in_job_directory(self, formatter, sample_images, tmp_path):
+        from PIL import Image
+        formatter.config["image_processing"].update({"max_width": 600, "cache": False})
+        
+        processed = formatter.process_images(sample_images, output_dir=str(tmp_path))
+        
+        assert [os.path.dirname(path) for path in processed] == [str(tmp_path)] * 3
+        assert [Image.open(path).size for path in processed] == [(600, 400), (600, 300), (120, 60)]
+    
+    def test_process_images_reuses_cache(self, formatter, sample_images, tmp_path):
+        formatter.config["image_processing"].update({"cache": True, "cache_dir": str(tmp_path / "cache")})
+        
+        formatter.process_images(sample_images, output_dir=str(tmp_path / "first"))
+        second = formatter.process_images(sample_images, output_dir=str(tmp_path / "second"))
+        
+        assert formatter.image_cache.hits == 3
+        assert len(second) == 3
+        
+        # تغيير الإعدادات يعني مفتاحاً مختلفاً
+        formatter.config["image_processing"]["max_width"] = 300
+        formatter.process_images(sample_images[:1], output_dir=str(tmp_path / "third"))
+        assert formatter.image_cache.hits == 3
+    
+    def test_disk_cache_evicts_least_recently_used(self, tmp_path):
+        cache = DiskCache(str(tmp_path / "cache"), max_bytes=10)
+        source = tmp_path / "source.bin"
+        source.write_bytes(b"123456")
+        cache.put("old", str(source))
+        os.utime(cache.get("old"), (1, 1))
+        cache.put("new", str(source))
+        
+        cache.evict()
+        
+        assert cache.get("old") is None
+        assert cache.get("new") is not None
+    
+    def test_figures_shared_between_editions_are_processed_once(self, formatter, tmp_path):
+        from PIL import Image, ImageDraw
+        
+        def figure(size, image_format, shape):
+            image = Image.new('RGB', (400, 300), 'white')
+            draw = ImageDraw.Draw(image)
+            if shape == 'circle':
+                draw.ellipse((50, 50, 250, 250), fill='black')
+            else:
+                draw.rectangle((200, 20, 380, 120), fill='black')
+            buffer = io.BytesIO()
+            image.resize(size).save(buffer, image_format)
+            return buffer.getvalue()
+        
+        content1 = [{'type': 'image', 'data': figure((400, 300), 'PNG', 'circle')},
+                    {'type': 'image', 'data': figure((400, 300), 'PNG', 'box')}]
+        content2 = [{'type': 'image', 'data': figure((800, 600), 'JPEG', 'circle')}]
+        formatter.config["image_processing"]["cache"] = False
+        
+        formatter.prepare_figures(content1, content2, str(tmp_path))
+        
+        assert content1[0]['figure_id'] == content2[0]['figure_id']
+        assert content1[1]['figure_id'] != content2[0]['figure_id']
+        assert content1[0]['image_path'] == content2[0]['image_path']
+        assert len(os.listdir(tmp_path)) == 2
+        
+        output_path = str(tmp_path / "book.epub")
+        formatter.create_epub_output(formatter.align_content(content1, content2), output_path)
+        with zipfile.ZipFile(output_path) as archive:
+            images = [name for name in archive.namelist() if '/images/' in name]
+            chapter = archive.read('EPUB/chap_01.xhtml').decode('utf-8')
+        assert len(images) == 2
+        assert chapter.count('bilingual-figure">') == 1
+        
+        # الصيغة الافتراضية WebP لا يقرؤها python-docx، فيُدرج الشكل المشترك مرة واحدة كنسخة PNG
+        from docx import Document
+        assert formatter.config["image_processing"]["format"] == "webp"
+        docx_path = str(tmp_path / "book.docx")
+        formatter.create_docx_output(formatter.align_content(content1, content2), docx_path)
+        assert len(Document(docx_path).inline_shapes) == 2
+    
+    def test_process_pools_use_spawn(self, formatter, tmp_path, monkeypatch):
+        import bilingual_book_formatter
+        from PIL import Image
+        # الواجهة تستدعي المعالجة من خيط عامل، واستنساخ عملية متعددة الخيوط غير آمن
+        contexts = []
+        pool_class = bilingual_book_formatter.ProcessPoolExecutor
+        def recording_pool(*args, **kwargs):
+            contexts.append(kwargs.get('mp_context') and kwargs['mp_context'].get_start_method())
+            return pool_class(*args, **kwargs)
+        monkeypatch.setattr(bilingual_book_formatter, "ProcessPoolExecutor", recording_pool)
+        formatter.config["performance"]["max_workers"] = 2
+        formatter.config["image_processing"]["cache"] = False
+        images = []
+        for color in ('red', 'blue'):
+            buffer = io.BytesIO()
+            Image.new('RGB', (64, 64), color).save(buffer, 'PNG')
+            images.append({'type': 'image', 'data': buffer.getvalue()})
+        
+        formatter.prepare_figures(images, [], str(tmp_path))
+        formatter.render_epub_chapters([{'title': 'One', 'rows': []}, {'title': 'Two', 'rows': []}])
+        
+        assert contexts == ["spawn", "spawn", "spawn"]
+    
+    def test_only_requested_formats_are_rendered(self, formatter, tmp_path):
+        content1 = [{'type': 'paragraph', 'text': 'Hello'}]
+        content2 = [{'type': 'paragraph', 'text': 'مرحبا'}]
+        output_base = str(tmp_path / "book")
+        
+        formatter.render_pipeline(formatter.align_content(content1, content2), output_base, ["epub"])
+        
+        assert os.listdir(tmp_path) == ["book.epub"]
+        with pytest.raises(ValueError):
+            formatter.get_output_formats(["pdf"])
+    
+    def test_render_failure_in_one_format_is_logged(self, formatter, tmp_path, monkeypatch, caplog):
+        def fail(*args):
+            raise RuntimeError("broken table")
+        monkeypatch.setattr(formatter, "_add_docx_rows", fail)
+        aligned = formatter.align_content([{'type': 'paragraph', 'text': 'Hello'}],
+                                          [{'type': 'paragraph', 'text': 'مرحبا'}])
+        
+        formatter.render_pipeline(aligned, str(tmp_path / "book"), ["docx", "epub"])
+        
+        assert os.listdir(tmp_path) == ["book.epub"]
+        assert "broken table" in caplog.text
+    
+    def test_process_books_reports_progress(self, formatter, tmp_path):
+        from docx import Document
+        for name, prefix in [("en.docx", "English"), ("ar.docx", "عربي")]:
+            document = Document()
+            for i in range(5):
+                document.add_paragraph(f"{prefix} {i}")
+            document.save(str(tmp_path / name))
+        formatter.config["epub"]["rows_per_chapter"] = 2
+        events = []
+        
+        formatter.process_books(str(tmp_path / "en.docx"), str(tmp_path / "ar.docx"),
+                                str(tmp_path / "book"), ["epub"], progress_callback=events.append)
+        
+        stages = [event['stage'] for event in events]
+        assert stages[0] == 'extract' and stages[-1] == 'done'
+        assert [event['done'] for event in events if event['stage'] == 'render'] == [0, 2, 4, 5]
+        percents = [event['percent'] for event in events]
+        assert percents == sorted(percents) and percents[-1] == 100
+        assert events[-1]['eta'] == 0
+        assert {'extract', 'align', 'render_epub'} <= set(formatter.stage_timings)
+        assert 'render_docx' not in formatter.stage_timings
+    
+    def test_extraction_reports_progress_per_block(self, formatter, tmp_path):
+        for name in ("en.docx", "ar.docx"):
+            self.make_docx(tmp_path / name, *[f"Paragraph {i}" for i in range(200)])
+        events = []
+        
+        formatter.process_books(str(tmp_path / "en.docx"), str(tmp_path / "ar.docx"),
+                                str(tmp_path / "book"), ["epub"], progress_callback=events.append)
+        
+        extract = [event['percent'] for event in events if event['stage'] == 'extract']
+        assert len(extract) > 20
+        assert extract == sorted(extract) and extract[-1] == 20
+        assert any(0 < percent < 10 for percent in extract)
+    
+    def test_bounded_extraction_matches_full_extraction_prefix(self, formatter, tmp_path):
+        from docx import Document
+        document = Document()
+        document.add_heading("Chapter 1", 1)
+        document.add_paragraph("")
+        table = document.add_table(rows=1, cols=2)
+        table.cell(0, 0).text, table.cell(0, 1).text = "cell A", "cell B"
+        tabbed = document.add_paragraph("a")
+        tabbed.add_run().add_tab()
+        tabbed.add_run("b")
+        broken = document.add_paragraph("line1")
+        broken.add_run().add_break()
+        broken.add_run("line2")
+        for i in range(50):
+            document.add_paragraph(f"Paragraph {i}")
+        path = str(tmp_path / "book.docx")
+        document.save(path)
+        
+        preview = formatter.extract_content(path, max_blocks=5)
+        
+        assert preview == formatter.extract_content(path)[:5]
+        assert [block['text'] for block in preview] == ["Chapter 1", "a\tb", "line1\nline2", "Paragraph 0", "Paragraph 1"]
+        assert preview[0]['style'] == 'Heading 1'
+    
+    def make_docx(self, path, *paragraphs):
+        from docx import Document
+        document = Document()
+        for text in paragraphs:
+            document.add_paragraph(text)
+        document.save(str(path))
+    
+    def test_batch_sources_pair_files(self, tmp_path):
+        for name in ("one_en.docx", "one_ar.docx", "two_EN.pdf", "two_ar.epub", "lonely_en.docx", "notes.txt"):
+            (tmp_path / name).write_bytes(b"")
+        (tmp_path / "list.csv").write_text("lang1,lang2,output_format\none_en.docx,one_ar.docx,epub\n", encoding="utf-8")
+        
+        items, unpaired = find_book_pairs(str(tmp_path), ("en", "ar"))
+        manifest = load_batch_manifest(str(tmp_path / "list.csv"))
+        
+        assert [(item['name'], os.path.basename(item['lang2'])) for item in items] == [("one", "one_ar.docx"),
+                                                                                       ("two", "two_ar.epub")]
+        assert [os.path.basename(path) for path in unpaired] == ["lonely_en.docx"]
+        assert manifest == [{'lang1': str(tmp_path / "one_en.docx"), 'lang2': str(tmp_path / "one_ar.docx"),
+                             'output_format': 'epub', 'name': 'one_en'}]
+    
+    def test_batch_sources_reject_ambiguous_entries(self, tmp_path):
+        for name in ("novel_en.docx", "novel_en.pdf", "novel_ar.docx"):
+            (tmp_path / name).write_bytes(b"")
+        (tmp_path / "list.json").write_text(json.dumps([{"lang1": "a.docx", "lang2": "b.docx", "output_format": "pdf"}]),
+                                            encoding="utf-8")
+        
+        with pytest.raises(ValueError, match="novel_en.docx و novel_en.pdf"):
+            find_book_pairs(str(tmp_path), ("en", "ar"))
+        with pytest.raises(ValueError, match="pdf"):
+            load_batch_manifest(str(tmp_path / "list.json"))
+    
+    def test_batch_report_records_workers_used(self, tmp_path):
+        self.make_docx(tmp_path / "one_en.docx", "English")
+        self.make_docx(tmp_path / "one_ar.docx", "عربي")
+        items, _ = find_book_pairs(str(tmp_path), ("en", "ar"))
+        
+        report = run_batch(items, str(tmp_path / "out"), jobs=4, output_format="docx")
+        
+        assert report['jobs'] == 1 and report['completed'] == 1
+    
+    def test_cli_batch_mode_writes_logs_and_report(self, tmp_path):
+        books = tmp_path / "books"
+        books.mkdir()
+        for i in range(3):
+            self.make_docx(books / f"book{i}_en.docx", f"English {i}")
+            self.make_docx(books / f"book{i}_ar.docx", f"عربي {i}")
+        (books / "broken_en.docx").write_bytes(b"not a docx")
+        self.make_docx(books / "broken_ar.docx", "عربي")
+        output = tmp_path / "out"
+        repo_root = Path(__file__).resolve().parent.parent
+        
+        result = subprocess.run([sys.executable, "bilingual_book_formatter.py", "--batch", str(books),
+                                 "--output", str(output), "--format", "docx", "--jobs", "2",
+                                 "--suffixes", "en", "ar"], cwd=repo_root, capture_output=True, text=True)
+        
+        assert result.returncode == 1
+        report = json.loads((output / "batch_report.json").read_text(encoding="utf-8"))
+        statuses = {item['name']: item['status'] for item in report['items']}
+        assert statuses == {"book0": "completed", "book1": "completed", "book2": "completed", "broken": "failed"}
+        assert report['jobs'] == 2 and report['completed'] == 3
+        assert 'extract' in report['items'][1]['stages']
+        assert sorted(os.listdir(output / "logs")) == ["book0.log", "book1.log", "book2.log", "broken.log"]
+        assert "book1" in (output / "logs" / "book1.log").read_text(encoding="utf-8")
+        assert (output / "book2.docx").exists()
+    
     # Additional tests as provided previously...
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Google Drive upload tests against a local fake Drive server
+"""
+import os
+import pytest
+from bilingual_book_formatter import BilingualBookFormatter
+from fake_drive_server import FakeDriveServer
+
+CHUNK = 256 * 1024
+
+
+class TestDriveUpload:
+    @pytest.fixture
+    def server(self):
+        with FakeDriveServer() as server:
+            yield server
+
+    @pytest.fixture
+    def formatter(self, server):
+        formatter = BilingualBookFormatter()
+        formatter.config["drive"].update({
+            "api_endpoint": server.url,
+            "chunk_size_mb": 0.25,
+            "retry_backoff": 0.01,
+            "timeout": 1,
+        })
+        formatter.drive_service = formatter.build_drive_service()
+        return formatter
+
+    def make_file(self, tmp_path, name, size):
+        data = os.urandom(size)
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path), data
+
+    def test_chunked_upload_resumes_after_interruption(self, formatter, server, tmp_path):
+        path, data = self.make_file(tmp_path, "book.epub", 3 * CHUNK - 100)
+        server.failures = [None, "disconnect", 503]
+
+        file_id = formatter.upload_to_drive(path)
+
+        assert server.contents[file_id] == data
+        assert server.status_queries >= 1
+        # الاستئناف يكمل من آخر بايت استلمه الخادم ولا يعيد الملف كاملاً
+        assert server.bytes_received == len(data)
+
+    def test_identical_file_is_not_uploaded_again(self, formatter, server, tmp_path):
+        path, data = self.make_file(tmp_path, "book.docx", 1000)
+        existing_id = server.add_file("older-name.docx", data)
+
+        assert formatter.upload_to_drive(path) == existing_id
+        assert server.chunk_requests == 0
+
+    def test_uploads_run_concurrently_into_folder(self, formatter, server, tmp_path):
+        files = [self.make_file(tmp_path, f"book_{i}.epub", CHUNK + i) for i in range(4)]
+
+        uploaded = formatter.upload_files_to_drive([path for path, _ in files], folder_id="folder-1")
+
+        assert len(set(uploaded.values())) == 4
+        for path, data in files:
+            assert server.contents[uploaded[path]] == data
+            assert server.files[uploaded[path]]["parents"] == ["folder-1"]
+        assert server.list_requests == 1
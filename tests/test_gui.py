@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+GUI tests: background conversion worker, queueing, cancellation, preview and aligned table
+"""
+import os
+import time
+import threading
+import pytest
+from docx import Document
+from bilingual_book_formatter import BilingualBookFormatter, ProcessingCancelled, load_gui
+
+pytest.importorskip("PyQt6")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def make_books(directory, paragraphs=5):
+    paths = []
+    for name, prefix in [("en.docx", "English"), ("ar.docx", "عربي")]:
+        document = Document()
+        for i in range(paragraphs):
+            document.add_paragraph(f"{prefix} {i}")
+        document.save(str(directory / name))
+        paths.append(str(directory / name))
+    return paths
+
+
+class TestConversionWorker:
+    @pytest.fixture(scope="class")
+    def qapp(self):
+        from PyQt6.QtWidgets import QApplication
+        return QApplication.instance() or QApplication([])
+
+    @pytest.fixture
+    def window(self, qapp, monkeypatch, tmp_path):
+        from PyQt6.QtWidgets import QFileDialog
+        monkeypatch.setattr(QFileDialog, "getExistingDirectory", lambda *args: str(tmp_path / "out"))
+        (tmp_path / "out").mkdir()
+        window = load_gui()["BilingualBookFormatterGUI"]()
+        yield window
+        window.close()
+
+    def wait_until(self, qapp, condition, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            qapp.processEvents()
+            if condition():
+                return
+            time.sleep(0.01)
+        raise AssertionError("condition not reached")
+
+    def test_process_books_stops_when_cancelled(self, tmp_path):
+        lang1, lang2 = make_books(tmp_path)
+        cancel_event = threading.Event()
+        cancel_event.set()
+
+        with pytest.raises(ProcessingCancelled):
+            BilingualBookFormatter().process_books(lang1, lang2, str(tmp_path / "book"), ["docx"],
+                                                   cancel_event=cancel_event)
+        assert not os.path.exists(tmp_path / "book.docx")
+
+    def test_jobs_run_off_ui_thread_in_queue_order(self, qapp, window, tmp_path):
+        window.lang1_file_path, window.lang2_file_path = make_books(tmp_path)
+        from PyQt6.QtCore import Qt
+        threads = []
+        window.worker.job_progress.connect(lambda *args: threads.append(threading.get_ident()),
+                                           type=Qt.ConnectionType.DirectConnection)
+
+        window.process_files()
+        window.output_format.setCurrentIndex(1)
+        window.process_files()
+        self.wait_until(qapp, lambda: all(job["status"] == "completed" for job in window.jobs.values()))
+
+        assert threading.get_ident() not in threads
+        assert os.path.exists(tmp_path / "out" / "bilingual_output.docx")
+        assert os.path.exists(tmp_path / "out" / "bilingual_output_2.epub")
+
+    def test_queued_job_can_be_cancelled(self, qapp, window, tmp_path):
+        window.lang1_file_path, window.lang2_file_path = make_books(tmp_path)
+        # إبقاء الطلب الأول قيد التنفيذ حتى يُلغى الثاني وهو في الانتظار
+        gate = threading.Event()
+        process_books = window.worker.formatter.process_books
+        window.worker.formatter.process_books = lambda *args, **kwargs: gate.wait(10) and process_books(*args, **kwargs)
+
+        window.process_files()
+        window.process_files()
+        window.queue_list.setCurrentRow(1)
+        window.cancel_job()
+        gate.set()
+
+        self.wait_until(qapp, lambda: window.jobs[2]["status"] == "cancelled"
+                        and window.jobs[1]["status"] == "completed")
+        assert not os.path.exists(tmp_path / "out" / "bilingual_output_2.docx")
+
+    def test_close_waits_for_cancelled_jobs(self, qapp, window, tmp_path):
+        window.lang1_file_path, window.lang2_file_path = make_books(tmp_path)
+        gate = threading.Event()
+        process_books = window.worker.formatter.process_books
+        window.worker.formatter.process_books = lambda *args, **kwargs: gate.wait(10) and process_books(*args, **kwargs)
+
+        window.process_files()
+        window.process_files()
+        self.wait_until(qapp, lambda: window.jobs[1]["status"] == "running")
+
+        # الإغلاق لا يحجب الواجهة في انتظار الطلب الجاري
+        assert not window.close()
+        assert window.worker_thread.isRunning()
+        gate.set()
+
+        self.wait_until(qapp, lambda: window.worker_thread.isFinished())
+        assert [job["status"] for job in window.jobs.values()] == ["cancelled", "cancelled"]
+        assert window.worker.formatter is not window.preview_worker.formatter
+
+    def test_preview_loads_off_ui_thread(self, qapp, window, tmp_path):
+        window.lang1_file_path, window.lang2_file_path = make_books(tmp_path, paragraphs=200)
+
+        window.preview_content()
+        assert window.preview_text.toPlainText() == "جارٍ تحميل المعاينة..."
+        self.wait_until(qapp, lambda: "الفقرة" in window.preview_text.toPlainText())
+
+        text = window.preview_text.toPlainText()
+        assert "English 4" in text and "عربي 4" in text
+        assert "English 5" not in text
+
+    def test_aligned_model_streams_large_book_by_chapter(self, qapp):
+        from PyQt6.QtCore import Qt
+        model = load_gui()["AlignedTableModel"]()
+        inserted = []
+        model.rowsInserted.connect(lambda parent, first, last: inserted.append((first, last)))
+        rows = [({'type': 'paragraph', 'text': f"Line {i}\nwrapped"}, {'type': 'paragraph', 'text': f"سطر {i}"})
+                for i in range(50000)]
+
+        started = time.perf_counter()
+        for start in range(0, len(rows), 200):
+            model.append_chapter(f"Chapter {start // 200 + 1}", rows[start:start + 200])
+        elapsed = time.perf_counter() - started
+
+        assert model.rowCount() == 50000 and len(inserted) == 250
+        assert model.chapters[-1] == ("Chapter 250", 49800)
+        assert model.data(model.index(49999, 0)) == "Line 49999 wrapped"
+        alignment = model.data(model.index(49999, 1), Qt.ItemDataRole.TextAlignmentRole)
+        assert alignment & Qt.AlignmentFlag.AlignRight
+        assert elapsed < 2.0
+
+    def test_aligned_preview_streams_chapters_while_aligning(self, qapp, tmp_path):
+        worker = load_gui()["PreviewWorker"]()
+        worker.formatter.config["epub"]["rows_per_chapter"] = 10
+        lang1, lang2 = make_books(tmp_path, paragraphs=45)
+        aligned_rows = []
+        iter_aligned = worker.formatter.iter_aligned
+
+        def counting_iter_aligned(*args):
+            for row in iter_aligned(*args):
+                aligned_rows.append(row)
+                yield row
+        worker.formatter.iter_aligned = counting_iter_aligned
+        seen = []
+        worker.chapter_ready.connect(lambda request_id, title, rows: seen.append(len(aligned_rows)))
+
+        worker.supersede(1)
+        worker.load_aligned({'id': 1, 'lang1': lang1, 'lang2': lang2})
+
+        # كل فصل يُرسل عند أول صف بعده، قبل انتهاء المحاذاة
+        assert seen == [11, 21, 31, 41, 45]
+
+    def test_superseded_aligned_preview_stops_during_extraction(self, qapp, tmp_path):
+        worker = load_gui()["PreviewWorker"]()
+        lang1, lang2 = make_books(tmp_path, paragraphs=50)
+        extracted, emitted = [], []
+        extract_content = worker.formatter.extract_content
+
+        def extract_then_supersede(path, *args):
+            content = extract_content(path, *args)
+            extracted.append(path)
+            # طلب أحدث يصل أثناء استخراج الكتاب الأول
+            worker.supersede(2)
+            return content
+        worker.formatter.extract_content = extract_then_supersede
+        worker.chapter_ready.connect(lambda *args: emitted.append(args))
+        worker.preview_failed.connect(lambda *args: emitted.append(args))
+
+        worker.supersede(1)
+        worker.load_aligned({'id': 1, 'lang1': lang1, 'lang2': lang2})
+
+        assert extracted == [lang1]
+        assert emitted == []
+
+    def test_full_aligned_preview_jumps_to_chapter(self, qapp, window, tmp_path):
+        window.preview_worker.formatter.config["epub"]["rows_per_chapter"] = 10
+        window.lang1_file_path, window.lang2_file_path = make_books(tmp_path, paragraphs=45)
+
+        window.preview_aligned_book()
+        self.wait_until(qapp, lambda: window.chapter_combo.count() == 5
+                        and "فصل" in window.aligned_status.text())
+        window.jump_to_chapter(3)
+
+        assert window.aligned_model.rowCount() == 45
+        assert window.aligned_view.currentIndex().row() == 30
+        assert window.aligned_model.data(window.aligned_model.index(30, 1)) == "عربي 30"
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmarks: CLI cold start, formatter construction and API readiness
+"""
+import os
+import subprocess
+import sys
+import time
+import pytest
+from fastapi.testclient import TestClient
+import bilingual_book_formatter
+from bilingual_book_formatter import BilingualBookFormatter
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ميزانيات زمنية متساهلة بما يكفي لأجهزة CI البطيئة
+CLI_COLD_START_BUDGET = 3.0
+FORMATTER_INIT_BUDGET = 0.25
+MODULE_IMPORT_BUDGET = 0.3
+
+# مكتبات لا يجوز تحميلها عند مجرد استيراد الوحدة (سطر الأوامر والعمليات العاملة)
+HEAVY_MODULES = ("PyQt6", "googleapiclient", "google", "deepl", "ebooklib",
+                 "pdfplumber", "pypdfium2", "PIL", "docx", "bs4")
+API_READY_BUDGET = 2.0
+
+
+def run_timed(*args) -> float:
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], cwd=REPO_ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    assert result.returncode == 0, result.stderr
+    return elapsed
+
+
+class TestStartupTime:
+    def test_cli_cold_start(self):
+        assert run_timed("bilingual_book_formatter.py", "--help") < CLI_COLD_START_BUDGET
+
+    def test_module_import_defers_heavy_backends(self):
+        code = (
+            "import sys, time\n"
+            "started = time.perf_counter()\n"
+            "import bilingual_book_formatter\n"
+            "print(time.perf_counter() - started)\n"
+            "print(','.join(sorted({name.split('.')[0] for name in sys.modules})))\n"
+        )
+        result = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        elapsed, modules = result.stdout.split()
+
+        assert not set(HEAVY_MODULES) & set(modules.split(","))
+        assert float(elapsed) < MODULE_IMPORT_BUDGET
+
+    def test_gui_unavailable_when_qt_fails_to_load(self, monkeypatch):
+        # PyQt6 مثبتة لكن استيرادها يفشل (مثلاً عند غياب libGL)
+        monkeypatch.setattr(bilingual_book_formatter, "GUI_AVAILABLE", True)
+        monkeypatch.setattr(bilingual_book_formatter, "_gui_classes", None)
+        monkeypatch.setitem(sys.modules, "gui", None)
+
+        assert bilingual_book_formatter.load_gui() is None
+        assert not bilingual_book_formatter.GUI_AVAILABLE
+        with pytest.raises(AttributeError):
+            bilingual_book_formatter.BilingualBookFormatterGUI
+
+    def test_formatter_does_not_initialize_services(self, monkeypatch):
+        def fail(self):
+            raise AssertionError("external services must be initialized on first use")
+        monkeypatch.setattr(BilingualBookFormatter, "init_google_drive", fail)
+        monkeypatch.setattr(BilingualBookFormatter, "init_deepl", fail)
+
+        started = time.perf_counter()
+        formatter = BilingualBookFormatter()
+        elapsed = time.perf_counter() - started
+
+        assert formatter.drive_service is None
+        assert formatter.deepl_translator is None
+        assert elapsed < FORMATTER_INIT_BUDGET
+
+    def test_services_respect_config_and_remember_failures(self, monkeypatch):
+        calls = []
+        def fail_drive(self):
+            calls.append("drive")
+            self.drive_init_error = "no credentials"
+        monkeypatch.setattr(BilingualBookFormatter, "init_google_drive", fail_drive)
+        monkeypatch.setattr(BilingualBookFormatter, "init_deepl", lambda self: calls.append("deepl"))
+        formatter = BilingualBookFormatter()
+        formatter.config["translation"].update({"enable_deepl": False, "deepl_api_key": "key"})
+
+        assert formatter.get_deepl_translator() is None
+        assert formatter.get_drive_service() is None
+        assert formatter.get_drive_service() is None
+        assert calls == ["drive"]
+
+    def test_api_import_builds_no_formatter(self):
+        code = "import app, sys; sys.exit(0 if app.formatter is None else 1)"
+        assert run_timed("-c", code) < CLI_COLD_START_BUDGET
+
+    def test_api_ready_quickly(self):
+        import app as api
+        started = time.perf_counter()
+        with TestClient(api.app) as client:
+            assert client.get("/health/").status_code == 200
+            elapsed = time.perf_counter() - started
+        assert elapsed < API_READY_BUDGET
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Translation stage tests against a local fake DeepL server
+"""
+import zipfile
+import pytest
+import deepl
+from docx import Document
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bilingual_book_formatter import (BatchTranslator, BilingualBookFormatter, CharacterRateLimiter,
+                                      TranslationMemory)
+from fake_deepl_server import FakeDeepLServer
+
+
+class TestBatchTranslation:
+    @pytest.fixture
+    def server(self):
+        with FakeDeepLServer(latency=0.02) as server:
+            yield server
+
+    @pytest.fixture
+    def formatter(self, server, tmp_path):
+        formatter = BilingualBookFormatter()
+        formatter.config["translation"].update({
+            "enable_deepl": True,
+            "deepl_api_key": "fake-key",
+            "deepl_server_url": server.url,
+            "max_concurrency": 4,
+            "batch_max_texts": 10,
+            "retry_backoff": 0.01,
+            "memory_path": str(tmp_path / "memory.sqlite3")
+        })
+        formatter.init_deepl()
+        return formatter
+
+    def test_batches_preserve_order(self, formatter, server):
+        texts = [f"Paragraph {i}" for i in range(95)]
+
+        translated = formatter.translate_texts(texts, "DE")
+
+        assert translated == [f"[DE] Paragraph {i}" for i in range(95)]
+        assert server.request_count == 10
+        assert server.max_active_requests > 1
+
+    def test_empty_texts_are_not_sent(self, formatter, server):
+        translated = formatter.translate_texts(["", "Hello", "   "], "DE")
+
+        assert translated == ["", "[DE] Hello", "   "]
+        assert server.text_count == 1
+
+    def test_transient_errors_are_retried(self, formatter, server):
+        server.failures = [503, 429]
+
+        translated = formatter.translate_texts(["Hello"], "DE")
+
+        assert translated == ["[DE] Hello"]
+        assert server.request_count == 3
+        assert formatter.get_translation_usage()["total"] == {"requests": 1, "characters": 5, "throttled": 1}
+
+    def test_rate_limiter_avoids_server_throttling(self, formatter, server):
+        server.chars_per_second = server.burst_chars = 4000
+        server._tokens = 4000
+        formatter.config["translation"].update({"chars_per_second": 3000, "burst_chars": 1000})
+        texts = [f"{i:03d} " + "x" * 96 for i in range(60)]
+
+        started = time.monotonic()
+        translated = formatter.translate_texts(texts, "DE")
+        elapsed = time.monotonic() - started
+
+        assert len(translated) == 60
+        assert server.rejected == {}
+        assert elapsed >= (6000 - 1000) / 3000 * 0.9
+        assert formatter.get_translation_usage()["job"]["characters"] == 6000
+
+    def test_quota_exceeded_fails_without_retry(self, formatter, server):
+        server.character_limit = 3
+        formatter.config["translation"]["max_retries"] = 3
+
+        with pytest.raises(deepl.QuotaExceededException):
+            formatter.translate_texts(["Hello"], "DE")
+        assert server.rejected == {456: 1}
+        assert formatter.get_translation_usage()["total"]["throttled"] == 1
+
+    def test_library_retries_disabled_per_translator(self, formatter):
+        translator = formatter.get_deepl_translator()
+
+        assert translator._client._should_retry(None, None, 0) is False
+        assert deepl.http_client.max_network_retries > 0
+
+    def test_batches_respect_request_size(self):
+        batch_translator = BatchTranslator(None, max_texts=50, max_bytes=1000)
+        texts = ["نص عربي طويل " * 10] * 6
+
+        batches = batch_translator.make_batches(texts)
+
+        assert [index for batch in batches for index in batch] == list(range(6))
+        for batch in batches:
+            assert sum(batch_translator.encoded_size(texts[i]) for i in batch) <= 1000
+
+    def test_memory_avoids_repeat_requests(self, formatter, server):
+        texts = ["Chapter One", "Copyright notice", "Chapter One"]
+
+        first = formatter.translate_texts(texts, "DE")
+        requests_after_first = server.request_count
+        second = formatter.translate_texts(["Copyright  notice", "Chapter One"], "DE")
+
+        assert first == ["[DE] Chapter One", "[DE] Copyright notice", "[DE] Chapter One"]
+        assert server.text_count == 2
+        assert second == ["[DE] Copyright notice", "[DE] Chapter One"]
+        assert server.request_count == requests_after_first
+        assert formatter.translation_memory.stats()["exact_hits"] == 2
+
+    def test_only_alignment_gaps_are_translated(self, formatter, server):
+        content1 = [{'type': 'paragraph', 'text': f'English {i}'} for i in range(4)]
+        content2 = [{'type': 'paragraph', 'text': 'عربي 0'}, {'type': 'paragraph', 'text': 'عربي 1'}]
+        aligned = formatter.align_content(content1, content2)
+
+        filled = formatter.fill_alignment_gaps(aligned)
+
+        assert filled[:2] == aligned[:2]
+        assert filled[2][1] == {'type': 'paragraph', 'text': '[AR] English 2', 'machine_translated': True}
+        assert filled[3][1]['text'] == '[AR] English 3'
+        assert server.text_count == 2
+        assert server.request_count == 1
+
+    def test_pipeline_fills_gaps_while_rendering(self, formatter, server, tmp_path):
+        for name, count, prefix in [("en.docx", 7, "English"), ("ar.docx", 3, "عربي")]:
+            document = Document()
+            for i in range(count):
+                document.add_paragraph(f"{prefix} {i}")
+            document.save(str(tmp_path / name))
+        formatter.config["translation"]["fill_gaps"] = True
+        formatter.config["epub"]["rows_per_chapter"] = 2
+        output_base = str(tmp_path / "book")
+
+        formatter.process_books(str(tmp_path / "en.docx"), str(tmp_path / "ar.docx"), output_base)
+
+        table = Document(f"{output_base}.docx").tables[0]
+        assert [row.cells[1].text for row in table.rows][3:] == [f"[AR] English {i}" for i in range(3, 7)]
+        assert table.rows[6].cells[1].paragraphs[0].runs[0].italic
+        with zipfile.ZipFile(f"{output_base}.epub") as archive:
+            last_chapter = archive.read("EPUB/chap_04.xhtml").decode("utf-8")
+        assert "[AR] English 6" in last_chapter
+        # فجوات الأقسام المتتالية تُجمع في طلب واحد بدل طلب لكل قسم
+        assert server.request_count == 1
+
+    def test_gap_windows_span_sections(self, formatter, server):
+        rows = [({'type': 'paragraph', 'text': f'English {i}'}, None) for i in range(100)]
+        sections = [{'title': f'Chapter {i}', 'rows': rows[i * 10:(i + 1) * 10]} for i in range(10)]
+
+        windows = formatter._translation_windows(sections)
+        for window in windows:
+            formatter._fill_window_gaps(window)
+
+        # batch_max_texts (10) × max_concurrency (4) = 40 فجوة لكل نافذة
+        assert [len(window) for window in windows] == [4, 4, 2]
+        assert sections[9]['rows'][9][1]['text'] == '[AR] English 99'
+        assert server.request_count == 10
+
+
+    def test_concurrent_windows_share_translation_services(self, formatter, monkeypatch):
+        import bilingual_book_formatter
+        formatter.translation_memory = formatter.rate_limiter = None
+
+        class SlowLimiter(CharacterRateLimiter):
+            def __init__(self, *args):
+                time.sleep(0.05)
+                super().__init__(*args)
+        monkeypatch.setattr(bilingual_book_formatter, "CharacterRateLimiter", SlowLimiter)
+
+        def services(_):
+            return formatter.get_rate_limiter(), formatter.get_translation_memory()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(services, range(8)))
+
+        assert len({id(limiter) for limiter, _ in results}) == 1
+        assert len({id(memory) for _, memory in results}) == 1
+
+
+class TestCharacterRateLimiter:
+    def test_throttling_halves_rate_and_recovers(self):
+        limiter = CharacterRateLimiter(1000, burst=1000)
+
+        limiter.on_throttled(0.0)
+        assert limiter.rate == 500
+        for _ in range(100):
+            limiter.on_success()
+        assert limiter.rate == 1000
+
+    def test_disabled_limiter_never_waits(self):
+        limiter = CharacterRateLimiter(0)
+        assert limiter.acquire(10 ** 9) == 0.0
+
+
+class TestTranslationMemory:
+    def test_memory_persists_between_instances(self, tmp_path):
+        path = str(tmp_path / "memory.sqlite3")
+        memory = TranslationMemory(path)
+        memory.store([("Hello world", "Hallo Welt")], "DE", "EN")
+        memory.close()
+
+        memory = TranslationMemory(path)
+        assert memory.lookup("Hello   world", "de", "en") == "Hallo Welt"
+        assert memory.lookup("Hello world", "FR", "EN") is None
+        assert memory.stats()["hit_rate"] == 0.5
+
+    def test_fuzzy_lookup(self, tmp_path):
+        memory = TranslationMemory(str(tmp_path / "memory.sqlite3"), fuzzy=True, fuzzy_threshold=0.9)
+        memory.store([("All rights reserved by the publisher.", "Alle Rechte vorbehalten.")], "DE")
+
+        assert memory.lookup("All rights reserved by the publisher!", "DE") == "Alle Rechte vorbehalten."
+        assert memory.lookup("All rights are something else entirely", "DE") is None
+        assert memory.stats()["fuzzy_hits"] == 1